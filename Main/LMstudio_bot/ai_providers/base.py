@@ -1,11 +1,62 @@
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import asyncio
 import logging
+import aiohttp
 
 logger = logging.getLogger(__name__)
 
 class AIProvider(ABC):
-    """Base class for all AI providers."""
-    
+    """
+    Base class for all AI providers.
+
+    HTTP requests go through one keep-alive session per provider, created on first
+    use, so prompt enhancements reuse connections instead of opening (and TLS
+    handshaking) a new one each time. If `max_concurrent` is set, at most that many
+    requests per provider are in flight and the rest wait their turn.
+    """
+
+    # Pool limits for every provider, set by AIProviderFactory.configure
+    pool_size = 10
+    # 0 leaves requests unthrottled
+    max_concurrent = 0
+    connect_timeout = 10.0
+    read_timeout = 120.0
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.limiter: Optional[asyncio.Semaphore] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """The provider's keep-alive session, opened again if it was closed"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout,
+                                              sock_read=self.read_timeout)
+            )
+        return self.session
+
+    @asynccontextmanager
+    async def post(self, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        """POST through the provider's session, once one of its request slots is free if they are limited"""
+        if self.max_concurrent <= 0:
+            async with self.get_session().post(url, **kwargs) as response:
+                yield response
+            return
+        if self.limiter is None:
+            self.limiter = asyncio.Semaphore(self.max_concurrent)
+        async with self.limiter:
+            async with self.get_session().post(url, **kwargs) as response:
+                yield response
+
+    async def close(self):
+        """Close the provider's connections"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
     @abstractmethod
     async def test_connection(self) -> bool:
         """Test the connection to the provider."""
@@ -1,13 +1,15 @@
 import logging
-from typing import Type
+from typing import Dict, Optional, Type
 from .base import AIProvider
 from .gemini.provider import GeminiProvider
 from .lmstudio.provider import LMStudioProvider
 from .openai.provider import OpenAIProvider
 from .xai.provider import XAIProvider
 
+logger = logging.getLogger(__name__)
+
 class AIProviderFactory:
-    """Factory class for creating AI provider instances."""
+    """Factory class for AI provider instances, one shared instance per provider."""
     
     _providers = {
         "gemini": GeminiProvider,
@@ -15,11 +17,25 @@ class AIProviderFactory:
         "openai": OpenAIProvider,
         "xai": XAIProvider
     }
+    _instances: Dict[str, AIProvider] = {}
+
+    @classmethod
+    def configure(cls, pool_size: Optional[int] = None, max_concurrent: Optional[int] = None,
+                  connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None):
+        """Set the connection limits of providers' sessions; applies to sessions opened afterwards"""
+        if pool_size is not None:
+            AIProvider.pool_size = pool_size
+        if max_concurrent is not None:
+            AIProvider.max_concurrent = max_concurrent
+        if connect_timeout is not None:
+            AIProvider.connect_timeout = connect_timeout
+        if read_timeout is not None:
+            AIProvider.read_timeout = read_timeout
 
     @classmethod
     def get_provider(cls, provider_name: str) -> AIProvider:
         """
-        Get an instance of the specified AI provider.
+        Get the shared instance of the specified AI provider, created on first use.
         
         Args:
             provider_name: Name of the provider to instantiate
@@ -36,8 +52,17 @@ class AIProviderFactory:
         if not provider_class:
             raise ValueError(f"Unknown provider: {provider_name}")
         
-        try:
+        provider_instance = cls._instances.get(provider_name)
+        if provider_instance is None:
             provider_instance = provider_class()
-            return provider_instance
-        except Exception as e:
-            raise
+            cls._instances[provider_name] = provider_instance
+        return provider_instance
+
+    @classmethod
+    async def close_all(cls):
+        """Close the connections of every provider handed out"""
+        for provider_name, provider_instance in list(cls._instances.items()):
+            try:
+                await provider_instance.close()
+            except Exception as e:
+                logger.error(f"Error closing {provider_name} provider: {e}")
@@ -10,6 +10,7 @@ class GeminiProvider(AIProvider):
     
     def __init__(self):
         """Initialize Gemini provider with API key."""
+        super().__init__()
         self.api_key = os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY must be set")
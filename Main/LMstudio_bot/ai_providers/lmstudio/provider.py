@@ -1,5 +1,4 @@
 import os
-import aiohttp
 import logging
 from ..base import AIProvider
 
@@ -9,6 +8,7 @@ class LMStudioProvider(AIProvider):
     """LMStudio AI provider implementation."""
     
     def __init__(self):
+        super().__init__()
         self.host = os.getenv('LMSTUDIO_HOST', 'localhost')
         self.port = os.getenv('LMSTUDIO_PORT', '1234')
         if not self.host or not self.port:
@@ -30,9 +30,8 @@ class LMStudioProvider(AIProvider):
                 "temperature": 0.7
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload, timeout=10) as response:
-                    return response.status == 200
+            async with self.post(url, headers=headers, json=payload, timeout=10) as response:
+                return response.status == 200
         except Exception as e:
             logger.error(f"LMStudio connection test failed: {e}")
             return False
@@ -52,22 +51,21 @@ class LMStudioProvider(AIProvider):
                 "temperature": temperature
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        enhanced_prompt = data['choices'][0]['message']['content'].strip()
+            async with self.post(url, headers=headers, json=payload) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    enhanced_prompt = data['choices'][0]['message']['content'].strip()
                         
-                        # Get and enforce word limit based on temperature
-                        word_limit = self._get_word_limit(temperature)
-                        enhanced_prompt = self._enforce_word_limit(enhanced_prompt, word_limit)
+                    # Get and enforce word limit based on temperature
+                    word_limit = self._get_word_limit(temperature)
+                    enhanced_prompt = self._enforce_word_limit(enhanced_prompt, word_limit)
                         
-                        logger.info(f"Enhanced prompt with creativity level {round(temperature * 10)}")
-                        return enhanced_prompt
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Error from LMStudio API: {error_text}")
-                        return prompt  # Return original prompt on error
+                    logger.info(f"Enhanced prompt with creativity level {round(temperature * 10)}")
+                    return enhanced_prompt
+                else:
+                    error_text = await response.text()
+                    logger.error(f"Error from LMStudio API: {error_text}")
+                    return prompt  # Return original prompt on error
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             return prompt  # Return original prompt on error
@@ -1,6 +1,5 @@
 import os
 import logging
-import aiohttp
 from typing import Optional
 from ..base import AIProvider
 
@@ -11,6 +10,7 @@ class OpenAIProvider(AIProvider):
     
     def __init__(self):
         """Initialize OpenAI provider with API key."""
+        super().__init__()
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
@@ -37,15 +37,14 @@ class OpenAIProvider(AIProvider):
                 "max_tokens": 50
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload, timeout=10) as response:
-                    if response.status == 200:
-                        logger.info("OpenAI connection test successful")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"OpenAI connection test failed with status {response.status}: {error_text}")
-                        return False
+            async with self.post(url, headers=headers, json=payload, timeout=10) as response:
+                if response.status == 200:
+                    logger.info("OpenAI connection test successful")
+                    return True
+                else:
+                    error_text = await response.text()
+                    logger.error(f"OpenAI connection test failed with status {response.status}: {error_text}")
+                    return False
         except Exception as e:
             logger.error(f"OpenAI connection test failed: {e}", exc_info=True)
             return False
@@ -74,21 +73,20 @@ class OpenAIProvider(AIProvider):
                 "stop": ["\n"]
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload, timeout=30) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"OpenAI API error: HTTP {response.status} - {error_text}")
+            async with self.post(url, headers=headers, json=payload, timeout=30) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"OpenAI API error: HTTP {response.status} - {error_text}")
                     
-                    data = await response.json()
+                data = await response.json()
                     
-                    if not data.get("choices") or not data["choices"][0].get("message"):
-                        raise Exception("Invalid response format from OpenAI API")
+                if not data.get("choices") or not data["choices"][0].get("message"):
+                    raise Exception("Invalid response format from OpenAI API")
                     
-                    enhanced_prompt = data["choices"][0]["message"]["content"].strip()
-                    word_limit = self._get_word_limit(temperature)
-                    enhanced_prompt = self._enforce_word_limit(enhanced_prompt, word_limit)
-                    logger.info(f"Enhanced prompt with temperature {temperature}: {enhanced_prompt}")
+                enhanced_prompt = data["choices"][0]["message"]["content"].strip()
+                word_limit = self._get_word_limit(temperature)
+                enhanced_prompt = self._enforce_word_limit(enhanced_prompt, word_limit)
+                logger.info(f"Enhanced prompt with temperature {temperature}: {enhanced_prompt}")
                     
             return enhanced_prompt
 
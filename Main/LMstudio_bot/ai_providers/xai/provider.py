@@ -1,5 +1,4 @@
 import os
-import aiohttp
 import logging
 from typing import Optional
 from ..base import AIProvider
@@ -11,6 +10,7 @@ class XAIProvider(AIProvider):
     
     def __init__(self):
         """Initialize XAI provider with API key."""
+        super().__init__()
         self.api_key = os.getenv("XAI_API_KEY")
         if not self.api_key:
             raise ValueError("XAI_API_KEY environment variable is not set")
@@ -37,9 +37,8 @@ class XAIProvider(AIProvider):
                 "max_tokens": 10
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.base_url}/chat/completions", headers=headers, json=payload) as response:
-                    return response.status == 200
+            async with self.post(f"{self.base_url}/chat/completions", headers=headers, json=payload) as response:
+                return response.status == 200
         except Exception as e:
             logger.error(f"XAI connection test failed: {e}")
             return False
@@ -73,25 +72,24 @@ class XAIProvider(AIProvider):
                 "stop": ["\n"]
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.base_url}/chat/completions", headers=headers, json=payload, timeout=30) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"XAI API error: HTTP {response.status} - {error_text}")
-                        raise Exception(f"XAI API error: HTTP {response.status} - {error_text}")
+            async with self.post(f"{self.base_url}/chat/completions", headers=headers, json=payload, timeout=30) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"XAI API error: HTTP {response.status} - {error_text}")
+                    raise Exception(f"XAI API error: HTTP {response.status} - {error_text}")
                     
-                    data = await response.json()
-                    if not data.get("choices") or not data["choices"][0].get("message"):
-                        raise Exception("Invalid response format from XAI API")
+                data = await response.json()
+                if not data.get("choices") or not data["choices"][0].get("message"):
+                    raise Exception("Invalid response format from XAI API")
                         
-                    enhanced_prompt = data["choices"][0]["message"]["content"].strip()
+                enhanced_prompt = data["choices"][0]["message"]["content"].strip()
                     
-                    # Enforce word limit
-                    enhanced_prompt = self._enforce_word_limit(enhanced_prompt, word_limit)
+                # Enforce word limit
+                enhanced_prompt = self._enforce_word_limit(enhanced_prompt, word_limit)
                     
-                    #logger.info(f"Enhanced prompt with temperature {temperature} (limit {word_limit} words): {enhanced_prompt}")
+                #logger.info(f"Enhanced prompt with temperature {temperature} (limit {word_limit} words): {enhanced_prompt}")
                     
-                    return enhanced_prompt
+                return enhanced_prompt
 
         except Exception as e:
             logger.error(f"XAI API error: {e}", exc_info=True)
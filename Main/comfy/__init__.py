@@ -0,0 +1,18 @@
+from .admission import AdmissionController
+from .backends import Backend, BackendPool, parse_backends
+from .batching import PromptBatcher, merge_workflows, split_outputs
+from .client import ComfyClient, ComfyExecutionError
+from .worker_pool import ComfyWorkerPool
+
+__all__ = [
+    'AdmissionController',
+    'Backend',
+    'BackendPool',
+    'ComfyClient',
+    'ComfyExecutionError',
+    'ComfyWorkerPool',
+    'PromptBatcher',
+    'merge_workflows',
+    'parse_backends',
+    'split_outputs'
+]
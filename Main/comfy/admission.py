@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+from Main.http_pool import ConnectionStats, create_client_session
+
+logger = logging.getLogger(__name__)
+
+# How quickly the latency baseline follows slower completions that are still within
+# tolerance (it follows faster ones immediately). Slower ones are taken to be queueing
+# and only move it while a single generation is admitted at a time, when they show
+# the backend's real speed after a change of models or hardware.
+BASELINE_DRIFT = 0.05
+SINGLE_FLIGHT_DRIFT = 0.5
+
+class AdmissionController:
+    """
+    Limits the generations in flight on one ComfyUI backend.
+
+    A request is admitted while both the bot's own in-flight count and the backend's
+    /queue depth (running plus pending prompts, including other clients' work) are
+    below the current limit; everything else stays in the bot's queue where it is
+    scheduled fairly. With `adaptive` set the limit adapts AIMD style: completions
+    within `latency_tolerance` times the best observed latency raise it by 1/limit,
+    slower completions and failures cut it by `decrease_factor`, at most once per
+    baseline latency. Otherwise it stays at max_limit.
+    """
+
+    def __init__(self, host: str, max_limit: int, port: int = 8188, min_limit: int = 1,
+                 initial_limit: Optional[float] = None, latency_tolerance: float = 2.0,
+                 decrease_factor: float = 0.7, probe_interval: float = 1.0, adaptive: bool = True):
+        self.host = host
+        self.port = port
+        self.base_url = f"http://{host}:{port}"
+        self.max_limit = max(min_limit, max_limit)
+        self.min_limit = max(1, min_limit)
+        self.limit = float(min(self.max_limit, initial_limit or self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.probe_interval = probe_interval
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.queue_depth: Optional[int] = None
+        self.baseline: Optional[float] = None
+        self.stats = ConnectionStats()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._probed_at = 0.0
+        self._last_decrease = 0.0
+        self._released = asyncio.Event()
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def admissible(self) -> bool:
+        depth = self.queue_depth or 0
+        return max(self.in_flight, depth) < int(self.limit)
+
+    async def try_acquire(self) -> bool:
+        """Count a generation as in flight if the backend can take it now"""
+        if self.in_flight >= int(self.limit):
+            return False
+        await self.probe_queue()
+        if not self.admissible():
+            return False
+        self.in_flight += 1
+        return True
+
+    async def acquire(self):
+        """Wait until the backend can take another generation and count it as in flight"""
+        while not await self.try_acquire():
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), timeout=self.probe_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, latency: Optional[float] = None, success: bool = True):
+        """Record a finished generation; latency is its duration per unit of request cost"""
+        self.in_flight = max(0, self.in_flight - 1)
+        if success and latency is not None:
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            elif latency <= self.baseline * self.latency_tolerance:
+                self.baseline += (latency - self.baseline) * BASELINE_DRIFT
+            elif int(self.limit) <= self.min_limit:
+                self.baseline += (latency - self.baseline) * SINGLE_FLIGHT_DRIFT
+        if self.adaptive:
+            now = asyncio.get_running_loop().time()
+            if not success:
+                self._decrease(now, "failed generation")
+            elif latency is not None:
+                if latency <= self.baseline * self.latency_tolerance:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                else:
+                    self._decrease(now, f"latency {latency:.1f}s against baseline {self.baseline:.1f}s")
+        # The backend's queue has changed; probe again before the next admission
+        self._probed_at = 0.0
+        self._released.set()
+
+    def _decrease(self, now: float, reason: str):
+        cooldown = self.baseline or self.probe_interval
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        limit = max(self.min_limit, self.limit * self.decrease_factor)
+        if int(limit) != int(self.limit):
+            logger.debug(f"Lowering in-flight limit for {self.address} to {int(limit)} ({reason})")
+        self.limit = limit
+
+    async def fetch_json(self, path: str):
+        """GET a ComfyUI endpoint on this controller's small probe session"""
+        if self.session is None:
+            self.session = create_client_session(self.stats, pool_size=2, connect_timeout=2, read_timeout=5)
+        async with self.session.get(f"{self.base_url}{path}") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def probe_queue(self, force: bool = False) -> bool:
+        """Refresh the backend's queue depth unless it was read within probe_interval"""
+        now = asyncio.get_running_loop().time()
+        if not force and now - self._probed_at < self.probe_interval:
+            return self.queue_depth is not None
+        self._probed_at = now
+        try:
+            queue = await self.fetch_json('/queue')
+            self.queue_depth = len(queue.get('queue_running', [])) + len(queue.get('queue_pending', []))
+            return True
+        except Exception as e:
+            # Without the backend's view fall back to the bot's own in-flight count
+            if self.queue_depth is not None:
+                logger.warning(f"Could not read the ComfyUI queue at {self.address}: {e}")
+            self.queue_depth = None
+            return False
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
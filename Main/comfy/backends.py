@@ -0,0 +1,229 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .admission import AdmissionController
+
+logger = logging.getLogger(__name__)
+
+# Cost assumed for a backend that has not completed a generation yet
+DEFAULT_LATENCY = 1.0
+# A request's models: the model files its workflow loads and its LoRAs
+ModelKey = Tuple[str, Tuple[str, ...]]
+
+def parse_backends(value: str, default_port: int = 8188) -> List[Tuple[str, int]]:
+    """Parse 'host[:port],host[:port]' into (host, port) pairs"""
+    backends = []
+    for entry in value.split(','):
+        entry = entry.strip().strip('"')
+        if not entry:
+            continue
+        host, _, port = entry.rpartition(':') if ':' in entry else (entry, '', '')
+        backends.append((host, int(port) if port else default_port))
+    return backends
+
+class Backend:
+    """
+    One ComfyUI server: its admission controller, its last health report, the
+    models it has loaded and a circuit breaker.
+
+    ComfyUI keeps models in memory between prompts, so the model sets (and the LoRAs
+    last applied to each) of the last `warm_slots` different workflows run here are
+    taken to be loaded.
+
+    The breaker opens after `failure_threshold` consecutive failed probes or
+    generations. An open backend gets no work; it is probed again once `retry_after`
+    seconds have passed and closes on the first successful probe.
+    """
+
+    def __init__(self, admission: AdmissionController, failure_threshold: int = 3, retry_after: float = 30.0,
+                 warm_slots: int = 2):
+        self.admission = admission
+        self.failure_threshold = max(1, failure_threshold)
+        self.retry_after = retry_after
+        self.failures = 0
+        self.open_until: Optional[float] = None
+        self.system_stats: Dict[str, Any] = {}
+        self.warm_slots = max(1, warm_slots)
+        # model files -> LoRAs they last ran with, least recently used first
+        self.loaded: 'OrderedDict[str, Tuple[str, ...]]' = OrderedDict()
+
+    @property
+    def address(self) -> str:
+        return self.admission.address
+
+    @property
+    def available(self) -> bool:
+        return self.open_until is None
+
+    def outstanding(self) -> int:
+        return max(self.admission.in_flight, self.admission.queue_depth or 0)
+
+    def score(self) -> float:
+        """Expected wait for one more generation: outstanding work times typical latency"""
+        return (self.outstanding() + 1) * (self.admission.baseline or DEFAULT_LATENCY)
+
+    def warmth(self, models: Optional[ModelKey]) -> int:
+        """2 if the request's models and LoRAs are loaded, 1 for the models alone, else 0"""
+        if models is None or models[0] not in self.loaded:
+            return 0
+        return 2 if self.loaded[models[0]] == models[1] else 1
+
+    def load_models(self, models: ModelKey, cleared: bool = False):
+        """Record the models of a request dispatched here"""
+        if cleared:
+            self.loaded.clear()
+        files, loras = models
+        self.loaded[files] = loras
+        self.loaded.move_to_end(files)
+        while len(self.loaded) > self.warm_slots:
+            self.loaded.popitem(last=False)
+
+    def free_vram_fraction(self) -> Optional[float]:
+        """Free memory of the fullest device in the last /system_stats report"""
+        fractions = [device['vram_free'] / device['vram_total']
+                     for device in self.system_stats.get('devices', []) if device.get('vram_total')]
+        return min(fractions) if fractions else None
+
+    async def memory_pressure(self, min_free_vram: float) -> bool:
+        """Whether less than `min_free_vram` of the backend's VRAM is free right now"""
+        try:
+            self.system_stats = await self.admission.fetch_json('/system_stats')
+        except Exception as e:
+            logger.warning(f"Could not read system stats of {self.address}: {e}")
+        free = self.free_vram_fraction()
+        return free is not None and free < min_free_vram
+
+    def record_success(self):
+        if self.open_until is not None:
+            logger.info(f"ComfyUI backend {self.address} is healthy again")
+        self.failures = 0
+        self.open_until = None
+
+    def record_failure(self, reason: str):
+        self.failures += 1
+        # A failed or restarted backend may have lost its models
+        self.loaded.clear()
+        if self.failures < self.failure_threshold:
+            return
+        now = asyncio.get_running_loop().time()
+        if self.open_until is None:
+            logger.warning(f"Taking ComfyUI backend {self.address} out of rotation after "
+                           f"{self.failures} failures: {reason}")
+        self.open_until = now + self.retry_after
+
+    def due_for_probe(self) -> bool:
+        return self.open_until is None or asyncio.get_running_loop().time() >= self.open_until
+
+    async def check_health(self):
+        try:
+            self.system_stats = await self.admission.fetch_json('/system_stats')
+            if not await self.admission.probe_queue(force=True):
+                raise RuntimeError("queue unavailable")
+        except Exception as e:
+            self.record_failure(f"health probe failed: {e}")
+            return
+        self.record_success()
+
+class BackendPool:
+    """
+    Routes generations across ComfyUI backends.
+
+    acquire() picks, among the available backends its admission controller will take,
+    the one that has the request's models loaded, `models(item)`, preferring a full
+    match of workflow and LoRAs over the workflow alone and then the least expected
+    wait (outstanding work times its latency baseline). Compatible requests thereby
+    collect on warm backends and skip the model load, while a busy warm backend still
+    spills over to the others. Backends are health checked every `health_interval`
+    seconds.
+
+    Implements the scheduler's admission interface: acquire(item) returns the backend
+    the item was admitted to, release(backend, latency, success) returns it.
+    """
+
+    def __init__(self, backends: Iterable[Backend], models: Optional[Callable[[Any], ModelKey]] = None,
+                 health_interval: float = 10.0, min_free_vram: float = 0.15):
+        self.backends: List[Backend] = list(backends)
+        if not self.backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.by_address: Dict[str, Backend] = {backend.address: backend for backend in self.backends}
+        self.models = models
+        self.health_interval = health_interval
+        self.min_free_vram = min_free_vram
+        self._released = asyncio.Event()
+        self._health_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for backend in self.backends:
+            await backend.admission.close()
+
+    def candidates(self, models: Optional[ModelKey] = None) -> List[Backend]:
+        """Available backends in routing order: warmest first, then by score"""
+        return sorted((backend for backend in self.backends if backend.available),
+                      key=lambda backend: (-backend.warmth(models), backend.score()))
+
+    async def acquire(self, item: Any = None) -> Backend:
+        models = self.models(item) if self.models and item is not None else None
+        while True:
+            for backend in self.candidates(models):
+                if await backend.admission.try_acquire():
+                    return backend
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), timeout=self._retry_interval())
+            except asyncio.TimeoutError:
+                pass
+
+    async def prepare(self, backend: Backend, item: Any) -> bool:
+        """
+        Record that the item's models are about to load on the backend it was admitted
+        to. Returns whether ComfyUI's model cache should be cleared first: only when the
+        models are not loaded yet and the backend is short of memory.
+        """
+        if not self.models:
+            return False
+        models = self.models(item)
+        clear = backend.warmth(models) == 0 and await backend.memory_pressure(self.min_free_vram)
+        if clear:
+            logger.debug(f"Clearing the model cache of {backend.address} before loading new models")
+        backend.load_models(models, cleared=clear)
+        return clear
+
+    def release(self, backend: Backend, latency: Optional[float] = None, success: bool = True):
+        backend.admission.release(latency=latency, success=success)
+        if success:
+            backend.record_success()
+        else:
+            backend.record_failure("generation failed")
+        self._released.set()
+
+    def _retry_interval(self) -> float:
+        return min(backend.admission.probe_interval for backend in self.backends)
+
+    async def _health_loop(self):
+        while True:
+            due = [backend for backend in self.backends if backend.due_for_probe()]
+            await asyncio.gather(*(backend.check_health() for backend in due))
+            # A backend may have come back
+            self._released.set()
+            await asyncio.sleep(self.health_interval)
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [{
+            'address': backend.address,
+            'available': backend.available,
+            'in_flight': backend.admission.in_flight,
+            'queue_depth': backend.admission.queue_depth,
+            'limit': int(backend.admission.limit),
+            'baseline': backend.admission.baseline,
+            'loaded': list(backend.loaded)
+        } for backend in self.backends]
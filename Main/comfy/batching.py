@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from Main.workflow_store import workflow_shape
+from .client import ComfyClient, PreviewCallback, ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+# Sampler nodes; a merged prompt runs one of them per request
+SAMPLER_TYPES = ('KSampler', 'KSamplerAdvanced', 'SamplerCustom', 'SamplerCustomAdvanced')
+
+# Output image entries of a prompt by node id, as ComfyUI's history reports them
+Outputs = Dict[str, List[Dict[str, str]]]
+
+def _links(node: Dict[str, Any]) -> List[str]:
+    """Ids of the nodes whose outputs feed this node"""
+    return [value[0] for value in node.get('inputs', {}).values()
+            if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)]
+
+def merge_workflows(workflows: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+    """
+    Merge workflows of one shape into a single prompt with a branch per workflow.
+
+    A node that is identical in every workflow and only fed by such nodes (the model,
+    CLIP and VAE loaders, the LoRA loader, the empty latent, ...) is kept once. Every
+    other node, from the prompt and seed down to the image save, is copied into each
+    branch under the id 'batch<i>:<id>'. Returns the merged workflow and, per
+    workflow, the map from its node ids to their ids in the merged one.
+    """
+    first = workflows[0]
+    shape = workflow_shape(first)
+    if any(workflow_shape(workflow) != shape for workflow in workflows[1:]):
+        raise ValueError("Only workflows with the same nodes can be merged")
+
+    shared: Dict[str, bool] = {}
+
+    def is_shared(node_id: str) -> bool:
+        if node_id not in shared:
+            # Guards against cycles in a malformed graph
+            shared[node_id] = False
+            node = first[node_id]
+            shared[node_id] = (all(workflow[node_id] == node for workflow in workflows[1:])
+                               and all(is_shared(link) for link in _links(node) if link in first))
+        return shared[node_id]
+
+    merged: Dict[str, Any] = {}
+    node_maps: List[Dict[str, str]] = []
+    for index, workflow in enumerate(workflows):
+        node_map = {node_id: node_id if is_shared(node_id) else f"batch{index}:{node_id}" for node_id in workflow}
+        for node_id, node in workflow.items():
+            if node_map[node_id] in merged:
+                continue
+            inputs = {
+                name: [node_map.get(value[0], value[0]), value[1]]
+                if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) else value
+                for name, value in node.get('inputs', {}).items()
+            }
+            merged[node_map[node_id]] = {**node, 'inputs': inputs}
+        node_maps.append(node_map)
+    return merged, node_maps
+
+def split_outputs(outputs: Outputs, node_maps: List[Dict[str, str]]) -> List[Outputs]:
+    """Hand the outputs of a merged prompt back to the workflows it was built from"""
+    return [{node_id: outputs[merged_id] for node_id, merged_id in node_map.items() if merged_id in outputs}
+            for node_map in node_maps]
+
+def count_samplers(workflow: Dict[str, Any]) -> int:
+    return sum(1 for node in workflow.values()
+               if isinstance(node, dict) and node.get('class_type') in SAMPLER_TYPES) or 1
+
+class PromptBatcher:
+    """
+    Coalesces compatible prompts for one ComfyUI backend into one merged prompt.
+
+    Prompts submitted with the same batch key (same workflow graph and models,
+    resolution, LoRAs and upscale factor) while the backend is busy are held for up to `window` seconds
+    or until `max_size` of them are waiting, then queued as a single prompt with a
+    sampler branch per request, so the shared models are set up once and ComfyUI runs
+    them back to back. An idle backend gets its prompt straight away. Every request's
+    progress callback follows the whole batch; previews are only passed on for prompts
+    that run alone, as those of a merged prompt can't be told apart.
+    """
+
+    def __init__(self, client: ComfyClient, window: float = 0.25, max_size: int = 4):
+        self.client = client
+        self.window = window
+        self.max_size = max(1, max_size)
+        self.pending: Dict[Hashable, List[Tuple[Dict[str, Any], ProgressCallback, Optional[PreviewCallback],
+                                                asyncio.Future]]] = {}
+        # Running batches, kept so they aren't garbage collected before they finish
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.prompts = 0
+
+    async def execute_prompt(self, workflow: Dict[str, Any], progress_callback: ProgressCallback,
+                             key: Optional[Hashable] = None,
+                             preview_callback: Optional[PreviewCallback] = None) -> Outputs:
+        """client.execute_prompt, merged with other prompts of the same key where possible"""
+        if key is None or self.max_size == 1 or self.window <= 0:
+            return await self.client.execute_prompt(workflow, progress_callback, preview_callback=preview_callback)
+
+        future = asyncio.get_running_loop().create_future()
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = []
+            if self.client.executions:
+                asyncio.get_running_loop().call_later(self.window, self._flush, key, batch)
+            else:
+                asyncio.get_running_loop().call_soon(self._flush, key, batch)
+        batch.append((workflow, progress_callback, preview_callback, future))
+        if len(batch) >= self.max_size:
+            self._flush(key, batch)
+        return await future
+
+    def _flush(self, key: Hashable, batch: list):
+        if self.pending.get(key) is not batch:
+            # Already flushed when it filled up
+            return
+        del self.pending[key]
+        task = asyncio.create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Cancel the running batches and the prompts still waiting to be batched"""
+        for batch in self.pending.values():
+            for _, _, _, future in batch:
+                future.cancel()
+        self.pending.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_batch(self, batch: list):
+        workflows = [workflow for workflow, _, _, _ in batch]
+        callbacks = [callback for _, callback, _, _ in batch]
+        try:
+            if len(batch) == 1:
+                results = [await self.client.execute_prompt(workflows[0], callbacks[0], preview_callback=batch[0][2])]
+            else:
+                merged, node_maps = merge_workflows(workflows)
+
+                async def progress_callback(data):
+                    await asyncio.gather(*(callback(data) for callback in callbacks), return_exceptions=True)
+
+                logger.debug(f"Running {len(batch)} requests as one prompt on {self.client.address}")
+                outputs = await self.client.execute_prompt(merged, progress_callback,
+                                                           sampler_runs=count_samplers(merged))
+                results = split_outputs(outputs, node_maps)
+            self.batches += 1
+            self.prompts += len(batch)
+        except asyncio.CancelledError:
+            for _, _, _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
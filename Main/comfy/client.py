@@ -0,0 +1,367 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from Main.http_pool import ConnectionStats, create_client_session
+from Main.image_spool import SPOOL_CHUNK_SIZE, remove_spooled, spool_file_path
+from Main.previews import decode_preview_frame
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+# preview_callback(image); a JPEG or PNG of the image being sampled
+PreviewCallback = Callable[[bytes], Awaitable[None]]
+
+# Events that arrive for a prompt we have not registered yet (the websocket can beat
+# the /prompt response) are buffered for at most this many prompts
+MAX_BUFFERED_PROMPTS = 256
+
+class ComfyExecutionError(Exception):
+    """Raised when ComfyUI reports that a prompt failed."""
+
+class ComfyClient:
+    """
+    Asyncio client for one ComfyUI host.
+
+    Every prompt is queued with the same client_id, so ComfyUI reports all of them on a
+    single websocket. A reader task routes each event to the queue of the prompt it
+    belongs to, which lets any number of concurrent jobs share one connection.
+    """
+
+    def __init__(self, host: str, port: int = 8188, reconnect_delay: float = 2.0,
+                 pool_size: int = 100, max_per_host: int = 10,
+                 connect_timeout: float = 10, read_timeout: float = 120,
+                 outage_timeout: float = 120):
+        self.host = host
+        self.port = port
+        self.base_url = f"http://{host}:{port}"
+        self.ws_url = f"ws://{host}:{port}/ws"
+        self.client_id = str(uuid.uuid4())
+        self.reconnect_delay = reconnect_delay
+        # Prompts in flight are failed once the websocket has been down this long
+        self.outage_timeout = outage_timeout
+        self.pool_size = pool_size
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.stats = ConnectionStats()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.executions: Dict[str, asyncio.Queue] = {}
+        self.buffered: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self.current_prompt_id: Optional[str] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._closed = False
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Requests made and keep-alive connections opened or reused, websocket included"""
+        return self.stats.snapshot()
+
+    async def connect(self):
+        """Open the HTTP session and the shared websocket if they are not open yet"""
+        async with self._connect_lock:
+            if self._closed:
+                raise RuntimeError("ComfyClient is closed")
+            if self.session is None or self.session.closed:
+                self.session = create_client_session(
+                    self.stats,
+                    pool_size=self.pool_size,
+                    max_per_host=self.max_per_host,
+                    connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout
+                )
+            if self._reader_task is None or self._reader_task.done():
+                await self._open_websocket()
+                self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        self._closed = True
+        if self._reader_task:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.close()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self._fail_all(ConnectionError("ComfyClient closed"))
+        logger.info(f"ComfyUI connections for {self.address}: {self.connection_stats()}")
+
+    async def _open_websocket(self):
+        self.ws = await self.session.ws_connect(
+            self.ws_url,
+            params={'clientId': self.client_id},
+            heartbeat=30,
+            max_msg_size=0
+        )
+        logger.debug(f"Connected to ComfyUI websocket at {self.address} as {self.client_id}")
+
+    async def _read_loop(self):
+        while not self._closed:
+            try:
+                async for msg in self.ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        try:
+                            self._dispatch(json.loads(msg.data))
+                        except json.JSONDecodeError as e:
+                            logger.error(f"Error parsing WebSocket message: {e}")
+                    elif msg.type == aiohttp.WSMsgType.BINARY:
+                        self._dispatch_preview(msg.data)
+                    elif msg.type == aiohttp.WSMsgType.ERROR:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"ComfyUI websocket error on {self.address}: {e}")
+
+            if self._closed:
+                break
+            logger.warning(f"ComfyUI websocket to {self.address} closed, reconnecting...")
+            await self._reconnect()
+
+    async def _reconnect(self):
+        delay = self.reconnect_delay
+        loop = asyncio.get_running_loop()
+        failed_at = loop.time() + self.outage_timeout
+        while not self._closed:
+            try:
+                await self._open_websocket()
+                break
+            except Exception as e:
+                logger.warning(f"Reconnect to {self.address} failed: {e}, retrying in {delay}s")
+                if failed_at is not None and loop.time() >= failed_at:
+                    self._fail_all(ComfyExecutionError(
+                        f"ComfyUI at {self.address} unreachable for {self.outage_timeout:.0f}s"
+                    ))
+                    failed_at = None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+        # Completion events may have been missed while disconnected
+        for prompt_id, events in list(self.executions.items()):
+            events.put_nowait({'type': '_resync', 'data': {'prompt_id': prompt_id}})
+
+    def _dispatch(self, message: Dict[str, Any]):
+        msg_type = message.get('type')
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id') if isinstance(data, dict) else None
+
+        if msg_type == 'execution_start':
+            self.current_prompt_id = prompt_id
+        elif msg_type == 'executing' and prompt_id:
+            self.current_prompt_id = None if data.get('node') is None else prompt_id
+
+        # Older ComfyUI builds omit prompt_id on progress events; only one prompt runs
+        # at a time, so they belong to the one currently executing
+        if prompt_id is None and msg_type == 'progress':
+            prompt_id = self.current_prompt_id
+        if prompt_id is None:
+            return
+
+        events = self.executions.get(prompt_id)
+        if events is not None:
+            events.put_nowait(message)
+            return
+
+        self.buffered.setdefault(prompt_id, []).append(message)
+        self.buffered.move_to_end(prompt_id)
+        while len(self.buffered) > MAX_BUFFERED_PROMPTS:
+            self.buffered.popitem(last=False)
+
+    def _dispatch_preview(self, frame: bytes):
+        preview = decode_preview_frame(frame)
+        if preview is None:
+            return
+        image, image_format, prompt_id = preview
+        # Previews are only worth showing while they are fresh, so they are never buffered
+        events = self.executions.get(prompt_id or self.current_prompt_id)
+        if events is not None:
+            events.put_nowait({'type': '_preview', 'data': {'image': image, 'format': image_format}})
+
+    def _fail_all(self, error: Exception):
+        for events in self.executions.values():
+            events.put_nowait({'type': '_failed', 'data': {'error': error}})
+
+    async def queue_prompt(self, workflow: Dict) -> Dict[str, Any]:
+        """POST a workflow to /prompt and return ComfyUI's response"""
+        await self.connect()
+        payload = {"prompt": workflow, "client_id": self.client_id}
+        async with self.session.post(f"{self.base_url}/prompt", json=payload) as response:
+            if response.status != 200:
+                body = await response.text()
+                logger.error(f"HTTP Error: {response.status} - {body}")
+                raise ComfyExecutionError(f"ComfyUI rejected prompt: HTTP {response.status} - {body}")
+            result = await response.json()
+        if not isinstance(result, dict) or 'prompt_id' not in result:
+            raise ValueError("No prompt_id in response from queue_prompt")
+        return result
+
+    async def get_history(self, prompt_id: str) -> Dict[str, Any]:
+        await self.connect()
+        async with self.session.get(f"{self.base_url}/history/{prompt_id}") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_queue(self) -> Dict[str, Any]:
+        await self.connect()
+        async with self.session.get(f"{self.base_url}/queue") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_image(self, filename: str, subfolder: str, folder_type: str) -> Tuple[bytes, str]:
+        await self.connect()
+        params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        async with self.session.get(f"{self.base_url}/view", params=params) as response:
+            response.raise_for_status()
+            return await response.read(), filename
+
+    async def download_image(self, image: Dict[str, str], directory: str) -> str:
+        """Stream an output image (an entry of a history output) into a spool file; returns its path"""
+        await self.connect()
+        params = {"filename": image['filename'], "subfolder": image['subfolder'], "type": image['type']}
+        path = spool_file_path(directory, image['filename'])
+        try:
+            async with self.session.get(f"{self.base_url}/view", params=params) as response:
+                response.raise_for_status()
+                # Chunks go to the page cache; small blocking writes are cheaper than a thread hop each
+                with open(path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(SPOOL_CHUNK_SIZE):
+                        f.write(chunk)
+        except BaseException:
+            remove_spooled(path)
+            raise
+        return path
+
+    async def clear_cache(self):
+        await self.connect()
+        await self.ws.send_str(json.dumps({"type": "clear_cache"}))
+        logger.debug("Sent clear_cache message to ComfyUI")
+
+    async def run_prompt(self, workflow: Dict, progress_callback: ProgressCallback,
+                         sampler_runs: int = 1,
+                         preview_callback: Optional[PreviewCallback] = None) -> Dict[str, List[Tuple[bytes, str]]]:
+        """
+        Queue a workflow, report its progress and return its output images.
+
+        Mirrors comfygen.get_images: the result maps node ids to lists of
+        (image_data, filename) tuples. A workflow that runs several samplers one after
+        another reports their combined progress when sampler_runs says how many.
+        ComfyUI's previews of the image being sampled go to preview_callback, if given;
+        ComfyUI only sends them when started with a --preview-method.
+        """
+        outputs = await self.execute_prompt(workflow, progress_callback, sampler_runs, preview_callback)
+        return {
+            node_id: [await self.get_image(image['filename'], image['subfolder'], image['type']) for image in images]
+            for node_id, images in outputs.items()
+        }
+
+    async def execute_prompt(self, workflow: Dict, progress_callback: ProgressCallback,
+                             sampler_runs: int = 1,
+                             preview_callback: Optional[PreviewCallback] = None) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Like run_prompt, but returns the output images without downloading them: node
+        ids mapped to ComfyUI's image entries (filename, subfolder, type).
+        """
+        await self.connect()
+        prompt_id = (await self.queue_prompt(workflow))['prompt_id']
+        events: asyncio.Queue = asyncio.Queue()
+        self.executions[prompt_id] = events
+        for message in self.buffered.pop(prompt_id, []):
+            events.put_nowait(message)
+
+        try:
+            await self._follow_prompt(prompt_id, events, progress_callback, sampler_runs, preview_callback)
+            history = (await self.get_history(prompt_id))[prompt_id]
+        except Exception as e:
+            logger.error(f"Error in run_prompt: {str(e)}")
+            await progress_callback({
+                "status": "error",
+                "message": str(e)
+            })
+            raise
+        finally:
+            self.executions.pop(prompt_id, None)
+
+        return {node_id: node_output['images'] for node_id, node_output in history['outputs'].items()
+                if 'images' in node_output}
+
+    async def _follow_prompt(self, prompt_id: str, events: asyncio.Queue, progress_callback: ProgressCallback,
+                             sampler_runs: int = 1, preview_callback: Optional[PreviewCallback] = None):
+        last_milestone = 0
+        # Samplers finished so far, and the step the current one is at
+        runs_done = 0
+        last_value = 0
+        while True:
+            message = await events.get()
+            msg_type = message['type']
+            data = message.get('data') or {}
+
+            if msg_type == 'execution_start':
+                await progress_callback({
+                    "status": "execution",
+                    "message": "Starting execution..."
+                })
+
+            elif msg_type == 'executing':
+                if data.get('node') is None:
+                    await progress_callback({
+                        "status": "complete",
+                        "message": "Generation complete!"
+                    })
+                    return
+
+                if "UNETLoader" in str(data) or "CLIPLoader" in str(data) or "VAELoader" in str(data):
+                    await progress_callback({
+                        "status": "loading_models",
+                        "message": "Loading models and preparing generation..."
+                    })
+
+            elif msg_type == 'progress':
+                if data['value'] < last_value:
+                    runs_done += 1
+                last_value = data['value']
+                progress = min(100, int((runs_done + data['value'] / data['max']) / max(1, sampler_runs) * 100))
+                current_milestone = (progress // 10) * 10
+                if current_milestone > last_milestone:
+                    await progress_callback({
+                        "status": "generating",
+                        "progress": progress
+                    })
+                    last_milestone = current_milestone
+
+            elif msg_type == '_preview':
+                if preview_callback is not None:
+                    await preview_callback(data['image'])
+
+            elif msg_type == 'execution_cached':
+                await progress_callback({
+                    "status": "cached",
+                    "message": "Using cached result..."
+                })
+
+            elif msg_type == 'execution_error':
+                raise ComfyExecutionError(
+                    f"{data.get('node_type', 'Node')} failed: {data.get('exception_message', 'unknown error')}"
+                )
+
+            elif msg_type == '_resync':
+                # Reconnected: if the prompt finished while we were away, stop waiting
+                if prompt_id in await self.get_history(prompt_id):
+                    return
+                # A restarted ComfyUI has forgotten its queue; the prompt will never run
+                queue = await self.get_queue()
+                queued = {entry[1] for entry in queue.get('queue_running', []) + queue.get('queue_pending', [])
+                          if len(entry) > 1}
+                if prompt_id not in queued:
+                    raise ComfyExecutionError(f"Prompt {prompt_id} is no longer queued on {self.address}")
+
+            elif msg_type == '_failed':
+                raise data['error']
@@ -0,0 +1,257 @@
+import copy
+import json
+import logging
+import os
+
+from Main.utils import generate_random_seed
+from Main.custom_commands.workflow_utils import update_reduxprompt_workflow
+from Main.custom_commands.workflow_templates import WorkflowTemplate, get_lora_info
+
+logger = logging.getLogger(__name__)
+
+# Preparing and cleaning up comfygen jobs, shared by comfygen.py and the in-process
+# ComfyWorkerPool. Importing this module has no side effects: no logging setup and no
+# HTTP clients.
+
+def open_workflow(workflow_filename):
+    """Opens and loads workflow file from DataSets directory with validation"""
+    try:
+        workflow_path = os.path.join('Main', 'Datasets', workflow_filename)
+        if not os.path.exists(workflow_path):
+            workflow_path = os.path.join('Main', 'DataSets', workflow_filename)
+        logger.debug(f"Opening workflow file: {workflow_path}")
+        
+        with open(workflow_path, "r", encoding="utf-8") as f:
+            # Read the file content
+            content = f.read().strip()
+            
+            # Remove any BOM characters that might be present
+            if content.startswith('\ufeff'):
+                content = content[1:]
+                
+            # Parse the JSON carefully
+            try:
+                workflow = json.loads(content)
+                if not isinstance(workflow, dict):
+                    raise ValueError("Workflow must be a dictionary")
+            except json.JSONDecodeError as e:
+                logger.error(f"JSON parsing error in workflow: {e}")
+                raise
+
+            logger.debug(f"Successfully loaded workflow with {len(workflow)} nodes")
+            return workflow
+            
+    except FileNotFoundError:
+        logger.error(f"Workflow file not found: {workflow_path}")
+        raise
+    except Exception as e:
+        logger.error(f"Error loading workflow: {str(e)}")
+        raise
+
+def update_workflow(workflow, prompt, resolution, loras, upscale_factor, seed):
+    """Updates the workflow with the provided parameters with validation"""
+    try:
+        # Only the patched nodes are copied, the passed workflow is left untouched. Not
+        # validated: PuLID graphs only have the prompt slot, and the bot has checked the rest
+        workflow = WorkflowTemplate(workflow, validate=False).render(
+            prompt, resolution, loras, upscale_factor, seed, get_lora_info(),
+            scale_multiple_loras=False, guidance=None
+        )
+        logger.debug("Successfully updated workflow with all parameters")
+        return workflow
+
+    except Exception as e:
+        logger.error(f"Error updating workflow: {str(e)}")
+        raise ValueError(f"Failed to update workflow: {str(e)}")
+
+def parse_flag(value):
+    """A 'true'/'false' argument as a bool"""
+    if value.lower() not in ('true', 'false'):
+        raise ValueError(f"Expected true or false, got {value!r}")
+    return value.lower() == 'true'
+
+def parse_job_args(args):
+    """Parses the comfygen.py arguments (without the script name) into a job dictionary"""
+    if len(args) < 6:
+        raise ValueError(f"Expected at least 6 arguments, but got {len(args)}")
+
+    job = {
+        'request_id': args[0],
+        'user_id': args[1],
+        'channel_id': args[2],
+        'interaction_id': args[3],
+        'original_message_id': args[4],
+        'request_type': args[5]
+    }
+
+    request_type = job['request_type']
+    if request_type == 'standard':  # Standard /comfy command
+        if len(args) < 11:
+            raise ValueError("Not enough arguments for standard request")
+        job.update({
+            'prompt': args[6],
+            'resolution': args[7],
+            'loras': json.loads(args[8]),
+            'upscale_factor': int(args[9]),
+            'workflow_filename': args[10],
+            'seed': args[11] if len(args) > 11 else None,
+            'is_pulid': parse_flag(args[12]) if len(args) > 12 else False
+        })
+    elif request_type == 'redux':  # Redux command
+        if len(args) < 12:
+            raise ValueError("Not enough arguments for redux request")
+        job.update({
+            'resolution': args[6],
+            'strength1': float(args[7]),
+            'strength2': float(args[8]),
+            'workflow_filename': args[9],
+            'image1_path': args[10],
+            'image2_path': args[11]
+        })
+    elif request_type == 'reduxprompt':  # ReduxPrompt command
+        if len(args) < 11:
+            raise ValueError("Not enough arguments for reduxprompt request")
+        job.update({
+            'prompt': args[6],
+            'resolution': args[7],
+            'strength': args[8],
+            'workflow_filename': args[9],
+            'image_path': args[10]
+        })
+    else:
+        raise ValueError(f"Invalid request type: {request_type}")
+
+    return job
+
+def job_workflow(job):
+    """A copy of the job's workflow to fill in, from the job spec or its workflow file"""
+    if job.get('workflow') is not None:
+        return copy.deepcopy(job['workflow'])
+    return open_workflow(job['workflow_filename'])
+
+def prepare_job(job, progress_callback):
+    """Loads and updates the workflow for a job.
+
+    Returns the workflow to queue and the metadata that is reported back to the bot
+    together with the final image.
+    """
+    request_type = job['request_type']
+
+    # Create temp directory if needed
+    temp_dir = os.path.join('Main', 'DataSets', 'temp')
+    os.makedirs(temp_dir, exist_ok=True)
+
+    if request_type == 'standard':
+        progress_callback({
+            'status': 'starting',
+            'message': 'Starting Generation process...'
+        })
+
+        workflow = job_workflow(job)
+
+        # Process seed
+        seed = job.get('seed')
+        try:
+            seed = int(seed) if seed not in (None, "None") else generate_random_seed()
+            logger.debug(f"Using seed: {seed}")
+        except ValueError:
+            seed = generate_random_seed()
+
+        workflow = update_workflow(
+            workflow,
+            job['prompt'],
+            job['resolution'],
+            job['loras'],
+            job['upscale_factor'],
+            seed
+        )
+
+        metadata = {
+            'prompt': job['prompt'],
+            'loras': job['loras'],
+            'upscale_factor': job['upscale_factor'],
+            'seed': seed
+        }
+
+    elif request_type == 'redux':
+        workflow = job_workflow(job)
+        comfy_image1_path = os.path.abspath(job['image1_path']).replace('\\', '/')
+        comfy_image2_path = os.path.abspath(job['image2_path']).replace('\\', '/')
+
+        if '40' in workflow:
+            workflow['40']['inputs']['image'] = comfy_image1_path
+        if '46' in workflow:
+            workflow['46']['inputs']['image'] = comfy_image2_path
+        if '53' in workflow:
+            workflow['53']['inputs']['conditioning_to_strength'] = job['strength1']
+        if '44' in workflow:
+            workflow['44']['inputs']['conditioning_to_strength'] = job['strength2']
+        if '49' in workflow:
+            workflow['49']['inputs']['ratio_selected'] = job['resolution']
+
+        metadata = {
+            'prompt': "Redux image generation",
+            'loras': [],
+            'upscale_factor': 1,
+            'seed': None
+        }
+
+    elif request_type == 'reduxprompt':
+        progress_callback({
+            'status': 'starting',
+            'message': 'Loading workflow and preparing generation...'
+        })
+
+        workflow = job_workflow(job)
+        try:
+            workflow = update_reduxprompt_workflow(
+                workflow,
+                job['image_path'],  # Pass the full path
+                job['prompt'],
+                job['strength']
+            )
+        except Exception as e:
+            logger.error(f"Error updating workflow: {str(e)}")
+            raise ValueError(f"Error updating workflow: {str(e)}")
+
+        metadata = {
+            'prompt': job['prompt'],
+            'loras': [],
+            'upscale_factor': 1,
+            'seed': None
+        }
+
+    else:
+        raise ValueError(f"Invalid request type: {request_type}")
+
+    metadata['resolution'] = job['resolution']
+    metadata['upscaled_resolution'] = job['resolution']
+    return workflow, metadata
+
+def select_final_image(outputs):
+    """Returns the last non-temporary output image entry produced by the workflow"""
+    for node_id, images in reversed(outputs.items()):
+        for image in reversed(images):
+            if not image['filename'].startswith('ComfyUI_temp'):
+                return image
+    return None
+
+def cleanup_job_files(job):
+    """Delete the uploaded images that belong to a job; its workflow file is a shipped template"""
+    try:
+        # Clean up the job's own reference images
+        if job.get('request_type') == 'reduxprompt':
+            temp_image_paths = [job.get('image_path')]
+        elif job.get('request_type') == 'redux':
+            temp_image_paths = [job.get('image1_path'), job.get('image2_path')]
+        else:
+            temp_image_paths = []
+        for temp_image_path in temp_image_paths:
+            if temp_image_path and os.path.exists(temp_image_path):
+                try:
+                    os.remove(temp_image_path)
+                    logger.debug(f"Deleted temp file: {temp_image_path}")
+                except Exception as e:
+                    logger.error(f"Error removing temp file {temp_image_path}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error during cleanup: {str(e)}")
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from Main.image_spool import remove_spooled
+from Main.workflow_store import model_signature, workflow_shape
+from .batching import PromptBatcher
+from .client import ComfyClient
+from .jobs import cleanup_job_files, prepare_job, select_final_image
+
+logger = logging.getLogger(__name__)
+
+# progress_handler(request_id, progress_data)
+ProgressHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+# preview_handler(request_id, image)
+PreviewHandler = Callable[[str, bytes], Awaitable[None]]
+# result_handler(job, metadata, (image_path, filename), workflow); the spooled image
+# file at image_path is removed once the handler returns
+ResultHandler = Callable[[Dict[str, Any], Dict[str, Any], Tuple[str, str], Dict], Awaitable[None]]
+
+class ComfyWorkerPool:
+    """Runs comfygen jobs inside the bot process on a fixed number of asyncio workers.
+
+    All workers share one ComfyClient per ComfyUI backend, so every in-flight prompt is
+    tracked over that backend's websocket and a request no longer pays for a Python
+    interpreter start, module imports and a websocket handshake. Jobs take the same
+    argument list that is passed to comfygen.py in subprocess mode, plus the address of
+    the backend to run on.
+
+    Standard requests that only differ in prompt and seed are coalesced per backend
+    into one ComfyUI prompt (see PromptBatcher) when batch_max_size is above 1. The
+    final image is streamed into a file in spool_dir rather than into memory. With a
+    preview_handler, ComfyUI's previews of the image being sampled are passed on.
+    """
+
+    def __init__(self, worker_count: int, clients: Union[ComfyClient, Iterable[ComfyClient]],
+                 progress_handler: ProgressHandler, result_handler: ResultHandler,
+                 batch_window: float = 0.0, batch_max_size: int = 1, spool_dir: Optional[str] = None,
+                 preview_handler: Optional[PreviewHandler] = None):
+        self.worker_count = max(1, worker_count)
+        if isinstance(clients, ComfyClient):
+            clients = [clients]
+        self.clients: Dict[str, ComfyClient] = {client.address: client for client in clients}
+        self.batchers: Dict[str, PromptBatcher] = {
+            address: PromptBatcher(client, window=batch_window, max_size=batch_max_size)
+            for address, client in self.clients.items()
+        }
+        # The backend used when a job does not name one
+        self.client = next(iter(self.clients.values()))
+        # Defaults to the bot's default IMAGE_SPOOL_DIR
+        self.spool_dir = spool_dir or os.path.join(tempfile.gettempdir(), 'fluxbot_images')
+        self.progress_handler = progress_handler
+        self.result_handler = result_handler
+        self.preview_handler = preview_handler
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.workers: List[asyncio.Task] = []
+
+    async def start(self):
+        if self.workers:
+            return
+        await asyncio.gather(*(client.connect() for client in self.clients.values()))
+        for index in range(self.worker_count):
+            self.workers.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"Started {self.worker_count} ComfyUI workers for {', '.join(self.clients)}")
+
+    async def submit(self, request_id: str, job: Dict[str, Any], address: Optional[str] = None,
+                     clear_cache: bool = True) -> asyncio.Future:
+        """
+        Queue a job; job is the job spec comfygen.py reads, workflow included, and
+        address the backend to run it on. clear_cache has ComfyUI drop its cached
+        models first. Returns a future that resolves once the job has finished, with
+        True if it produced an image.
+        """
+        client = self.clients[address] if address else self.client
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put((request_id, job, client, clear_cache, done))
+        return done
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers.clear()
+        for batcher in self.batchers.values():
+            await batcher.close()
+        for client in self.clients.values():
+            await client.close()
+
+    async def _worker(self, index: int):
+        while True:
+            request_id, job, client, clear_cache, done = await self.queue.get()
+            succeeded = False
+            try:
+                succeeded = await self._run_job(request_id, job, client, clear_cache)
+            except Exception as e:
+                logger.error(f"Worker {index} failed on request {request_id}: {e}", exc_info=True)
+            finally:
+                if not done.done():
+                    done.set_result(succeeded)
+                self.queue.task_done()
+
+    @staticmethod
+    def batch_key(job: Dict[str, Any], workflow: Dict[str, Any]) -> Optional[Tuple]:
+        """Jobs with equal keys can share a prompt; only standard requests are coalesced"""
+        if job.get('request_type') != 'standard':
+            return None
+        # Every request has its own copy of the workflow, so compare the graphs
+        return (workflow_shape(workflow), model_signature(workflow), job['resolution'],
+                tuple(sorted(job['loras'])), job['upscale_factor'])
+
+    async def _run_job(self, request_id: str, job: Dict[str, Any], client: ComfyClient,
+                       clear_cache: bool = True) -> bool:
+        loop = asyncio.get_running_loop()
+
+        def threaded_progress(data):
+            # prepare_job runs in a thread
+            asyncio.run_coroutine_threadsafe(self.progress_handler(request_id, data), loop)
+
+        async def progress_callback(data):
+            await self.progress_handler(request_id, data)
+
+        async def preview_callback(image):
+            await self.preview_handler(request_id, image)
+
+        try:
+            workflow, metadata = await asyncio.to_thread(prepare_job, job, threaded_progress)
+
+            if clear_cache:
+                await client.clear_cache()
+            await progress_callback({
+                'status': 'loading_models',
+                'message': 'Loading models and preparing generation...'
+            })
+            outputs = await self.batchers[client.address].execute_prompt(
+                workflow, progress_callback, self.batch_key(job, workflow),
+                preview_callback if self.preview_handler else None
+            )
+
+            final_image = select_final_image(outputs)
+            if final_image is None:
+                logger.error("No final image found to send.")
+                await progress_callback({
+                    'status': 'error',
+                    'message': 'No final image generated'
+                })
+                return False
+
+            image_path = await client.download_image(final_image, self.spool_dir)
+            try:
+                await self.result_handler(job, metadata, (image_path, final_image['filename']), workflow)
+            finally:
+                await asyncio.to_thread(remove_spooled, image_path)
+            return True
+
+        except Exception as e:
+            logger.error(f"Error during image generation: {str(e)}", exc_info=True)
+            await progress_callback({
+                'status': 'error',
+                'message': f'Error during generation: {str(e)}'
+            })
+            return False
+        finally:
+            await asyncio.to_thread(cleanup_job_files, job)
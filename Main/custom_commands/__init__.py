@@ -3,7 +3,8 @@ from .views import ImageControlView, LoRAView, OptionsView
 from .web_handlers import handle_generated_image
 from .models import RequestItem, ReduxRequestItem, ReduxPromptRequestItem
 from config import CHANNEL_IDS, ALLOWED_SERVERS, BOT_MANAGER_ROLE_ID
-from .workflow_utils import update_workflow, update_reduxprompt_workflow, validate_workflow
+from .workflow_utils import update_workflow, update_reduxprompt_workflow
+from .workflow_templates import WorkflowTemplate, get_workflow_template, render_workflow, validate_workflow
 
 
 __all__ = [
@@ -22,5 +23,8 @@ __all__ = [
     'BOT_MANAGER_ROLE_ID',
     'update_workflow',
     'update_reduxprompt_workflow',
-    'validate_workflow'
+    'validate_workflow',
+    'WorkflowTemplate',
+    'get_workflow_template',
+    'render_workflow'
 ]
\ No newline at end of file
@@ -11,19 +11,21 @@ import uuid
 import json
 import os
 import re
-from Main.utils import load_json, generate_random_seed, save_json
+from Main.utils import load_json, generate_random_seed
 from Main.database import (
     is_user_banned, ban_user, get_banned_words, add_user_warning, 
     get_user_warnings, remove_user_warnings, get_all_warnings, add_banned_word, 
-    remove_banned_word, unban_user, get_ban_info, get_all_banned_users
+    remove_banned_word, unban_user, get_ban_info, get_all_banned_users, run_db,
+    compact_workflow_history
 )
 from .banned_utils import check_banned
 from .views import CreativityModal, LoRAView, LoraInfoView, ReduxPromptModal, PulidModal
 from .image_processing import process_image_request
 from config import ENABLE_PROMPT_ENHANCEMENT, AI_PROVIDER, fluxversion
 from ..LMstudio_bot.ai_providers import AIProviderFactory
-from .workflow_utils import update_workflow
+from .workflow_templates import render_workflow
 from .models import RequestItem
+from .permission_utils import is_admin_or_bot_manager
 
 logger = logging.getLogger(__name__)
 
@@ -66,9 +68,7 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
 
 def has_admin_or_bot_manager_role():
     async def predicate(interaction: discord.Interaction):
-        is_admin = interaction.user.guild_permissions.administrator
-        has_role = any(role.id == 1055096424235516936 for role in interaction.user.roles)
-        if is_admin or has_role:
+        if is_admin_or_bot_manager(interaction.user):
             return True
         await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
         return False
@@ -99,9 +99,7 @@ async def setup_commands(bot: commands.Bot):
     @check_channel()
     async def lorainfo(interaction: discord.Interaction):
         try:
-            loras_data = load_json('lora.json')
-            available_loras = loras_data.get('available_loras', [])
-            view = LoraInfoView(available_loras)
+            view = LoraInfoView(list(interaction.client.lora_catalog.entries))
             await interaction.response.send_message(
                 content=view.get_page_content(),
                 view=view,
@@ -131,7 +129,7 @@ async def setup_commands(bot: commands.Bot):
             logger.info(f"Comfy command invoked by {interaction.user.id}")
             
             # Check for banned words first, before any other processing
-            is_banned, message = check_banned(str(interaction.user.id), prompt)
+            is_banned, message = await run_db(check_banned, str(interaction.user.id), prompt)
             if message:  # If there's a message, either a warning or ban
                 await interaction.response.send_message(message, ephemeral=True)
                 return  # Don't continue with image generation if banned word is detected
@@ -231,7 +229,7 @@ async def setup_commands(bot: commands.Bot):
             await interaction.response.defer(ephemeral=True)
             
             word = word.lower()
-            add_banned_word(word)
+            await run_db(add_banned_word, word)
             await interaction.followup.send(f"Added '{word}' to the banned words list.", ephemeral=True)
         except Exception as e:
             logger.error(f"Error in add_banned_word command: {str(e)}")
@@ -244,13 +242,13 @@ async def setup_commands(bot: commands.Bot):
     @app_commands.checks.has_permissions(administrator=True)
     async def remove_banned_word_command(interaction: discord.Interaction, word: str):
         word = word.lower()
-        remove_banned_word(word)
+        await run_db(remove_banned_word, word)
         await interaction.response.send_message(f"Removed '{word}' from the banned words list.", ephemeral=True)
 
     @bot.tree.command(name="list_banned_words", description="List all banned words")
     @app_commands.checks.has_permissions(administrator=True)
     async def list_banned_words(interaction: discord.Interaction):
-        banned_words = get_banned_words()
+        banned_words = await run_db(get_banned_words)
         if banned_words:
             await interaction.response.send_message(f"Banned words: {', '.join(banned_words)}", ephemeral=True)
         else:
@@ -259,7 +257,7 @@ async def setup_commands(bot: commands.Bot):
     @bot.tree.command(name="ban_user", description="Ban a user from using the comfy command")
     @app_commands.checks.has_permissions(administrator=True)
     async def ban_user_command(interaction: discord.Interaction, user: discord.User, reason: str):
-        ban_user(str(user.id), reason)
+        await run_db(ban_user, str(user.id), reason)
         await interaction.response.send_message(f"Banned {user.name} from using the comfy command. Reason: {reason}", ephemeral=True)
 
     @bot.tree.command(name="unban_user", description="Unban a user from using the comfy command")
@@ -269,7 +267,7 @@ async def setup_commands(bot: commands.Bot):
             # Defer the response first
             await interaction.response.defer(ephemeral=True)
             
-            if unban_user(str(user.id)):
+            if await run_db(unban_user, str(user.id)):
                 await interaction.followup.send(f"Unbanned {user.name} from using the comfy command.", ephemeral=True)
             else:
                 await interaction.followup.send(f"{user.name} is not banned.", ephemeral=True)
@@ -284,7 +282,7 @@ async def setup_commands(bot: commands.Bot):
     @app_commands.checks.has_permissions(administrator=True)
     async def whybanned(interaction: discord.Interaction, user: discord.User):
         try:
-            ban_info = get_ban_info(str(user.id))
+            ban_info = await run_db(get_ban_info, str(user.id))
             if ban_info:
                 await interaction.response.send_message(
                     f"{user.name} was banned on {ban_info['banned_at']} for the following reason: {ban_info['reason']}", 
@@ -303,7 +301,7 @@ async def setup_commands(bot: commands.Bot):
     @app_commands.checks.has_permissions(administrator=True)
     async def list_banned_users(interaction: discord.Interaction):
         try:
-            banned_users = get_all_banned_users()
+            banned_users = await run_db(get_all_banned_users)
             if not banned_users:
                 await interaction.response.send_message("No users are currently banned.", ephemeral=True)
                 return
@@ -342,7 +340,7 @@ async def setup_commands(bot: commands.Bot):
             await interaction.response.defer(ephemeral=True)
             
             # Get current warnings
-            current_warnings = get_user_warnings(str(user.id))
+            current_warnings = await run_db(get_user_warnings, str(user.id))
             
             if current_warnings == 0:
                 await interaction.followup.send(
@@ -352,7 +350,7 @@ async def setup_commands(bot: commands.Bot):
                 return
                 
             # Remove all warnings
-            success, message = remove_user_warnings(str(user.id))
+            success, message = await run_db(remove_user_warnings, str(user.id))
             
             if success:
                 await interaction.followup.send(
@@ -389,7 +387,7 @@ async def setup_commands(bot: commands.Bot):
             # Defer the response first since we might need time to process
             await interaction.response.defer(ephemeral=True)
             
-            success, result = get_all_warnings()
+            success, result = await run_db(get_all_warnings)
             
             if not success:
                 await interaction.followup.send(result, ephemeral=True)
@@ -502,6 +500,23 @@ async def setup_commands(bot: commands.Bot):
                     ephemeral=True
                 )
 
+    @bot.tree.command(name="compact_history", description="Deduplicate stored workflows in the image history (Admin only)")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(vacuum="Also rebuild the database file to release the freed space")
+    async def compact_history(interaction: discord.Interaction, vacuum: bool = False):
+        try:
+            await interaction.response.defer(ephemeral=True)
+            stats = await run_db(compact_workflow_history, vacuum=vacuum)
+            await interaction.followup.send(
+                f"Compacted {stats['rows']} history entries into {stats['templates']} templates and "
+                f"{stats['workflows']} stored workflows, removed {stats['orphans_removed']} unused workflows. "
+                f"Database size: {stats['size_before'] / 1048576:.1f} MB -> {stats['size_after'] / 1048576:.1f} MB",
+                ephemeral=True
+            )
+        except Exception as e:
+            logger.error(f"Error in compact_history command: {str(e)}", exc_info=True)
+            await interaction.followup.send(f"Error compacting history: {str(e)}", ephemeral=True)
+
     @bot.tree.command(name="sync", description="Sync bot commands")
     @has_admin_or_bot_manager_role()
     async def sync_commands(interaction: discord.Interaction):
@@ -584,7 +599,7 @@ async def setup_commands(bot: commands.Bot):
                 await interaction.response.defer(ephemeral=True)
                 
                 # Check for banned words first
-                is_banned, message = check_banned(str(interaction.user.id), self.prompt)
+                is_banned, message = await run_db(check_banned, str(interaction.user.id), self.prompt)
                 if message:  # If there's a warning or ban message
                     await interaction.followup.send(message, ephemeral=True)
                     if is_banned:  # If the user is banned, stop processing
@@ -592,12 +607,10 @@ async def setup_commands(bot: commands.Bot):
 
                 # Clean prompt of any existing LoRA trigger words and timestamps
                 base_prompt = re.sub(r'\s*\(Timestamp:.*?\)', '', self.prompt)
-                lora_config = load_json('lora.json')
+                lora_catalog = interaction.client.lora_catalog
                 
                 # Remove existing LoRA trigger words from base prompt
-                for lora in lora_config['available_loras']:
-                    if lora.get('prompt'):
-                        base_prompt = base_prompt.replace(lora['prompt'], '').strip()
+                base_prompt = lora_catalog.remove_legacy_prompt_words(base_prompt)
                 
                 # Clean up multiple commas and whitespace
                 base_prompt = re.sub(r'\s*,\s*,\s*', ', ', base_prompt).strip(' ,')
@@ -650,7 +663,7 @@ async def setup_commands(bot: commands.Bot):
                         logger.info("Prompt enhancement disabled, using original prompt")
 
                 # Check enhanced prompt for banned words
-                is_banned, message = check_banned(str(interaction.user.id), enhanced_prompt)
+                is_banned, message = await run_db(check_banned, str(interaction.user.id), enhanced_prompt)
                 if message:  # If there's a warning or ban message
                     await interaction.followup.send(message, ephemeral=True)
                     if is_banned:  # If the user is banned, stop processing
@@ -695,14 +708,7 @@ async def setup_commands(bot: commands.Bot):
                     pass
                 
                 # Get LoRA trigger words for currently selected LoRAs
-                additional_prompts = []
-                for lora_file in selected_loras:
-                    lora_info = next(
-                        (l for l in lora_config['available_loras'] if l['file'] == lora_file),
-                        None
-                    )
-                    if lora_info and lora_info.get('add_prompt') and lora_info['add_prompt'].strip():
-                        additional_prompts.append(lora_info['add_prompt'].strip())
+                additional_prompts = lora_catalog.trigger_words(selected_loras)
                 
                 # Construct final prompt with new trigger words
                 full_prompt = enhanced_prompt
@@ -717,20 +723,19 @@ async def setup_commands(bot: commands.Bot):
                 # Use the seed from instance variable, or generate new one if None
                 current_seed = self.seed if self.seed is not None else generate_random_seed()
                 
-                workflow = load_json(f'{fluxversion}')
                 request_uuid = str(uuid.uuid4())
                 
-                workflow = update_workflow(
-                    workflow,
+                workflow = render_workflow(
+                    fluxversion,
                     full_prompt,
                     self.resolution,
                     selected_loras,
                     self.upscale_factor,
-                    current_seed
+                    current_seed,
+                    lora_catalog
                 )
 
                 workflow_filename = f'{fluxversion}_{request_uuid}.json'
-                save_json(workflow_filename, workflow)
 
                 original_message = await interaction.followup.send(
                     "🔄 Starting generation process...",
@@ -740,6 +745,7 @@ async def setup_commands(bot: commands.Bot):
                 request_item = RequestItem(
                     id=str(interaction.id),
                     user_id=str(interaction.user.id),
+                    is_admin=is_admin_or_bot_manager(interaction.user),
                     channel_id=str(interaction.channel.id),
                     interaction_id=str(interaction.id),
                     original_message_id=str(original_message.id),
@@ -748,6 +754,7 @@ async def setup_commands(bot: commands.Bot):
                     loras=selected_loras,
                     upscale_factor=self.upscale_factor,
                     workflow_filename=workflow_filename,
+                    workflow=workflow,
                     seed=current_seed
                 )
                 await interaction.client.subprocess_queue.put(request_item)
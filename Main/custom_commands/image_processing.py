@@ -7,8 +7,9 @@ from typing import Optional, List, Any, Dict
 from discord import Interaction
 
 # Local application imports
-from Main.utils import load_json, save_json, generate_random_seed
-from .workflow_utils import update_workflow
+from Main.utils import generate_random_seed
+from .workflow_templates import render_workflow
+from .permission_utils import is_admin_or_bot_manager
 from config import fluxversion
 
 logger = logging.getLogger(__name__)
@@ -47,15 +48,8 @@ async def process_image_request(interaction: discord.Interaction, prompt: str, r
                 pass
             
             # Get LoRA trigger words for currently selected LoRAs
-            lora_config = load_json('lora.json')
-            additional_prompts = []
-            for lora_file in selected_loras:
-                lora_info = next(
-                    (l for l in lora_config['available_loras'] if l['file'] == lora_file),
-                    None
-                )
-                if lora_info and lora_info.get('add_prompt') and lora_info['add_prompt'].strip():
-                    additional_prompts.append(lora_info['add_prompt'].strip())
+            lora_catalog = interaction.client.lora_catalog
+            additional_prompts = lora_catalog.trigger_words(selected_loras)
             
             # Construct final prompt with new trigger words
             full_prompt = prompt
@@ -70,25 +64,23 @@ async def process_image_request(interaction: discord.Interaction, prompt: str, r
             # Use provided seed or generate new one
             current_seed = seed if seed is not None else generate_random_seed()
             
-            workflow = load_json(fluxversion)
             request_uuid = str(uuid.uuid4())
             
-            workflow = update_workflow(
-                workflow,
+            workflow = render_workflow(
+                fluxversion,
                 full_prompt,
                 resolution,
                 selected_loras,
                 upscale_factor,
-                current_seed
+                current_seed,
+                lora_catalog
             )
 
             workflow_filename = f'flux3_{request_uuid}.json'
-            save_json(workflow_filename, workflow)
         else:
-            # Use the provided workflow and filename
+            # Use the provided workflow and name
             if workflow_filename is None:
                 workflow_filename = f'flux3_{str(uuid.uuid4())}.json'
-            save_json(workflow_filename, workflow)
             current_seed = seed
             full_prompt = prompt
             selected_loras = [] 
@@ -104,6 +96,7 @@ async def process_image_request(interaction: discord.Interaction, prompt: str, r
         request_item = RequestItem(
             id=str(interaction.id),
             user_id=str(interaction.user.id),
+            is_admin=is_admin_or_bot_manager(interaction.user),
             channel_id=str(interaction.channel.id),
             interaction_id=str(interaction.id),
             original_message_id=str(original_message.id),
@@ -112,6 +105,7 @@ async def process_image_request(interaction: discord.Interaction, prompt: str, r
             loras=selected_loras,
             upscale_factor=upscale_factor,
             workflow_filename=workflow_filename,
+            workflow=workflow,
             seed=current_seed,
             is_pulid=workflow_filename and workflow_filename.lower().startswith('pulid') 
         )
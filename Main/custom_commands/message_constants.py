@@ -1,4 +1,8 @@
 STATUS_MESSAGES = {
+    'queued': {
+        'message': 'Waiting in queue...',
+        'emoji': '⏳'
+    },
     'starting': {
         'message': 'Starting Generation process...',
         'emoji': '🔄'
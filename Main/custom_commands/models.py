@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 import logging
 import os
 
@@ -19,7 +19,7 @@ class BaseRequestItem:
     def __post_init__(self):
         # Convert all string fields to strings and handle None values
         for field in self.__dataclass_fields__:
-            if field not in ['upscale_factor', 'loras', 'seed', 'strength1', 'strength2', 'image1', 'image2']:
+            if field not in ['upscale_factor', 'loras', 'seed', 'strength1', 'strength2', 'image1', 'image2', 'workflow', 'is_admin']:
                 value = getattr(self, field)
                 setattr(self, field, str(value) if value is not None else '')
 
@@ -31,6 +31,8 @@ class RequestItem(BaseRequestItem):
     upscale_factor: int
     seed: Optional[int] = None
     is_pulid: bool = False
+    workflow: Optional[Dict] = None  # The filled-in workflow, passed to comfygen in memory
+    is_admin: bool = False  # Requested by an administrator or bot manager, queued first
 
     def __post_init__(self):
         super().__post_init__()
@@ -53,6 +55,8 @@ class ReduxPromptRequestItem(BaseRequestItem):
     image_path: str  # Path to the saved image file
     image_filename: str
     seed: Optional[int] = None  # Optional seed value for generation
+    workflow: Optional[Dict] = None  # The filled-in workflow, passed to comfygen in memory
+    is_admin: bool = False  # Requested by an administrator or bot manager, queued first
 
     def __post_init__(self):
         super().__post_init__()
@@ -90,6 +94,8 @@ class ReduxRequestItem(BaseRequestItem):
     image2: bytes
     image1_filename: str
     image2_filename: str
+    workflow: Optional[Dict] = None  # The filled-in workflow, passed to comfygen in memory
+    is_admin: bool = False  # Requested by an administrator or bot manager, queued first
 
     def __post_init__(self):
         super().__post_init__()
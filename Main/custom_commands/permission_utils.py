@@ -0,0 +1,9 @@
+# Role allowed to use the admin commands, besides server administrators
+BOT_MANAGER_ROLE = 1055096424235516936
+
+def is_admin_or_bot_manager(user) -> bool:
+    """Whether a guild member is an administrator or has the bot manager role"""
+    permissions = getattr(user, 'guild_permissions', None)
+    if permissions is not None and permissions.administrator:
+        return True
+    return any(role.id == BOT_MANAGER_ROLE for role in getattr(user, 'roles', ()))
@@ -7,12 +7,15 @@ import asyncio
 from discord import app_commands, SelectOption
 from discord.ui import View, Select, Button, Modal, TextInput
 from typing import List, Optional, Dict, Any
-from Main.utils import load_json, save_json, generate_random_seed
-from .workflow_utils import update_workflow, update_pulid_workflow, update_reduxprompt_workflow
+from Main.utils import load_json, generate_random_seed
+from Main.database import run_db
+from .workflow_utils import update_pulid_workflow, update_reduxprompt_workflow
+from .workflow_templates import render_workflow
 from .models import RequestItem, ReduxPromptRequestItem, ReduxRequestItem
+from .permission_utils import is_admin_or_bot_manager
 from .banned_utils import check_banned
 from .image_processing import process_image_request
-from config import PULIDWORKFLOW
+from config import PULIDWORKFLOW, fluxversion
 
 logger = logging.getLogger(__name__)
 
@@ -464,29 +467,17 @@ class OptionsView(View):
             logger.debug(f"Final LoRA selections at confirmation: {self.all_selected_loras}")
             
             # Process the prompt with LoRA trigger words
-            lora_config = load_json('lora.json')
+            lora_catalog = self.bot.lora_catalog
             base_prompt = re.sub(r'\s*\(Timestamp:.*?\)', '', self.original_prompt)
             
             # First remove ALL existing trigger words from the base prompt
-            for lora in lora_config['available_loras']:
-                if lora.get('add_prompt'):
-                    trigger_word = lora['add_prompt'].strip()
-                    base_prompt = re.sub(fr',?\s*{re.escape(trigger_word)},?\s*', '', base_prompt, flags=re.IGNORECASE)
+            base_prompt = lora_catalog.remove_trigger_words(base_prompt)
             
             # Clean up any duplicate commas and whitespace
             base_prompt = re.sub(r'\s*,\s*,\s*', ', ', base_prompt).strip(' ,')
             
             # Add trigger words from currently selected LoRAs
-            additional_prompts = []
-            for lora_file in self.all_selected_loras:
-                lora_info = next(
-                    (l for l in lora_config['available_loras'] if l['file'] == lora_file),
-                    None
-                )
-                if lora_info and lora_info.get('add_prompt'):
-                    trigger_word = lora_info['add_prompt'].strip()
-                    if trigger_word:
-                        additional_prompts.append(trigger_word)
+            additional_prompts = lora_catalog.trigger_words(self.all_selected_loras)
             
             # Combine base prompt with new trigger words
             updated_prompt = base_prompt
@@ -567,23 +558,17 @@ class PromptModal(Modal, title="Edit Prompt"):
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            lora_config = load_json('lora.json')
+            lora_catalog = interaction.client.lora_catalog
             base_prompt = re.sub(r'\s*\(Timestamp:.*?\)', '', self.prompt.value)
             
             # Clean base prompt of any existing LoRA trigger words
-            for lora in lora_config['available_loras']:
-                if lora.get('prompt'):
-                    base_prompt = base_prompt.replace(lora['prompt'], '').strip()
+            base_prompt = lora_catalog.remove_legacy_prompt_words(base_prompt)
             
             # Clean up multiple commas and whitespace
             base_prompt = re.sub(r'\s*,\s*,\s*', ', ', base_prompt).strip(' ,')
             
             # Get LoRA trigger words
-            additional_prompts = []
-            for lora in self.loras:
-                lora_info = next((l for l in lora_config['available_loras'] if l['file'] == lora), None)
-                if lora_info and lora_info.get('prompt') and lora_info['prompt'].strip():
-                    additional_prompts.append(lora_info['prompt'].strip())
+            additional_prompts = lora_catalog.legacy_prompt_words(self.loras)
             
             # Join trigger words with commas and append to prompt
             trigger_words = ", ".join(additional_prompts) if additional_prompts else ""
@@ -594,18 +579,17 @@ class PromptModal(Modal, title="Edit Prompt"):
             except ValueError:
                 seed = None
 
-            workflow = load_json(fluxversion)
             request_uuid = str(uuid.uuid4())
             
-            workflow = update_workflow(workflow, 
+            workflow = render_workflow(fluxversion, 
                                   full_prompt,
                                   self.resolution, 
                                   self.loras, 
                                   self.upscale_factor,
-                                  seed)
+                                  seed,
+                                  lora_catalog)
 
             workflow_filename = f'flux3_{request_uuid}.json'
-            save_json(workflow_filename, workflow)
 
             new_message = await interaction.response.send_message("Generating new image with updated options...")
             message = await interaction.original_response()
@@ -613,6 +597,7 @@ class PromptModal(Modal, title="Edit Prompt"):
             request_item = RequestItem(
                 id=str(interaction.id),
                 user_id=str(interaction.user.id),
+                is_admin=is_admin_or_bot_manager(interaction.user),
                 channel_id=str(interaction.channel.id),
                 interaction_id=str(interaction.id),
                 original_message_id=str(message.id),
@@ -621,6 +606,7 @@ class PromptModal(Modal, title="Edit Prompt"):
                 loras=self.loras,
                 upscale_factor=self.upscale_factor,
                 workflow_filename=workflow_filename,
+                workflow=workflow,
                 seed=seed
             )
             await interaction.client.subprocess_queue.put(request_item)
@@ -716,11 +702,11 @@ class ReduxModal(Modal, title='Redux Image Generator'):
                 # Create request item
                 workflow_filename = f'redux_{str(uuid.uuid4())}.json'
                 workflow = load_json('Redux.json')
-                save_json(workflow_filename, workflow)
 
                 request_item = ReduxRequestItem(
                     id=str(interaction.id),
                     user_id=str(interaction.user.id),
+                    is_admin=is_admin_or_bot_manager(interaction.user),
                     channel_id=str(interaction.channel.id),
                     interaction_id=str(interaction.id),
                     original_message_id=str(processing_msg.id),
@@ -728,6 +714,7 @@ class ReduxModal(Modal, title='Redux Image Generator'):
                     strength1=strength1,
                     strength2=strength2,
                     workflow_filename=workflow_filename,
+                    workflow=workflow,
                     image1=image1_data,
                     image2=image2_data,
                     image1_filename=image1_filename,
@@ -800,7 +787,7 @@ class ReduxPromptModal(Modal, title='Redux Prompt'):
                     return
 
             # Check for banned words in the prompt
-            is_banned, message = check_banned(str(interaction.user.id), self.prompt.value)
+            is_banned, message = await run_db(check_banned, str(interaction.user.id), self.prompt.value)
             if message:  # If there's a warning or ban message
                 await interaction.response.send_message(message, ephemeral=True)
                 if is_banned:  # If the user is banned, stop processing
@@ -861,9 +848,7 @@ class ReduxPromptModal(Modal, title='Redux Prompt'):
                         resolution=self.resolution
                     )
 
-                    # Save the modified workflow
                     workflow_filename = f'reduxprompt_{request_id}.json'
-                    save_json(workflow_filename, workflow)
 
                     # Create processing message
                     processing_msg = await interaction.followup.send(
@@ -875,6 +860,7 @@ class ReduxPromptModal(Modal, title='Redux Prompt'):
                     request_item = ReduxPromptRequestItem(
                         id=str(interaction.id),
                         user_id=str(interaction.user.id),
+                        is_admin=is_admin_or_bot_manager(interaction.user),
                         channel_id=str(interaction.channel.id),
                         interaction_id=str(interaction.id),
                         original_message_id=str(processing_msg.id),
@@ -884,6 +870,7 @@ class ReduxPromptModal(Modal, title='Redux Prompt'):
                         image_path=image_path,
                         image_filename=attachment.filename,
                         workflow_filename=workflow_filename,
+                        workflow=workflow,
                         seed=seed if seed is not None else None
                     )
 
@@ -1010,10 +997,9 @@ class ReduxProcessingView(View):
             if '44' in workflow:
                 workflow['44']['inputs']['conditioning_to_strength'] = self.strength2
             
-            # Generate a unique workflow file
+            # Generate a unique workflow name
             request_uuid = str(uuid.uuid4())
             workflow_filename = f'redux_{request_uuid}.json'
-            save_json(workflow_filename, workflow)
 
             # Create processing message
             processing_msg = await interaction.channel.send("🔄 Processing Redux generation...")
@@ -1022,6 +1008,7 @@ class ReduxProcessingView(View):
             request_item = ReduxRequestItem(
                 id=str(interaction.id),
                 user_id=str(interaction.user.id),
+                is_admin=is_admin_or_bot_manager(interaction.user),
                 channel_id=str(interaction.channel.id),
                 interaction_id=str(interaction.id),
                 original_message_id=str(processing_msg.id),
@@ -1029,6 +1016,7 @@ class ReduxProcessingView(View):
                 strength1=self.strength1,
                 strength2=self.strength2,
                 workflow_filename=workflow_filename,
+                workflow=workflow,
                 image1=self.image1,
                 image2=self.image2
             )
@@ -1077,25 +1065,25 @@ class ImageControlView(View):
         try:
             await interaction.response.defer(ephemeral=False)
             
-            workflow = load_json(fluxversion)
             request_uuid = str(uuid.uuid4())
             new_seed = generate_random_seed()
             
-            workflow = update_workflow(workflow, 
+            workflow = render_workflow(fluxversion, 
                                     self.original_prompt, 
                                     self.original_resolution, 
                                     self.original_loras, 
                                     self.original_upscale_factor,
-                                    new_seed)
+                                    new_seed,
+                                    interaction.client.lora_catalog)
 
             workflow_filename = f'flux3_{request_uuid}.json'
-            save_json(workflow_filename, workflow)
 
             new_message = await interaction.followup.send("Regenerating image...")
 
             request_item = RequestItem(
                 id=str(interaction.id),
                 user_id=str(interaction.user.id),
+                is_admin=is_admin_or_bot_manager(interaction.user),
                 channel_id=str(interaction.channel.id),
                 interaction_id=str(interaction.id),
                 original_message_id=str(new_message.id),
@@ -1104,6 +1092,7 @@ class ImageControlView(View):
                 loras=self.original_loras,
                 upscale_factor=self.original_upscale_factor,
                 workflow_filename=workflow_filename,
+                workflow=workflow,
                 seed=new_seed
             )
             await interaction.client.subprocess_queue.put(request_item)
@@ -1154,23 +1143,17 @@ class PromptModal(Modal, title="Edit Prompt"):
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            lora_config = load_json('lora.json')
+            lora_catalog = interaction.client.lora_catalog
             base_prompt = re.sub(r'\s*\(Timestamp:.*?\)', '', self.prompt.value)
             
             # Clean base prompt of any existing LoRA trigger words
-            for lora in lora_config['available_loras']:
-                if lora.get('prompt'):
-                    base_prompt = base_prompt.replace(lora['prompt'], '').strip()
+            base_prompt = lora_catalog.remove_legacy_prompt_words(base_prompt)
             
             # Clean up multiple commas and whitespace
             base_prompt = re.sub(r'\s*,\s*,\s*', ', ', base_prompt).strip(' ,')
             
             # Get LoRA trigger words
-            additional_prompts = []
-            for lora in self.loras:
-                lora_info = next((l for l in lora_config['available_loras'] if l['file'] == lora), None)
-                if lora_info and lora_info.get('prompt') and lora_info['prompt'].strip():
-                    additional_prompts.append(lora_info['prompt'].strip())
+            additional_prompts = lora_catalog.legacy_prompt_words(self.loras)
             
             # Join trigger words with commas and append to prompt
             trigger_words = ", ".join(additional_prompts) if additional_prompts else ""
@@ -1181,18 +1164,17 @@ class PromptModal(Modal, title="Edit Prompt"):
             except ValueError:
                 seed = None
 
-            workflow = load_json(fluxversion)
             request_uuid = str(uuid.uuid4())
             
-            workflow = update_workflow(workflow, 
+            workflow = render_workflow(fluxversion, 
                                   full_prompt,
                                   self.resolution, 
                                   self.loras, 
                                   self.upscale_factor,
-                                  seed)
+                                  seed,
+                                  lora_catalog)
 
             workflow_filename = f'flux3_{request_uuid}.json'
-            save_json(workflow_filename, workflow)
 
             new_message = await interaction.response.send_message("Generating new image with updated options...")
             message = await interaction.original_response()
@@ -1200,6 +1182,7 @@ class PromptModal(Modal, title="Edit Prompt"):
             request_item = RequestItem(
                 id=str(interaction.id),
                 user_id=str(interaction.user.id),
+                is_admin=is_admin_or_bot_manager(interaction.user),
                 channel_id=str(interaction.channel.id),
                 interaction_id=str(interaction.id),
                 original_message_id=str(message.id),
@@ -1208,6 +1191,7 @@ class PromptModal(Modal, title="Edit Prompt"):
                 loras=self.loras,
                 upscale_factor=self.upscale_factor,
                 workflow_filename=workflow_filename,
+                workflow=workflow,
                 seed=seed
             )
             await interaction.client.subprocess_queue.put(request_item)
@@ -1514,7 +1498,7 @@ class PulidModal(discord.ui.Modal, title='PuLID Image Generation'):
                 seed = generate_random_seed()
 
             # Check for banned words in the prompt
-            is_banned, message = check_banned(str(interaction.user.id), self.prompt.value)
+            is_banned, message = await run_db(check_banned, str(interaction.user.id), self.prompt.value)
             if message:  # If there's a warning or ban message
                 await interaction.response.send_message(message, ephemeral=True)
                 if is_banned:  # If the user is banned, stop processing
@@ -1598,9 +1582,8 @@ class PulidModal(discord.ui.Modal, title='PuLID Image Generation'):
                     seed=seed
                 )
 
-                # Save the modified workflow
+                # The workflow travels with the request; its name marks it as PuLID
                 workflow_filename = f'pulid_{request_id}.json'
-                save_json(workflow_filename, workflow)
 
                 # Process the request
                 await process_image_request(
@@ -3,17 +3,37 @@ from aiohttp import web
 import logging
 import json
 import io
-from Main.database import add_to_history
-from Main.utils import load_json
+from config import IMAGE_SPOOL_DIR, UPLOAD_SPOOL_THRESHOLD, UPLOAD_MAX_SIZE
+from Main.database import add_to_history, run_db
+from Main.image_spool import UploadTooLarge, in_spool, remove_spooled, spool_upload
 from .models import RequestItem, ReduxRequestItem, ReduxPromptRequestItem
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 import asyncio
 from .message_constants import STATUS_MESSAGES
 from .views import ImageControlView, ReduxImageView, PuLIDImageView
 
 logger = logging.getLogger(__name__)
 
+# Text fields of a /send_image request; anything longer is rejected
+MAX_FIELD_SIZE = 64 * 1024
+
+class FieldTooLarge(Exception):
+    """Raised when a text field of a multipart request is longer than MAX_FIELD_SIZE"""
+
+async def read_field(part, limit: int = MAX_FIELD_SIZE) -> str:
+    """The text of a multipart field, read in chunks and at most limit bytes long"""
+    data = bytearray()
+    while True:
+        chunk = await part.read_chunk()
+        if not chunk:
+            break
+        data.extend(chunk)
+        if len(data) > limit:
+            raise FieldTooLarge(f"Field {part.name} is longer than {limit} bytes")
+    return data.decode(part.get_charset(default='utf-8'))
+
 async def handle_generated_image(request):
+    image_file = None
     try:
         logger.debug("Received request to handle_generated_image")
         reader = await request.multipart()
@@ -29,155 +49,203 @@ async def handle_generated_image(request):
             'loras': None,
             'upscale_factor': None,
             'seed': None,
-            'image_data': None
+            'image_path': None,
+            'image_file': None
         }
 
-        # Read multipart data
-        async for part in reader:
-            if part.name == 'image_data':
-                request_data['image_data'] = await part.read(decode=False)
-            elif part.name == 'loras':
-                request_data['loras'] = json.loads(await part.text())
-            elif part.name == 'upscale_factor':
-                try:
-                    request_data['upscale_factor'] = int(await part.text())
-                except (ValueError, TypeError):
-                    request_data['upscale_factor'] = 1
-            else:
-                request_data[part.name] = await part.text()
-
-        # Validate required fields
-        required_fields = [
-            'request_id', 'user_id', 'channel_id', 'interaction_id',
-            'original_message_id', 'prompt', 'resolution', 'image_data'
-        ]
-        
-        missing_fields = [field for field in required_fields if not request_data[field]]
-        if missing_fields:
-            logger.warning(f"Missing required fields: {', '.join(missing_fields)}")
-            return web.Response(text="Missing required data", status=400)
+        # Read multipart data in whatever order the parts come. comfygen.py sends the
+        # path of its spooled image; an 'image_data' part with the image itself is
+        # streamed into a temporary file, on disk once it outgrows UPLOAD_SPOOL_THRESHOLD
+        try:
+            async for part in reader:
+                if part.name == 'image_data':
+                    if image_file is not None:
+                        return web.Response(text="More than one image", status=400)
+                    image_file = await spool_upload(part, IMAGE_SPOOL_DIR, UPLOAD_SPOOL_THRESHOLD, UPLOAD_MAX_SIZE)
+                    request_data['image_file'] = image_file
+                elif part.name == 'loras':
+                    request_data['loras'] = json.loads(await read_field(part))
+                elif part.name == 'upscale_factor':
+                    try:
+                        request_data['upscale_factor'] = int(await read_field(part))
+                    except (ValueError, TypeError):
+                        request_data['upscale_factor'] = 1
+                elif part.name in request_data:
+                    request_data[part.name] = await read_field(part)
+                else:
+                    logger.warning(f"Ignoring unexpected field {part.name}")
+                    await part.release()
+        except UploadTooLarge as e:
+            logger.warning(f"Rejected image upload: {str(e)}")
+            return web.Response(text="Image too large", status=413)
+        except FieldTooLarge as e:
+            logger.warning(f"Rejected request: {str(e)}")
+            return web.Response(text="Field too large", status=413)
+        except json.JSONDecodeError:
+            return web.Response(text="Invalid loras", status=400)
 
-        # Check if request is still pending
-        if request_data['request_id'] not in request.app['bot'].pending_requests:
-            logger.warning(f"Received response for unknown request_id: {request_data['request_id']}")
-            return web.Response(text="Unknown request", status=404)
+        status, text = await process_generated_image(request.app['bot'], request_data)
+        return web.Response(text=text, status=status)
 
-        # Get request item to check type
-        request_item = request.app['bot'].pending_requests[request_data['request_id']]
+    except Exception as e:
+        logger.error(f"Error in handle_generated_image: {str(e)}", exc_info=True)
+        return web.Response(text=f"Internal server error: {str(e)}", status=500)
+    finally:
+        if image_file is not None:
+            image_file.close()
 
-        try:
-            # Fetch necessary Discord objects
-            user = await request.app['bot'].fetch_user(int(request_data['user_id']))
-            channel = await request.app['bot'].fetch_channel(int(request_data['channel_id']))
-            guild = channel.guild
-            member = await guild.fetch_member(int(request_data['user_id']))
-            
-            user_name = user.display_name if user else "Unknown User"
-            user_color = member.color.value if member.color.value != 0 else 0x5DADEC
-
-            # Create embed
-            embed = discord.Embed(
-                title=f"Image generated by {user_name}",
-                description=request_data['prompt'],
-                color=user_color
-            )
+async def process_generated_image(bot, request_data: Dict[str, Any]) -> Tuple[int, str]:
+    """
+    Validate a finished image handed over by comfygen.py and deliver it. Shared by the
+    /send_image endpoint and the bot's callback socket; returns an HTTP (status, text).
+    """
+    # Validate required fields
+    required_fields = [
+        'request_id', 'user_id', 'channel_id', 'interaction_id',
+        'original_message_id', 'prompt', 'resolution'
+    ]
 
-            # Add resolution field
-            if request_data['upscale_factor'] > 1:
-                if request_data['upscaled_resolution'] and request_data['upscaled_resolution'] != "Unknown":
-                    embed.add_field(
-                        name="Resolution",
-                        value=f"{request_data['resolution']} → {request_data['upscaled_resolution']} (CR Upscaled {request_data['upscale_factor']}x)",
-                        inline=True
-                    )
-                else:
-                    embed.add_field(
-                        name="Resolution",
-                        value=f"{request_data['resolution']} (CR Upscaled {request_data['upscale_factor']}x)",
-                        inline=True
-                    )
-            else:
-                embed.add_field(name="Resolution", value=request_data['resolution'], inline=True)
-
-            # Handle LoRA information for standard requests only
-            if not isinstance(request_item, (ReduxRequestItem, ReduxPromptRequestItem)):
-                lora_config = load_json('lora.json')
-                lora_names = []
-                if request_data['loras']:
-                    for lora_file in request_data['loras']:
-                        lora_info = next((lora for lora in lora_config['available_loras'] 
-                                        if lora['file'] == lora_file), None)
-                        if lora_info:
-                            lora_names.append(lora_info['name'])
-                        else:
-                            lora_names.append(lora_file)
-
-                embed.add_field(
-                    name="LoRAs",
-                    value=", ".join(lora_names) if lora_names else "None",
-                    inline=True
-                )
-
-            if request_data['seed'] is not None:
-                embed.add_field(name="Seed", value=str(request_data['seed']), inline=True)
-
-            # Generate image filename and create file
-            image_filename = f"generated_image_{request_data['request_id']}.png"
-            image_file = discord.File(io.BytesIO(request_data['image_data']), image_filename)
-
-            # Select appropriate view based on request type
-            if isinstance(request_item, (ReduxRequestItem, ReduxPromptRequestItem)):
-                view = ReduxImageView()
-            elif request_item.workflow_filename and request_item.workflow_filename.lower().startswith('pulid'):
-                view = PuLIDImageView()
-            else:
-                view = ImageControlView(
-                    request.app['bot'],
-                    request_data['prompt'],
-                    image_filename,
-                    request_data['resolution'],
-                    request_data['loras'],
-                    request_data['upscale_factor'],
-                    request_data['seed']
-                )
-
-            # Update the original message
-            channel = await request.app['bot'].fetch_channel(int(request_data['channel_id']))
-            original_message = await channel.fetch_message(int(request_data['original_message_id']))
-            await original_message.edit(content=None, embed=embed, attachments=[image_file], view=view)
-            request.app['bot'].add_view(view, message_id=original_message.id)
-
-            # Add to history
-            add_to_history(
-                request_data['user_id'],
-                request_data['prompt'],
-                None,  # workflow
-                image_filename,
-                request_data['resolution'],
-                request_data['loras'],
-                request_data['upscale_factor']
-            )
+    missing_fields = [field for field in required_fields if not request_data.get(field)]
+    if not request_data.get('image_path') and request_data.get('image_file') is None:
+        missing_fields.append('image_data')
+    if missing_fields:
+        logger.warning(f"Missing required fields: {', '.join(missing_fields)}")
+        return 400, "Missing required data"
 
-            # Remove from pending requests
-            if request_data['request_id'] in request.app['bot'].pending_requests:
-                del request.app['bot'].pending_requests[request_data['request_id']]
+    image_path = request_data.get('image_path')
+    if image_path and not in_spool(image_path, IMAGE_SPOOL_DIR):
+        logger.warning(f"Rejected image path outside the spool directory: {image_path}")
+        return 400, "Invalid image path"
 
-            logger.info(f"Successfully processed image for user {request_data['user_id']}")
-            return web.Response(text="Success")
+    # Check if request is still pending
+    if request_data['request_id'] not in bot.pending_requests:
+        logger.warning(f"Received response for unknown request_id: {request_data['request_id']}")
+        return 404, "Unknown request"
 
-        except discord.NotFound:
-            logger.error("Channel or message not found")
-            return web.Response(text="Channel or message not found", status=404)
-        except discord.Forbidden:
-            logger.error("Bot lacks required permissions")
-            return web.Response(text="Permission denied", status=403)
-        except Exception as e:
-            logger.error(f"Error updating message: {str(e)}")
-            return web.Response(text=f"Error updating message: {str(e)}", status=500)
+    try:
+        await deliver_generated_image(bot, request_data)
+        if image_path:
+            await asyncio.to_thread(remove_spooled, image_path)
+        return 200, "Success"
 
+    except discord.NotFound:
+        logger.error("Channel or message not found")
+        return 404, "Channel or message not found"
+    except discord.Forbidden:
+        logger.error("Bot lacks required permissions")
+        return 403, "Permission denied"
     except Exception as e:
-        logger.error(f"Error in handle_generated_image: {str(e)}", exc_info=True)
-        return web.Response(text=f"Internal server error: {str(e)}", status=500)
+        logger.error(f"Error updating message: {str(e)}")
+        return 500, f"Error updating message: {str(e)}"
+
+async def deliver_generated_image(bot, request_data: Dict[str, Any], workflow: Optional[Dict] = None):
+    """
+    Post a finished image to the request's Discord message and record it in history.
+
+    Used by the /send_image endpoint and by the in-process ComfyUI workers. The image
+    is uploaded from request_data['image_path'], a spooled file, or from the file
+    object in request_data['image_file']. The workflow recorded in history defaults to
+    the request's own. Discord errors (NotFound, Forbidden) are left for the caller to
+    report.
+    """
+    request_item = bot.pending_requests[request_data['request_id']]
+    # comfygen.py doesn't send the workflow back, so its results record the one the
+    # request was queued with
+    if workflow is None:
+        workflow = request_item.workflow
+
+    # Cached Discord objects; the message edit is usually the only API call
+    channel = await bot.resolver.channel(request_data['channel_id'])
+    user_name, user_color = await bot.resolver.author(channel, request_data['user_id'])
+
+    # Create embed
+    embed = discord.Embed(
+        title=f"Image generated by {user_name}",
+        description=request_data['prompt'],
+        color=user_color
+    )
+
+    # Add resolution field
+    if request_data['upscale_factor'] > 1:
+        if request_data['upscaled_resolution'] and request_data['upscaled_resolution'] != "Unknown":
+            embed.add_field(
+                name="Resolution",
+                value=f"{request_data['resolution']} → {request_data['upscaled_resolution']} (CR Upscaled {request_data['upscale_factor']}x)",
+                inline=True
+            )
+        else:
+            embed.add_field(
+                name="Resolution",
+                value=f"{request_data['resolution']} (CR Upscaled {request_data['upscale_factor']}x)",
+                inline=True
+            )
+    else:
+        embed.add_field(name="Resolution", value=request_data['resolution'], inline=True)
+
+    # Handle LoRA information for standard requests only
+    if not isinstance(request_item, (ReduxRequestItem, ReduxPromptRequestItem)):
+        lora_names = [bot.lora_catalog.display_name(lora_file) for lora_file in request_data['loras'] or []]
+
+        embed.add_field(
+            name="LoRAs",
+            value=", ".join(lora_names) if lora_names else "None",
+            inline=True
+        )
+
+    if request_data['seed'] is not None:
+        embed.add_field(name="Seed", value=str(request_data['seed']), inline=True)
+
+    # Generate image filename and create file
+    image_filename = f"generated_image_{request_data['request_id']}.png"
+    if request_data.get('image_path'):
+        # Streamed from disk by the upload
+        image_file = discord.File(request_data['image_path'], image_filename)
+    else:
+        image_file = discord.File(request_data['image_file'], image_filename)
+
+    # Select appropriate view based on request type
+    if isinstance(request_item, (ReduxRequestItem, ReduxPromptRequestItem)):
+        view = ReduxImageView()
+    elif request_item.workflow_filename and request_item.workflow_filename.lower().startswith('pulid'):
+        view = PuLIDImageView()
+    else:
+        view = ImageControlView(
+            bot,
+            request_data['prompt'],
+            image_filename,
+            request_data['resolution'],
+            request_data['loras'],
+            request_data['upscale_factor'],
+            request_data['seed']
+        )
+
+    # A progress or preview edit still on its way would replace the image
+    await bot.progress.finish(request_data['original_message_id'])
+    if bot.previews:
+        await bot.previews.finish(request_data['request_id'])
+
+    # Update the original message
+    original_message = channel.get_partial_message(int(request_data['original_message_id']))
+    await original_message.edit(content=None, embed=embed, attachments=[image_file], view=view)
+    bot.add_view(view, message_id=original_message.id)
+
+    # Add to history
+    await run_db(
+        add_to_history,
+        request_data['user_id'],
+        request_data['prompt'],
+        workflow,
+        image_filename,
+        request_data['resolution'],
+        request_data['loras'],
+        request_data['upscale_factor']
+    )
+
+    # Remove from pending requests
+    if request_data['request_id'] in bot.pending_requests:
+        del bot.pending_requests[request_data['request_id']]
+
+    logger.info(f"Successfully processed image for user {request_data['user_id']}")
 
 async def update_progress(request):
     try:
@@ -200,10 +268,8 @@ async def update_progress(request):
         return web.Response(text="Internal server error", status=500)
 
 async def update_progress_message(bot, request_item, progress_data: Dict[str, Any]):
+    """Queue the request's progress text with the bot's ProgressDispatcher"""
     try:
-        channel = await bot.fetch_channel(int(request_item.channel_id))
-        message = await channel.fetch_message(int(request_item.original_message_id))
-        
         status = progress_data.get('status', '')
         progress_message = progress_data.get('message', 'Processing...')
         progress = progress_data.get('progress', 0)
@@ -217,20 +283,53 @@ async def update_progress_message(bot, request_item, progress_data: Dict[str, An
         # Format message based on status
         if status == 'generating':
             formatted_message = f"{status_info['emoji']} {status_info['message']} {progress}%"
+        elif status == 'queued':
+            formatted_message = f"{status_info['emoji']} {status_info['message']} position {progress_data.get('position')} of {progress_data.get('queue_size')}"
         elif status == 'error':
             formatted_message = f"{status_info['emoji']} {status_info['message']} {progress_message}"
         else:
             formatted_message = f"{status_info['emoji']} {status_info['message']}"
 
-        await message.edit(content=formatted_message)
-        logger.debug(f"Updated progress message: {formatted_message}")
-        
+        bot.progress.update(request_item.channel_id, request_item.original_message_id, formatted_message)
+        if status == 'error':
+            # Nothing follows an error
+            await bot.progress.finish(request_item.original_message_id, flush=True)
+
+    except Exception as e:
+        logger.error(f"Error updating progress message: {str(e)}")
+
+async def update_preview(request):
+    """Receives a preview of the image being sampled from comfygen.py as the request body"""
+    try:
+        bot = request.app['bot']
+        request_id = request.query.get('request_id')
+        if not request_id:
+            return web.Response(text="Missing request_id", status=400)
+        if request_id not in bot.pending_requests:
+            return web.Response(text="Unknown request_id", status=404)
+        if not bot.previews:
+            return web.Response(text="Previews are disabled", status=404)
+
+        bot.previews.publish(request_id, bot.pending_requests[request_id].channel_id, await request.read())
+        return web.Response(text="Preview received")
+    except Exception as e:
+        logger.error(f"Error in update_preview: {str(e)}", exc_info=True)
+        return web.Response(text="Internal server error", status=500)
+
+async def update_preview_message(bot, request_item, preview: bytes):
+    """Attach a preview JPEG to a request's progress message, leaving its text alone"""
+    try:
+        # A partial message edits without fetching the channel and message first
+        message = bot.get_partial_messageable(int(request_item.channel_id)).get_partial_message(
+            int(request_item.original_message_id)
+        )
+        await message.edit(attachments=[discord.File(io.BytesIO(preview), 'preview.jpg')])
     except discord.errors.NotFound:
         logger.warning(f"Message {request_item.original_message_id} not found")
     except discord.errors.Forbidden:
         logger.warning("Bot lacks permission to edit message")
     except Exception as e:
-        logger.error(f"Error updating progress message: {str(e)}")
+        logger.error(f"Error updating preview: {str(e)}")
 
 async def check_timeout(bot, request_id: str, timeout: int = 300):
     """
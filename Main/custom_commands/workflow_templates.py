@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from Main.lora_catalog import LoraCatalog
+from Main.workflow_store import model_signature
+from Main.utils import load_json
+
+logger = logging.getLogger(__name__)
+
+# Where each request parameter lives in the Flux workflows: slot -> (node id, input name).
+# The LoRA slot has no input name because it owns every lora_* input of its node.
+FLUX_SLOTS: Dict[str, Tuple[str, Optional[str]]] = {
+    'prompt': ('69', 'prompt'),
+    'resolution': ('258', 'ratio_selected'),
+    'loras': ('271', None),
+    'upscale_factor': ('279', 'rescale_factor'),
+    'seed': ('198:2', 'noise_seed'),
+    'guidance': ('198:4', 'guidance')
+}
+
+DEFAULT_GUIDANCE = 3.5
+
+# Nodes every Flux workflow must have
+REQUIRED_NODES = ['69', '258', '271']
+
+def validate_workflow(workflow):
+    """Validates the workflow structure with enhanced checks"""
+    if not isinstance(workflow, dict):
+        raise ValueError("Workflow must be a dictionary")
+
+    # Check for required nodes
+    missing_nodes = [node for node in REQUIRED_NODES if node not in workflow]
+    if missing_nodes:
+        raise ValueError(f"Missing required nodes in workflow: {missing_nodes}")
+
+    # Validate node structure
+    for node_id, node in workflow.items():
+        if not isinstance(node, dict):
+            raise ValueError(f"Node {node_id} must be a dictionary")
+
+        if 'inputs' not in node:
+            raise ValueError(f"Node {node_id} is missing 'inputs' field")
+
+        if not isinstance(node.get('inputs'), dict):
+            raise ValueError(f"Node {node_id} 'inputs' must be a dictionary")
+
+        if 'class_type' not in node:
+            raise ValueError(f"Node {node_id} is missing 'class_type' field")
+
+    logger.debug(f"Workflow validation passed: {len(workflow)} nodes checked")
+    return True
+
+def lora_strength(lora_entry: Dict[str, Any], lora_count: int, scale_multiple: bool = True) -> float:
+    """Strength for a LoRA; with several LoRAs selected it is capped at 0.5 unless scale_multiple is off"""
+    base_strength = float(lora_entry.get('weight', 1.0))
+    if scale_multiple and lora_count > 1:
+        return min(base_strength, 0.5)
+    return base_strength
+
+class WorkflowTemplate:
+    """
+    A workflow validated once, with the locations of its request parameters recorded.
+
+    The base graph is shared by every payload rendered from the template and must never
+    be modified. render() copies only the nodes it patches; all other nodes in the
+    returned workflow are the base's own objects.
+
+    With validate=False the graph is not checked and only the slots it has are
+    patched, as comfygen always did; that is all a PuLID graph has room for. Such a
+    template only looks its slots up, so building one costs no more than patching them.
+    """
+
+    def __init__(self, workflow: Dict[str, Any], name: str = 'workflow', validate: bool = True):
+        if validate:
+            validate_workflow(workflow)
+        self.name = name
+        self.base = workflow
+        self.slots: Dict[str, Tuple[str, Optional[str]]] = {}
+        for slot, (node_id, input_name) in FLUX_SLOTS.items():
+            if node_id in workflow:
+                self.slots[slot] = (node_id, input_name)
+            elif validate and slot != 'guidance':
+                logger.warning(f"Node {node_id} ({slot} node) not found in {name}")
+
+        # The LoRA loader inputs without any lora_* entries, copied once per render
+        self.lora_inputs: Dict[str, Any] = {}
+        if 'loras' in self.slots:
+            loader_inputs = workflow[self.slots['loras'][0]]['inputs']
+            self.lora_inputs = {key: value for key, value in loader_inputs.items() if not key.startswith('lora_')}
+
+    def render(self, prompt: str, resolution: str, loras: List[str], upscale_factor: int,
+               seed: Optional[int], lora_info: Dict[str, Dict[str, Any]],
+               scale_multiple_loras: bool = True, guidance: Optional[float] = DEFAULT_GUIDANCE) -> Dict[str, Any]:
+        """
+        Build a request workflow from the template.
+
+        lora_info maps LoRA file names to their lora.json entries. Pass guidance=None to
+        keep the template's guidance value.
+        """
+        workflow = dict(self.base)
+
+        def patch_node(node_id: str, inputs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+            node = workflow[node_id]
+            if node is self.base[node_id]:
+                node = dict(node)
+                node['inputs'] = dict(node['inputs']) if inputs is None else inputs
+                workflow[node_id] = node
+            return node['inputs']
+
+        values = {
+            'prompt': prompt,
+            'resolution': resolution,
+            'upscale_factor': upscale_factor,
+            'seed': seed
+        }
+        if guidance is not None:
+            values['guidance'] = guidance
+        for slot, value in values.items():
+            if slot in self.slots:
+                node_id, input_name = self.slots[slot]
+                patch_node(node_id)[input_name] = value
+
+        if 'loras' in self.slots:
+            lora_loader = patch_node(self.slots['loras'][0], dict(self.lora_inputs))
+            for i, lora in enumerate(loras, start=1):
+                if lora in lora_info:
+                    strength = lora_strength(lora_info[lora], len(loras), scale_multiple_loras)
+                    lora_loader[f'lora_{i}'] = {
+                        'on': True,
+                        'lora': lora,
+                        'strength': strength
+                    }
+                    logger.debug(f"Added LoRA {lora} with strength {strength}")
+                else:
+                    logger.warning(f"LoRA {lora} not found in configuration")
+
+        return workflow
+
+class _DatasetCache:
+    """Parsed DataSets files, reloaded only when the file on disk changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Tuple[float, int], Any]] = {}
+
+    @staticmethod
+    def _resolve(filename: str) -> str:
+        for path in (os.path.join('Main', 'Datasets', filename),
+                     os.path.join('Main', 'DataSets', filename),
+                     filename):
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"JSON file not found: {filename}")
+
+    def get(self, filename: str, build=None):
+        path = self._resolve(filename)
+        stat = os.stat(path)
+        version = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+        data = load_json(filename)
+        value = build(data) if build else data
+        with self._lock:
+            self._entries[filename] = (version, value)
+        logger.debug(f"Compiled {filename}")
+        return value
+
+_cache = _DatasetCache()
+# Kept apart from _cache, whose entries for the same files are templates
+_models_cache = _DatasetCache()
+
+def get_workflow_template(workflow_filename: str) -> WorkflowTemplate:
+    """The compiled template for a DataSets workflow, recompiled when the file changes"""
+    return _cache.get(workflow_filename, lambda workflow: WorkflowTemplate(workflow, workflow_filename))
+
+def get_workflow_models(workflow_filename: str) -> str:
+    """Model files of a DataSets workflow (see model_signature), reread when the file changes"""
+    return _models_cache.get(workflow_filename, model_signature)
+
+def get_lora_info() -> Dict[str, Dict[str, Any]]:
+    """lora.json entries keyed by LoRA file name, for code that runs without the bot's catalog"""
+    return _cache.get('lora.json', LoraCatalog.from_config).by_file
+
+def render_workflow(workflow_filename: str, prompt: str, resolution: str, loras: List[str],
+                    upscale_factor: int, seed: Optional[int],
+                    lora_catalog: Optional[LoraCatalog] = None) -> Dict[str, Any]:
+    """Build a request workflow from a cached DataSets template"""
+    try:
+        lora_info = lora_catalog.by_file if lora_catalog is not None else get_lora_info()
+        return get_workflow_template(workflow_filename).render(
+            prompt, resolution, loras, upscale_factor, seed, lora_info
+        )
+    except Exception as e:
+        logger.error(f"Error rendering workflow {workflow_filename}: {str(e)}", exc_info=True)
+        raise ValueError(f"Failed to update workflow: {str(e)}")
@@ -1,15 +1,132 @@
+import asyncio
 import sqlite3
 import json
 import logging
 import time
 import os
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Optional
+
+from Main.moderation import BannedWordMatcher, normalize_text
+from Main.workflow_store import apply_delta, diff_workflow, normalize_workflow, workflow_shape
 
 logger = logging.getLogger(__name__)
 
-DB_NAME = 'image_history.db'
+DB_NAME = os.getenv('IMAGE_HISTORY_DB', 'image_history.db')
 BANNED_WORDS_FILE = os.path.join(os.path.dirname(__file__), 'banned.json')
 
+# Pragmas applied to the shared connection. WAL lets readers (including other
+# processes such as comfygen.py) proceed while a write is in progress.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=67108864"
+)
+
+# Schema changes applied after init_db has created the tables. Each entry moves the
+# database to the given PRAGMA user_version; never edit an entry once it has shipped,
+# add a new one instead.
+MIGRATIONS = [
+    (1, "Index image_history by image_filename and by (user_id, timestamp)", [
+        "CREATE INDEX IF NOT EXISTS idx_image_history_filename ON image_history (image_filename)",
+        "CREATE INDEX IF NOT EXISTS idx_image_history_user_timestamp ON image_history (user_id, timestamp)"
+    ]),
+    (2, "Store workflows once by content hash as a shared template plus a delta", [
+        """CREATE TABLE IF NOT EXISTS workflow_templates
+           (hash TEXT PRIMARY KEY,
+            shape TEXT NOT NULL,
+            workflow JSON NOT NULL)""",
+        "CREATE INDEX IF NOT EXISTS idx_workflow_templates_shape ON workflow_templates (shape)",
+        """CREATE TABLE IF NOT EXISTS workflows
+           (hash TEXT PRIMARY KEY,
+            template_hash TEXT NOT NULL REFERENCES workflow_templates (hash),
+            delta JSON NOT NULL)""",
+        "ALTER TABLE image_history ADD COLUMN workflow_hash TEXT"
+    ]),
+]
+
+# One connection per process, shared by every function below. sqlite3 keeps the
+# prepared statements of a connection in its statement cache, so repeated queries
+# are not re-parsed.
+_connection: Optional[sqlite3.Connection] = None
+_connection_lock = threading.RLock()
+
+# Workflow templates already loaded from the database, by shape. Only used while
+# holding the connection lock.
+_workflow_templates = {}
+
+# Async callers run their queries on this thread so the event loop never blocks on disk
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+
+# Compiled banned word list, rebuilt whenever the list changes
+_banned_matcher: Optional[BannedWordMatcher] = None
+_banned_matcher_lock = threading.Lock()
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, cached_statements=256)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    logger.debug(f"Opened database connection to {DB_NAME}")
+    return conn
+
+@contextmanager
+def _db():
+    """Yield the shared connection, holding it for the duration of the block"""
+    global _connection
+    with _connection_lock:
+        if _connection is None:
+            _connection = _open_connection()
+        try:
+            yield _connection
+        except Exception:
+            _connection.rollback()
+            # A rolled back transaction may have inserted a template that is now cached
+            _workflow_templates.clear()
+            raise
+
+def close_db():
+    """Close the shared connection; it is reopened on next use"""
+    global _connection
+    with _connection_lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+            logger.debug("Closed database connection")
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate_db(conn: sqlite3.Connection) -> int:
+    """Apply pending MIGRATIONS in order, each in its own transaction; returns the schema version"""
+    version = get_schema_version(conn)
+    for target_version, description, statements in MIGRATIONS:
+        if target_version <= version:
+            continue
+        logger.info(f"Migrating {DB_NAME} to schema version {target_version}: {description}")
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(target_version)}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Migration to schema version {target_version} failed: {str(e)}")
+            raise
+        version = target_version
+    return version
+
+async def run_db(func, *args, **kwargs):
+    """Run a database function on the database thread and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, partial(func, *args, **kwargs))
+
 def load_banned_words_from_json():
     try:
         with open(BANNED_WORDS_FILE, 'r') as f:
@@ -28,91 +145,132 @@ def save_banned_words_to_json(words):
         logger.error(f"Error saving banned words to JSON: {e}")
 
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    # Existing tables remain the same
-    c.execute('''CREATE TABLE IF NOT EXISTS image_history
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id TEXT,
-                  prompt TEXT,
-                  workflow JSON,
-                  image_filename TEXT,
-                  resolution TEXT,
-                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                  loras JSON,
-                  upscale_factor INTEGER)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS banned_users
-                 (user_id TEXT PRIMARY KEY,
-                  reason TEXT,
-                  banned_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # New tables for banned words and warnings
-    c.execute('''CREATE TABLE IF NOT EXISTS banned_words
-                 (word TEXT PRIMARY KEY,
-                  added_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-                  
-    c.execute('''CREATE TABLE IF NOT EXISTS user_warnings
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id TEXT,
-                  prompt TEXT,
-                  word TEXT,
-                  warned_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-    
-    conn.commit()
-    
-    # Load banned words from JSON and sync with database
-    banned_words = load_banned_words_from_json()
-    for word in banned_words:
-        c.execute("INSERT OR IGNORE INTO banned_words (word) VALUES (?)", (word,))
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        c = conn.cursor()
+        # Existing tables remain the same
+        c.execute('''CREATE TABLE IF NOT EXISTS image_history
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id TEXT,
+                      prompt TEXT,
+                      workflow JSON,
+                      image_filename TEXT,
+                      resolution TEXT,
+                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                      loras JSON,
+                      upscale_factor INTEGER)''')
+
+        c.execute('''CREATE TABLE IF NOT EXISTS banned_users
+                     (user_id TEXT PRIMARY KEY,
+                      reason TEXT,
+                      banned_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+        # New tables for banned words and warnings
+        c.execute('''CREATE TABLE IF NOT EXISTS banned_words
+                     (word TEXT PRIMARY KEY,
+                      added_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+        c.execute('''CREATE TABLE IF NOT EXISTS user_warnings
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id TEXT,
+                      prompt TEXT,
+                      word TEXT,
+                      warned_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+
+        conn.commit()
+
+        # Load banned words from JSON and sync with database
+        banned_words = load_banned_words_from_json()
+        for word in banned_words:
+            c.execute("INSERT OR IGNORE INTO banned_words (word) VALUES (?)", (word,))
+        conn.commit()
+
+        migrate_db(conn)
+    rebuild_banned_matcher()
+
+def _template_for(conn: sqlite3.Connection, shape: str, workflow):
+    """The (hash, workflow) template for a shape; workflow becomes the template if there is none"""
+    template = _workflow_templates.get(shape)
+    if template is None:
+        row = conn.execute(
+            "SELECT hash, workflow FROM workflow_templates WHERE shape = ? ORDER BY rowid LIMIT 1", (shape,)
+        ).fetchone()
+        if row:
+            template = (row[0], json.loads(row[1]))
+        else:
+            template_hash, template_workflow = normalize_workflow(workflow)
+            conn.execute("INSERT OR IGNORE INTO workflow_templates (hash, shape, workflow) VALUES (?, ?, ?)",
+                         (template_hash, shape, json.dumps(template_workflow)))
+            template = (template_hash, template_workflow)
+            logger.debug(f"Stored new workflow template {template_hash[:12]}")
+        _workflow_templates[shape] = template
+    return template
+
+def store_workflow(conn: sqlite3.Connection, workflow) -> Optional[str]:
+    """Store a workflow as template plus delta, once per distinct content; returns its hash"""
+    if not isinstance(workflow, dict) or not workflow:
+        return None
+    workflow_hash, workflow = normalize_workflow(workflow)
+    if conn.execute("SELECT 1 FROM workflows WHERE hash = ?", (workflow_hash,)).fetchone():
+        return workflow_hash
+    template_hash, template = _template_for(conn, workflow_shape(workflow), workflow)
+    conn.execute("INSERT INTO workflows (hash, template_hash, delta) VALUES (?, ?, ?)",
+                 (workflow_hash, template_hash, json.dumps(diff_workflow(template, workflow))))
+    return workflow_hash
+
+def load_workflow(conn: sqlite3.Connection, workflow_hash: str):
+    row = conn.execute(
+        "SELECT t.workflow, w.delta FROM workflows w JOIN workflow_templates t ON t.hash = w.template_hash "
+        "WHERE w.hash = ?", (workflow_hash,)
+    ).fetchone()
+    if not row:
+        return None
+    return apply_delta(json.loads(row[0]), json.loads(row[1]))
 
 def add_to_history(user_id, prompt, workflow, image_filename, resolution, loras, upscale_factor):
     if image_filename.startswith('ComfyUI'):
         logger.debug(f"Skipping temporary file: {image_filename}")
         return
 
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    c.execute("""
-        SELECT id FROM image_history 
-        WHERE user_id = ? AND prompt = ? AND 
-        datetime(timestamp, 'unixepoch') = datetime(?, 'unixepoch')
-    """, (user_id, prompt, int(time.time())))
-    
-    existing_entry = c.fetchone()
-    
-    if existing_entry:
-        logger.debug(f"Skipping duplicate entry for user_id={user_id}, prompt={prompt}")
-    else:
-        # Ensure loras is a list of up to 25 items
-        loras_list = loras[:25] if isinstance(loras, list) else [loras]
-        loras_json = json.dumps(loras_list)
-        
-        c.execute("INSERT INTO image_history (user_id, prompt, workflow, image_filename, resolution, loras, upscale_factor) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                  (user_id, prompt, json.dumps(workflow), image_filename, resolution, loras_json, upscale_factor))
-        conn.commit()
-        logger.debug(f"Added to history: user_id={user_id}, prompt={prompt}, image_filename={image_filename}, resolution={resolution}, loras={loras_json}, upscale_factor={upscale_factor}")
-    
-    conn.close()
+    with _db() as conn:
+        c = conn.cursor()
+
+        # The same image recorded again within a second; distinct images from the same
+        # prompt in that second have their own filenames and are all kept. Timestamps
+        # are stored as CURRENT_TIMESTAMP text, compared against a constant
+        c.execute("""
+            SELECT id FROM image_history
+            WHERE image_filename = ? AND user_id = ? AND timestamp = datetime(?, 'unixepoch') AND prompt = ?
+        """, (image_filename, user_id, int(time.time()), prompt))
+
+        existing_entry = c.fetchone()
+
+        if existing_entry:
+            logger.debug(f"Skipping duplicate entry for user_id={user_id}, prompt={prompt}")
+        else:
+            # Ensure loras is a list of up to 25 items
+            loras_list = loras[:25] if isinstance(loras, list) else [loras]
+            loras_json = json.dumps(loras_list)
+
+            # The graph goes to the workflow store; the legacy workflow column stays NULL
+            workflow_hash = store_workflow(conn, workflow)
+            c.execute("INSERT INTO image_history (user_id, prompt, image_filename, resolution, loras, upscale_factor, workflow_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                      (user_id, prompt, image_filename, resolution, loras_json, upscale_factor, workflow_hash))
+            conn.commit()
+            logger.debug(f"Added to history: user_id={user_id}, prompt={prompt}, image_filename={image_filename}, resolution={resolution}, loras={loras_json}, upscale_factor={upscale_factor}")
 
 def get_user_history(user_id, limit=10):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM image_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
-    history = c.fetchall()
-    conn.close()
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM image_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit))
+        history = c.fetchall()
     logger.debug(f"Retrieved history for user_id={user_id}: {len(history)} entries")
     return history
 
 def get_image_info(image_filename):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM image_history WHERE image_filename = ?", (image_filename,))
-    info = c.fetchone()
-    conn.close()
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM image_history WHERE image_filename = ?", (image_filename,))
+        info = c.fetchone()
     if info:
         loras = json.loads(info[7])
         logger.debug(f"Image info found for {image_filename}: {info}")
@@ -126,157 +284,222 @@ def get_image_info(image_filename):
         logger.warning(f"No image info found for {image_filename}")
     return None
 
+def get_workflow(image_filename):
+    """The full workflow a history image was generated with, or None"""
+    with _db() as conn:
+        row = conn.execute("SELECT workflow, workflow_hash FROM image_history WHERE image_filename = ?",
+                           (image_filename,)).fetchone()
+        if not row:
+            return None
+        if row[1]:
+            return load_workflow(conn, row[1])
+    # Rows written before the workflow store keep their graph inline until compacted
+    return json.loads(row[0]) if row[0] else None
+
+def compact_workflow_history(batch_size=500, vacuum=False):
+    """
+    Move workflows still stored inline in image_history into the workflow store.
+
+    Works in batches, releasing the connection between them so other queries are not
+    held up. VACUUM afterwards to return the freed pages to the file system.
+    """
+    def database_size(conn):
+        return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+    with _db() as conn:
+        size_before = database_size(conn)
+
+    compacted = 0
+    last_id = 0
+    while True:
+        with _db() as conn:
+            rows = conn.execute(
+                "SELECT id, workflow FROM image_history WHERE id > ? AND workflow IS NOT NULL ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            for row_id, workflow_json in rows:
+                try:
+                    workflow = json.loads(workflow_json)
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"Leaving unreadable workflow of history row {row_id} in place: {e}")
+                    continue
+                conn.execute("UPDATE image_history SET workflow = NULL, workflow_hash = ? WHERE id = ?",
+                             (store_workflow(conn, workflow), row_id))
+                compacted += 1
+            conn.commit()
+            last_id = rows[-1][0]
+        logger.debug(f"Compacted workflows of history rows up to id {last_id}")
+
+    with _db() as conn:
+        # Workflows whose history rows have been deleted
+        orphans = conn.execute(
+            "DELETE FROM workflows WHERE hash NOT IN "
+            "(SELECT workflow_hash FROM image_history WHERE workflow_hash IS NOT NULL)"
+        ).rowcount
+        conn.commit()
+        if vacuum:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+        stats = {
+            'rows': compacted,
+            'orphans_removed': orphans,
+            'templates': conn.execute("SELECT COUNT(*) FROM workflow_templates").fetchone()[0],
+            'workflows': conn.execute("SELECT COUNT(*) FROM workflows").fetchone()[0],
+            'size_before': size_before,
+            'size_after': database_size(conn)
+        }
+    logger.info(f"Compacted workflow history: {stats}")
+    return stats
+
 def get_all_image_info():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    try:
-        c.execute("SELECT * FROM image_history")
-        info = c.fetchall()
-        logger.debug(f"Retrieved {len(info)} image entries")
-    except sqlite3.OperationalError as e:
-        if "no such table" in str(e):
-            logger.warning("image_history table does not exist. Returning empty list.")
-            info = []
-        else:
-            raise
-    finally:
-        conn.close()
+    with _db() as conn:
+        c = conn.cursor()
+        try:
+            c.execute("SELECT * FROM image_history")
+            info = c.fetchall()
+            logger.debug(f"Retrieved {len(info)} image entries")
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                logger.warning("image_history table does not exist. Returning empty list.")
+                info = []
+            else:
+                raise
     return info
 
 def update_image_info(image_filename, new_prompt=None, new_resolution=None, new_loras=None, new_upscale_factor=None):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
     update_fields = []
     update_values = []
-    
+
     if new_prompt is not None:
         update_fields.append("prompt = ?")
         update_values.append(new_prompt)
-    
+
     if new_resolution is not None:
         update_fields.append("resolution = ?")
         update_values.append(new_resolution)
-    
+
     if new_loras is not None:
         update_fields.append("loras = ?")
         new_loras_list = new_loras[:25] if isinstance(new_loras, list) else [new_loras]
         update_values.append(json.dumps(new_loras_list))
-    
+
     if new_upscale_factor is not None:
         update_fields.append("upscale_factor = ?")
         update_values.append(new_upscale_factor)
-    
+
     if update_fields:
         update_query = f"UPDATE image_history SET {', '.join(update_fields)} WHERE image_filename = ?"
         update_values.append(image_filename)
-        
-        c.execute(update_query, tuple(update_values))
-        conn.commit()
-        
+
+        with _db() as conn:
+            conn.execute(update_query, tuple(update_values))
+            conn.commit()
+
         logger.debug(f"Updated image info for {image_filename}: prompt={new_prompt}, resolution={new_resolution}, loras={new_loras}, upscale_factor={new_upscale_factor}")
     else:
         logger.debug(f"No updates provided for {image_filename}")
-    
-    conn.close()
 
 def get_banned_words():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT word FROM banned_words")
-    words = [row[0] for row in c.fetchall()]
-    conn.close()
-    return words
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT word FROM banned_words")
+        return [row[0] for row in c.fetchall()]
+
+def rebuild_banned_matcher(words=None) -> BannedWordMatcher:
+    """Compile the banned word list; reads it from the database unless words are given"""
+    global _banned_matcher
+    matcher = BannedWordMatcher(get_banned_words() if words is None else words)
+    with _banned_matcher_lock:
+        _banned_matcher = matcher
+    logger.debug(f"Compiled {len(matcher)} banned words")
+    return matcher
+
+def get_banned_matcher() -> BannedWordMatcher:
+    """The compiled banned word list, built on first use"""
+    matcher = _banned_matcher
+    if matcher is None:
+        matcher = rebuild_banned_matcher()
+    return matcher
 
 def add_banned_word(word: str):
     """Add a new banned word to both database and JSON file"""
     # Normalize the word before storing
     normalized_word = normalize_text(word)
-    
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO banned_words (word) VALUES (?)", (normalized_word,))
-    conn.commit()
-    conn.close()
-    
-    # Update JSON file
+
+    with _db() as conn:
+        conn.execute("INSERT OR IGNORE INTO banned_words (word) VALUES (?)", (normalized_word,))
+        conn.commit()
+
+    # Update JSON file and the compiled matcher
     current_words = get_banned_words()
     save_banned_words_to_json(current_words)
+    rebuild_banned_matcher(current_words)
     logger.debug(f"Added banned word and updated JSON: {word}")
 
 def remove_banned_word(word: str):
     """Remove a banned word from both database and JSON file"""
     # Normalize the word before removing
     normalized_word = normalize_text(word)
-    
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM banned_words WHERE word = ?", (normalized_word,))
-    conn.commit()
-    conn.close()
-    
-    # Update JSON file
+
+    with _db() as conn:
+        conn.execute("DELETE FROM banned_words WHERE word = ?", (normalized_word,))
+        conn.commit()
+
+    # Update JSON file and the compiled matcher
     current_words = get_banned_words()
     save_banned_words_to_json(current_words)
+    rebuild_banned_matcher(current_words)
     logger.debug(f"Removed banned word and updated JSON: {word}")
 
 def add_user_warning(user_id: str, prompt: str, word: str):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO user_warnings (user_id, prompt, word) VALUES (?, ?, ?)",
-              (user_id, prompt, word))
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        conn.execute("INSERT INTO user_warnings (user_id, prompt, word) VALUES (?, ?, ?)",
+                     (user_id, prompt, word))
+        conn.commit()
 
 def remove_user_warnings(user_id: str):
     """Remove all warnings for a specific user"""
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
     try:
-        # Check if user has warnings
-        c.execute("SELECT COUNT(*) FROM user_warnings WHERE user_id = ?", (user_id,))
-        warning_count = c.fetchone()[0]
-        
-        if warning_count == 0:
-            conn.close()
-            return False, "User has no warnings to remove"
-            
-        # Delete all warnings for the user
-        c.execute("DELETE FROM user_warnings WHERE user_id = ?", (user_id,))
-        conn.commit()
-        conn.close()
-        return True, f"Removed {warning_count} warning(s)"
+        with _db() as conn:
+            c = conn.cursor()
+            # Check if user has warnings
+            c.execute("SELECT COUNT(*) FROM user_warnings WHERE user_id = ?", (user_id,))
+            warning_count = c.fetchone()[0]
+
+            if warning_count == 0:
+                return False, "User has no warnings to remove"
+
+            # Delete all warnings for the user
+            c.execute("DELETE FROM user_warnings WHERE user_id = ?", (user_id,))
+            conn.commit()
+            return True, f"Removed {warning_count} warning(s)"
     except Exception as e:
-        conn.close()
         return False, f"Error removing warnings: {str(e)}"
 
 def get_user_warnings(user_id: str):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM user_warnings WHERE user_id = ?", (user_id,))
-    warning_count = c.fetchone()[0]
-    conn.close()
-    return warning_count
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM user_warnings WHERE user_id = ?", (user_id,))
+        return c.fetchone()[0]
 
 def get_all_warnings():
     """Get all warnings from the database, grouped by user"""
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
     try:
-        # Get all warnings with user info
-        c.execute("""
-            SELECT user_id, prompt, word, warned_at 
-            FROM user_warnings 
-            ORDER BY user_id, warned_at DESC
-        """)
-        warnings = c.fetchall()
-        
+        with _db() as conn:
+            c = conn.cursor()
+            # Get all warnings with user info
+            c.execute("""
+                SELECT user_id, prompt, word, warned_at
+                FROM user_warnings
+                ORDER BY user_id, warned_at DESC
+            """)
+            warnings = c.fetchall()
+
         if not warnings:
-            conn.close()
             return False, "No warnings found in the database"
-        
+
         # Group warnings by user
         warning_dict = {}
         for warning in warnings:
@@ -284,43 +507,37 @@ def get_all_warnings():
             if user_id not in warning_dict:
                 warning_dict[user_id] = []
             warning_dict[user_id].append((prompt, word, warned_at))
-        
-        conn.close()
+
         return True, warning_dict
     except Exception as e:
-        conn.close()
         return False, f"Error retrieving warnings: {str(e)}"
 
 def delete_image_info(image_filename):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM image_history WHERE image_filename = ?", (image_filename,))
-    deleted_count = c.rowcount
-    conn.commit()
-    conn.close()
-    
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM image_history WHERE image_filename = ?", (image_filename,))
+        deleted_count = c.rowcount
+        conn.commit()
+
     if deleted_count > 0:
         logger.debug(f"Deleted image info for {image_filename}")
     else:
         logger.warning(f"No image info found to delete for {image_filename}")
-    
+
     return deleted_count > 0
 
 def ban_user(user_id, reason):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO banned_users (user_id, reason) VALUES (?, ?)", (user_id, reason))
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        conn.execute("INSERT OR REPLACE INTO banned_users (user_id, reason) VALUES (?, ?)", (user_id, reason))
+        conn.commit()
     logger.info(f"Banned user {user_id} for reason: {reason}")
 
 def unban_user(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM banned_users WHERE user_id = ?", (user_id,))
-    deleted = c.rowcount > 0
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM banned_users WHERE user_id = ?", (user_id,))
+        deleted = c.rowcount > 0
+        conn.commit()
     if deleted:
         logger.info(f"Unbanned user {user_id}")
     else:
@@ -328,11 +545,10 @@ def unban_user(user_id):
     return deleted
 
 def get_ban_info(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT reason, banned_at FROM banned_users WHERE user_id = ?", (user_id,))
-    info = c.fetchone()
-    conn.close()
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT reason, banned_at FROM banned_users WHERE user_id = ?", (user_id,))
+        info = c.fetchone()
     if info:
         logger.debug(f"Retrieved ban info for user {user_id}")
         return {"reason": info[0], "banned_at": info[1]}
@@ -341,24 +557,20 @@ def get_ban_info(user_id):
         return None
 
 def is_user_banned(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM banned_users WHERE user_id = ?", (user_id,))
-    is_banned = c.fetchone() is not None
-    conn.close()
-    return is_banned
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM banned_users WHERE user_id = ?", (user_id,))
+        return c.fetchone() is not None
 
 def get_all_banned_users():
     """
     Get all banned users from the database with their ban information.
     Returns a list of dictionaries containing user_id, reason, and banned_at.
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT user_id, reason, banned_at FROM banned_users ORDER BY banned_at DESC")
-    banned_users = [{"user_id": row[0], "reason": row[1], "banned_at": row[2]} for row in c.fetchall()]
-    conn.close()
-    return banned_users
+    with _db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT user_id, reason, banned_at FROM banned_users ORDER BY banned_at DESC")
+        return [{"user_id": row[0], "reason": row[1], "banned_at": row[2]} for row in c.fetchall()]
 
 # Function to load LoRA information from lora.json
 def load_lora_info():
@@ -373,38 +585,10 @@ def load_lora_info():
 # You can call this function to get the LoRA information when needed
 lora_info = load_lora_info()
 
-def normalize_text(text: str) -> str:
-    """
-    Normalize text by removing special characters and converting to lowercase.
-    This helps detect obfuscated words like 'Ch!ld' or 'C.h.i.l.d'
-    """
-    # Convert to lowercase
-    text = text.lower()
-    # Remove all non-alphanumeric characters
-    text = re.sub(r'[^a-z0-9\s]', '', text)
-    # Remove extra spaces
-    text = ' '.join(text.split())
-    return text
-
 def contains_banned_word(text: str) -> tuple[bool, list[str]]:
     """
     Check if text contains any banned words, accounting for obfuscation attempts.
     Returns a tuple of (bool, list of matched words)
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT word FROM banned_words")
-    banned_words = [row[0] for row in c.fetchall()]
-    conn.close()
-
-    # Normalize the input text
-    normalized_text = normalize_text(text)
-    found_words = []
-
-    # Check each word in the normalized text against normalized banned words
-    for banned_word in banned_words:
-        normalized_banned = normalize_text(banned_word)
-        if normalized_banned in normalized_text:
-            found_words.append(banned_word)
-
+    found_words = get_banned_matcher().find_obfuscated(text)
     return bool(found_words), found_words
@@ -0,0 +1,77 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# Embed color for users without a colored role
+DEFAULT_USER_COLOR = 0x5DADEC
+
+class DiscordResolver:
+    """
+    Discord objects needed to deliver an image, from the gateway cache where possible.
+
+    Channels come from the bot's cache and are only fetched when missing. The bot runs
+    without the members intent, so its member cache is mostly empty; a user's display
+    name and role color are fetched once and then kept for `ttl` seconds in a cache of
+    at most `max_size` users, least recently used dropped first.
+    """
+
+    def __init__(self, bot: discord.Client, ttl: float = 600, max_size: int = 1024):
+        self.bot = bot
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        # (guild_id, user_id) -> (expiry, display name, color)
+        self.authors: "OrderedDict[Tuple[int, int], Tuple[float, str, int]]" = OrderedDict()
+        self.lookups = 0
+        self.fetches = 0
+
+    async def channel(self, channel_id) -> discord.abc.Messageable:
+        self.lookups += 1
+        channel = self.bot.get_channel(int(channel_id))
+        if channel is None:
+            self.fetches += 1
+            channel = await self.bot.fetch_channel(int(channel_id))
+        return channel
+
+    async def author(self, channel, user_id) -> Tuple[str, int]:
+        """Display name and embed color of a user in the channel's guild"""
+        self.lookups += 1
+        user_id = int(user_id)
+        guild = getattr(channel, 'guild', None)
+        key = (guild.id if guild else 0, user_id)
+        cached = self.authors.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self.authors.move_to_end(key)
+            return cached[1], cached[2]
+
+        name, color = await self._fetch_author(guild, user_id)
+        self.authors[key] = (time.monotonic() + self.ttl, name, color)
+        self.authors.move_to_end(key)
+        while len(self.authors) > self.max_size:
+            self.authors.popitem(last=False)
+        return name, color
+
+    async def _fetch_author(self, guild, user_id: int) -> Tuple[str, int]:
+        member = guild.get_member(user_id) if guild else None
+        if member is None and guild is not None:
+            try:
+                self.fetches += 1
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                # Left the guild since asking
+                member = None
+        if member is not None:
+            return member.global_name or member.name, member.color.value or DEFAULT_USER_COLOR
+
+        user = self.bot.get_user(user_id)
+        if user is None:
+            self.fetches += 1
+            user = await self.bot.fetch_user(user_id)
+        return user.display_name, DEFAULT_USER_COLOR
+
+    def stats(self) -> Dict[str, int]:
+        return {'lookups': self.lookups, 'fetches': self.fetches, 'cached_users': len(self.authors)}
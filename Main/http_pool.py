@@ -0,0 +1,129 @@
+import logging
+import threading
+from typing import Dict, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+class ConnectionStats:
+    """Thread-safe counters of HTTP requests and the TCP connections they needed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.opened = 0
+        self.reused = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_opened(self):
+        with self._lock:
+            self.opened += 1
+
+    def record_reused(self):
+        with self._lock:
+            self.reused += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {'requests': self.requests, 'opened': self.opened, 'reused': self.reused}
+
+    def __repr__(self):
+        stats = self.snapshot()
+        return f"ConnectionStats(requests={stats['requests']}, opened={stats['opened']}, reused={stats['reused']})"
+
+def _counting_pool(base):
+    class CountingConnectionPool(base):
+        stats: Optional[ConnectionStats] = None
+
+        def _new_conn(self):
+            if self.stats is not None:
+                self.stats.record_opened()
+            return super()._new_conn()
+
+    CountingConnectionPool.__name__ = f"Counting{base.__name__}"
+    return CountingConnectionPool
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that counts requests and the keep-alive connections it had to open"""
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_classes = {}
+        for scheme, base in (('http', HTTPConnectionPool), ('https', HTTPSConnectionPool)):
+            pool_class = _counting_pool(base)
+            pool_class.stats = self.stats
+            pool_classes[scheme] = pool_class
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+    def send(self, request, **kwargs):
+        self.stats.record_request()
+        return super().send(request, **kwargs)
+
+class PooledSession(requests.Session):
+    """
+    requests.Session with a bounded keep-alive pool and default timeouts.
+
+    pool_size is the number of hosts whose connections are kept, max_per_host the
+    number of idle connections kept per host. Opened connections are counted in
+    `stats`; every other request went out on a reused one.
+    """
+
+    def __init__(self, pool_size: int = 10, max_per_host: int = 10,
+                 connect_timeout: float = 10, read_timeout: float = 120):
+        super().__init__()
+        self.stats = ConnectionStats()
+        self.default_timeout = (connect_timeout, read_timeout)
+        adapter = CountingHTTPAdapter(self.stats, pool_connections=pool_size, pool_maxsize=max_per_host)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+    def connection_stats(self) -> Dict[str, int]:
+        stats = self.stats.snapshot()
+        # Failed connection attempts are counted as opened, so never report below zero
+        stats['reused'] = max(0, stats['requests'] - stats['opened'])
+        return stats
+
+def create_client_session(stats: ConnectionStats, pool_size: int = 100, max_per_host: int = 0,
+                          connect_timeout: float = 10, read_timeout: float = 120) -> aiohttp.ClientSession:
+    """
+    Create an aiohttp session with a bounded keep-alive pool.
+
+    pool_size caps open connections overall and max_per_host per host (0 means no
+    per-host limit). Requests, newly opened and reused connections are counted into
+    `stats`.
+    """
+
+    async def on_request_start(session, context, params):
+        stats.record_request()
+
+    async def on_connection_create_end(session, context, params):
+        stats.record_opened()
+
+    async def on_connection_reuseconn(session, context, params):
+        stats.record_reused()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=pool_size, limit_per_host=max_per_host),
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout),
+        trace_configs=[trace_config]
+    )
@@ -0,0 +1,60 @@
+import logging
+import os
+import tempfile
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Finished images are streamed from ComfyUI into a spool file and uploaded to Discord
+# from disk, so a full-resolution image is never held in memory; between comfygen.py
+# and the bot only the file's path is passed.
+SPOOL_CHUNK_SIZE = 256 * 1024
+
+class UploadTooLarge(Exception):
+    """Raised when an uploaded image is larger than allowed"""
+
+def spool_file_path(directory: str, filename: str) -> str:
+    """A new, unique path in the spool directory for an image called filename"""
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{uuid.uuid4().hex}_{os.path.basename(filename)}")
+
+def in_spool(path: str, directory: str) -> bool:
+    """Whether path names a file inside the spool directory"""
+    try:
+        spool = os.path.realpath(directory)
+        return os.path.commonpath([os.path.realpath(path), spool]) == spool and os.path.isfile(path)
+    except ValueError:
+        # Paths on different drives
+        return False
+
+async def spool_upload(part, directory: str, threshold: int, max_size: int) -> tempfile.SpooledTemporaryFile:
+    """
+    Stream an uploaded multipart part into a temporary file, kept in memory up to
+    threshold bytes and moved to a file in directory beyond that. Raises
+    UploadTooLarge as soon as more than max_size bytes have arrived.
+    """
+    os.makedirs(directory, exist_ok=True)
+    upload = tempfile.SpooledTemporaryFile(max_size=threshold, dir=directory)
+    size = 0
+    try:
+        while True:
+            chunk = await part.read_chunk(SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLarge(f"Upload is larger than {max_size} bytes")
+            upload.write(chunk)
+    except BaseException:
+        upload.close()
+        raise
+    upload.seek(0)
+    return upload
+
+def remove_spooled(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Error removing spooled image {path}: {str(e)}")
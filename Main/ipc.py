@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Callbacks from comfygen.py processes on the bot's host come over a UNIX domain socket
+# instead of HTTP. Every frame is a big-endian payload length and a frame kind,
+# followed by the payload; each request frame is answered by a REPLY frame.
+FRAME_HEADER = struct.Struct('>IB')
+REPLY = 0
+PROGRESS = 1  # JSON {"updates": [{"request_id": ..., "progress_data": {...}}, ...]}
+PREVIEW = 2   # request_id length (2 bytes), request_id, then the preview image
+IMAGE = 3     # JSON with the /send_image fields, the image passed by image_path
+REPLY_STATUS = struct.Struct('>H')
+PREVIEW_ID_LENGTH = struct.Struct('>H')
+# Previews are the largest frames by far
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# handler(payload) -> (status, text); status follows HTTP's
+IpcHandler = Callable[[bytes], Awaitable[Tuple[int, str]]]
+
+class FrameError(Exception):
+    """Raised for a frame that can't be read"""
+
+def ipc_supported() -> bool:
+    return hasattr(socket, 'AF_UNIX') and hasattr(asyncio, 'start_unix_server')
+
+def encode_frame(kind: int, payload: bytes) -> bytes:
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {len(payload)} bytes is larger than {MAX_FRAME_SIZE}")
+    return FRAME_HEADER.pack(len(payload), kind) + payload
+
+def encode_json(data: Any) -> bytes:
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def encode_progress(updates: List[Tuple[str, Dict[str, Any]]]) -> bytes:
+    return encode_json({'updates': [{'request_id': request_id, 'progress_data': progress_data}
+                                    for request_id, progress_data in updates]})
+
+def encode_preview(request_id: str, image: bytes) -> bytes:
+    request_id = request_id.encode('utf-8')
+    return PREVIEW_ID_LENGTH.pack(len(request_id)) + request_id + image
+
+def decode_preview(payload: bytes) -> Tuple[str, bytes]:
+    (length,) = PREVIEW_ID_LENGTH.unpack_from(payload)
+    start = PREVIEW_ID_LENGTH.size
+    return payload[start:start + length].decode('utf-8'), payload[start + length:]
+
+def encode_reply(status: int, text: str) -> bytes:
+    return REPLY_STATUS.pack(status) + text.encode('utf-8')
+
+def decode_reply(payload: bytes) -> Tuple[int, str]:
+    (status,) = REPLY_STATUS.unpack_from(payload)
+    return status, payload[REPLY_STATUS.size:].decode('utf-8', errors='replace')
+
+class IpcClient:
+    """
+    Blocking client for the bot's callback socket, used by comfygen.py. One connection
+    is kept open and shared by the threads of the process; calls take turns on it.
+    """
+
+    def __init__(self, path: str, timeout: float = 120):
+        self.path = path
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+        self.lock = threading.Lock()
+
+    def call(self, kind: int, payload: bytes) -> Tuple[int, str]:
+        """Send a frame and wait for the bot's (status, text); raises OSError if the socket fails"""
+        frame = encode_frame(kind, payload)
+        with self.lock:
+            # A kept connection the bot has dropped in the meantime is replaced once
+            for attempt in range(2):
+                reused = self.sock is not None
+                try:
+                    if self.sock is None:
+                        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        self.sock.settimeout(self.timeout)
+                        self.sock.connect(self.path)
+                    self.sock.sendall(frame)
+                    reply_kind, reply = self._read_frame()
+                    if reply_kind != REPLY:
+                        raise FrameError(f"Expected a reply, got a frame of kind {reply_kind}")
+                    return decode_reply(reply)
+                except (OSError, FrameError) as e:
+                    self._close()
+                    if not reused or attempt:
+                        raise OSError(f"Bot socket {self.path}: {str(e)}") from e
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+    def _read_frame(self) -> Tuple[int, bytes]:
+        length, kind = FRAME_HEADER.unpack(self._read_exactly(FRAME_HEADER.size))
+        if length > MAX_FRAME_SIZE:
+            raise FrameError(f"Frame of {length} bytes is larger than {MAX_FRAME_SIZE}")
+        return kind, self._read_exactly(length)
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise FrameError("Connection closed by the bot")
+            data.extend(chunk)
+        return bytes(data)
+
+async def start_ipc_server(path: str, handlers: Dict[int, IpcHandler]) -> asyncio.AbstractServer:
+    """
+    Serve the callback socket at path, answering each frame with its kind's handler.
+    A stale socket file left by an earlier run is replaced; the socket is only
+    accessible to the bot's own user.
+    """
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.remove(path)
+
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    length, kind = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                if length > MAX_FRAME_SIZE:
+                    logger.warning(f"Closing callback connection after a frame of {length} bytes")
+                    break
+                payload = await reader.readexactly(length)
+                handler = handlers.get(kind)
+                if handler is None:
+                    status, text = 400, f"Unknown frame kind {kind}"
+                else:
+                    try:
+                        status, text = await handler(payload)
+                    except Exception as e:
+                        logger.error(f"Error handling callback frame of kind {kind}: {str(e)}", exc_info=True)
+                        status, text = 500, "Internal server error"
+                writer.write(encode_frame(REPLY, encode_reply(status, text)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.debug(f"Callback connection closed: {str(e)}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(serve, path)
+    os.chmod(path, 0o600)
+    return server
@@ -0,0 +1,80 @@
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class LoraCatalog:
+    """
+    Read-only snapshot of lora.json with lookup indexes.
+
+    A catalog is never modified after it is built. When lora.json changes a new catalog
+    is built and swapped in with a single attribute assignment, so readers always see
+    one consistent version.
+    """
+
+    def __init__(self, entries: Iterable[Dict[str, Any]]):
+        self.entries: Tuple[Dict[str, Any], ...] = tuple(entries)
+        self.by_file: Dict[str, Dict[str, Any]] = {lora['file']: lora for lora in self.entries}
+        self.by_name: Dict[str, Dict[str, Any]] = {lora['name']: lora for lora in self.entries if 'name' in lora}
+
+        # Trigger words appended to prompts for selected LoRAs ('add_prompt')
+        self.triggers: Dict[str, str] = {}
+        # Older entries carry their trigger words in 'prompt' instead
+        self.prompt_words: Dict[str, str] = {}
+        for lora in self.entries:
+            trigger = (lora.get('add_prompt') or '').strip()
+            if trigger:
+                self.triggers[lora['file']] = trigger
+            if lora.get('prompt'):
+                self.prompt_words[lora['file']] = lora['prompt']
+
+        # One pattern that strips every known trigger word; longest first so a trigger
+        # that contains another is removed whole
+        self.trigger_pattern: Optional[re.Pattern] = None
+        if self.triggers:
+            alternatives = sorted(set(self.triggers.values()), key=len, reverse=True)
+            self.trigger_pattern = re.compile(
+                r',?\s*(?:' + '|'.join(re.escape(trigger) for trigger in alternatives) + r'),?\s*',
+                flags=re.IGNORECASE
+            )
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'LoraCatalog':
+        """Build a catalog from a parsed lora.json"""
+        return cls(config.get('available_loras', []))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, lora_file: str) -> bool:
+        return lora_file in self.by_file
+
+    def get(self, lora_file: str) -> Optional[Dict[str, Any]]:
+        return self.by_file.get(lora_file)
+
+    def display_name(self, lora_file: str) -> str:
+        """The LoRA's configured name, or the file name if it is not in the catalog"""
+        lora = self.by_file.get(lora_file)
+        return lora['name'] if lora else lora_file
+
+    def trigger_words(self, lora_files: Iterable[str]) -> List[str]:
+        """'add_prompt' trigger words for the given LoRAs, in selection order"""
+        return [self.triggers[lora_file] for lora_file in lora_files if lora_file in self.triggers]
+
+    def remove_trigger_words(self, prompt: str) -> str:
+        """Remove every known 'add_prompt' trigger word from a prompt"""
+        if self.trigger_pattern is None:
+            return prompt
+        return self.trigger_pattern.sub('', prompt)
+
+    def legacy_prompt_words(self, lora_files: Iterable[str]) -> List[str]:
+        """'prompt' trigger words for the given LoRAs, in selection order"""
+        return [self.prompt_words[lora_file].strip() for lora_file in lora_files
+                if lora_file in self.prompt_words and self.prompt_words[lora_file].strip()]
+
+    def remove_legacy_prompt_words(self, prompt: str) -> str:
+        """Remove every known 'prompt' trigger word from a prompt"""
+        for words in self.prompt_words.values():
+            prompt = prompt.replace(words, '').strip()
+        return prompt
@@ -13,6 +13,8 @@ from typing import Optional, Dict, List
 from pathlib import Path
 from threading import Lock, Timer
 
+from Main.lora_catalog import LoraCatalog
+
 logger = logging.getLogger(__name__)
 
 class DebounceTimer:
@@ -131,8 +133,10 @@ class LoraFileHandler(FileSystemEventHandler):
                         return False
                     
             self.last_valid_config = new_config
-            self.bot.lora_options = new_config.get('available_loras', [])
-            logger.info(f"Reloaded LoRA config with {len(self.bot.lora_options)} entries")
+            # Build the new catalog completely before swapping it in
+            catalog = LoraCatalog.from_config(new_config)
+            self.bot.lora_catalog = catalog
+            logger.info(f"Reloaded LoRA config with {len(catalog)} entries")
             return True
 
         except Exception as e:
@@ -0,0 +1,146 @@
+import logging
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text by removing special characters and converting to lowercase.
+    This helps detect obfuscated words like 'Ch!ld' or 'C.h.i.l.d'
+    """
+    # Convert to lowercase
+    text = text.lower()
+    # Remove all non-alphanumeric characters
+    text = re.sub(r'[^a-z0-9\s]', '', text)
+    # Remove extra spaces
+    text = ' '.join(text.split())
+    return text
+
+class AhoCorasick:
+    """
+    Multi-pattern string matcher.
+
+    The automaton is built once from all patterns; search() then reports every
+    occurrence of every pattern in a single pass over the text, independent of how
+    many patterns there are.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Pattern ids ending at each state, including those reached through fail links
+        self._output: List[List[int]] = [[]]
+
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build_fail_links()
+
+    def _add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def search(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yield (start, pattern id) for every occurrence of a pattern in text"""
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                yield index - len(patterns[pattern_id]) + 1, pattern_id
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+def _is_boundary(text: str, index: int) -> bool:
+    """True if a regex \\b would match at index"""
+    before = index > 0 and _is_word_char(text[index - 1])
+    after = index < len(text) and _is_word_char(text[index])
+    return before != after
+
+class BannedWordMatcher:
+    """
+    Banned word list compiled into Aho-Corasick automata.
+
+    Matches are reported in banned list order so callers that act on the first match
+    behave as if they had tested each word in turn.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self.words: List[str] = list(words)
+        self._word_automaton = self._compile(word.lower() for word in self.words)
+        self._normalized_automaton: Optional[Tuple[AhoCorasick, Dict[int, List[int]]]] = None
+
+    def _compile(self, patterns: Iterable[str]) -> Tuple[AhoCorasick, Dict[int, List[int]]]:
+        # Several banned words can share a pattern; map each pattern back to all of them
+        pattern_ids: Dict[str, int] = {}
+        owners: Dict[int, List[int]] = {}
+        unique_patterns: List[str] = []
+        for word_index, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            if pattern not in pattern_ids:
+                pattern_ids[pattern] = len(unique_patterns)
+                unique_patterns.append(pattern)
+            owners.setdefault(pattern_ids[pattern], []).append(word_index)
+        return AhoCorasick(unique_patterns), owners
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def find_words(self, text: str) -> List[str]:
+        """Banned words that appear in text as whole words, case-insensitively"""
+        text = text.lower()
+        automaton, owners = self._word_automaton
+        matched = set()
+        for start, pattern_id in automaton.search(text):
+            end = start + len(automaton.patterns[pattern_id])
+            if _is_boundary(text, start) and _is_boundary(text, end):
+                matched.update(owners[pattern_id])
+        return [self.words[index] for index in sorted(matched)]
+
+    def first_word(self, text: str) -> Optional[str]:
+        """The earliest banned word in list order that appears in text as a whole word"""
+        matches = self.find_words(text)
+        return matches[0] if matches else None
+
+    def find_obfuscated(self, text: str) -> List[str]:
+        """Banned words that appear anywhere in the normalized text, catching 'C.h.i.l.d'"""
+        if self._normalized_automaton is None:
+            self._normalized_automaton = self._compile(normalize_text(word) for word in self.words)
+        automaton, owners = self._normalized_automaton
+        matched = set()
+        for _, pattern_id in automaton.search(normalize_text(text)):
+            matched.update(owners[pattern_id])
+        return [self.words[index] for index in sorted(matched)]
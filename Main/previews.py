@@ -0,0 +1,125 @@
+import asyncio
+import io
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from PIL import Image
+
+from Main.progress_updates import ChannelBudget
+
+logger = logging.getLogger(__name__)
+
+# Binary websocket frames from ComfyUI start with a big-endian event type
+PREVIEW_IMAGE = 1
+PREVIEW_IMAGE_WITH_METADATA = 4
+# Image type that follows the event type of a PREVIEW_IMAGE frame
+PREVIEW_FORMATS = {1: 'jpeg', 2: 'png'}
+
+# send(request_id, jpeg)
+PreviewSender = Callable[[str, bytes], Awaitable[None]]
+
+def decode_preview_frame(frame: bytes) -> Optional[Tuple[bytes, str, Optional[str]]]:
+    """
+    The (image, format, prompt_id) of a binary ComfyUI websocket frame, or None if it
+    is not a preview. prompt_id is only known for frames that carry metadata.
+    """
+    if len(frame) < 8:
+        return None
+    event = int.from_bytes(frame[:4], 'big')
+    if event == PREVIEW_IMAGE:
+        image_format = PREVIEW_FORMATS.get(int.from_bytes(frame[4:8], 'big'))
+        return (frame[8:], image_format, None) if image_format else None
+    if event == PREVIEW_IMAGE_WITH_METADATA:
+        length = int.from_bytes(frame[4:8], 'big')
+        try:
+            metadata = json.loads(frame[8:8 + length])
+        except ValueError:
+            return None
+        image_format = 'png' if metadata.get('image_type') == 'image/png' else 'jpeg'
+        return frame[8 + length:], image_format, metadata.get('prompt_id')
+    return None
+
+class PreviewPublisher:
+    """
+    Shows the latest ComfyUI preview of each running request in its progress message
+    without running into Discord's edit rate limit.
+
+    ComfyUI sends a preview per sampler step, far more than Discord accepts edits, so
+    only the newest frame of a request is kept. A request's message gets a preview at
+    most every `interval` seconds, and the requests of one channel share
+    `channel_edits` preview edits per `channel_window` seconds, which leaves the rest
+    of the channel's budget to progress text and final images. Frames are scaled down
+    to `max_size` pixels and recompressed as JPEG in a thread.
+    """
+
+    def __init__(self, send: PreviewSender, interval: float = 3.0, max_size: int = 384, quality: int = 70,
+                 channel_edits: int = 2, channel_window: float = 5.0):
+        self.send = send
+        self.interval = interval
+        self.max_size = max_size
+        self.quality = quality
+        self.budget = ChannelBudget(channel_edits, channel_window)
+        # request_id -> (channel_id, newest frame not shown yet)
+        self.latest: Dict[str, Tuple[str, bytes]] = {}
+        self.senders: Dict[str, asyncio.Task] = {}
+        self.sending: Dict[str, asyncio.Task] = {}
+        self.frames = 0
+        self.edits = 0
+
+    def publish(self, request_id: str, channel_id: str, image: bytes):
+        """Offer a new preview frame of a request; a frame not shown yet is replaced"""
+        self.frames += 1
+        self.latest[request_id] = (channel_id, image)
+        if request_id not in self.senders:
+            self.senders[request_id] = asyncio.create_task(self._send_loop(request_id))
+
+    async def finish(self, request_id: str):
+        """Stop previews of a request; returns once no preview edit of it is in flight"""
+        self.latest.pop(request_id, None)
+        sender = self.senders.pop(request_id, None)
+        if sender is not None:
+            sender.cancel()
+        sending = self.sending.pop(request_id, None)
+        if sending is not None:
+            await asyncio.gather(sending, return_exceptions=True)
+
+    async def close(self):
+        for request_id in list(self.senders):
+            await self.finish(request_id)
+        logger.info(f"Preview frames received: {self.frames}, edits sent: {self.edits}")
+
+    async def _send_loop(self, request_id: str):
+        try:
+            while request_id in self.latest:
+                await self.budget.acquire(self.latest[request_id][0])
+                entry = self.latest.pop(request_id, None)
+                if entry is None:
+                    break
+                _, image = entry
+
+                # Shielded, so finish() can wait for an edit that has already started
+                sending = self.sending[request_id] = asyncio.create_task(self._send(request_id, image))
+                await asyncio.shield(sending)
+                self.sending.pop(request_id, None)
+                await asyncio.sleep(self.interval)
+        finally:
+            if self.senders.get(request_id) is asyncio.current_task():
+                del self.senders[request_id]
+
+    async def _send(self, request_id: str, image: bytes):
+        try:
+            preview = await asyncio.to_thread(self.encode, image)
+            await self.send(request_id, preview)
+            self.edits += 1
+        except Exception as e:
+            logger.warning(f"Error sending preview for request {request_id}: {str(e)}")
+
+    def encode(self, image: bytes) -> bytes:
+        """A frame scaled down to fit max_size and recompressed as JPEG"""
+        with Image.open(io.BytesIO(image)) as frame:
+            frame = frame.convert('RGB')
+            frame.thumbnail((self.max_size, self.max_size))
+            output = io.BytesIO()
+            frame.save(output, 'JPEG', quality=self.quality)
+            return output.getvalue()
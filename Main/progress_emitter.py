@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# post_progress([(request_id, progress_data), ...]) posts one batch and raises if it
+# wasn't delivered; post_preview(request_id, image) posts one preview
+ProgressPoster = Callable[[List[Tuple[str, Dict[str, Any]]]], None]
+PreviewPoster = Callable[[str, bytes], None]
+
+# Updates after which a request reports nothing else; the last to be dropped for room
+FINAL_STATUSES = ('complete', 'error')
+
+class ProgressEmitter:
+    """
+    Delivers progress updates to the bot from a background thread, so the loop that
+    reads ComfyUI's websocket never waits on an HTTP callback.
+
+    Only the newest update of each request is kept: a new one replaces the update
+    still waiting for that request, which keeps its place in line. At most
+    `max_pending` requests wait; beyond that the one waiting longest is dropped. The
+    sender posts the updates of up to `batch_size` requests at once and retries a
+    failed post `retries` times, backing off from `retry_delay` seconds; updates that
+    arrive meanwhile replace the ones being retried. Previews are kept the same way,
+    the newest frame per request, and are not retried.
+    """
+
+    def __init__(self, post_progress: ProgressPoster, post_preview: Optional[PreviewPoster] = None,
+                 max_pending: int = 64, batch_size: int = 16, retries: int = 3, retry_delay: float = 1.0):
+        self.post_progress = post_progress
+        self.post_preview = post_preview
+        self.max_pending = max(1, max_pending)
+        self.batch_size = max(1, batch_size)
+        self.retries = max(1, retries)
+        self.retry_delay = retry_delay
+        # request_id -> newest update not posted yet, longest waiting first
+        self.pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.previews: "OrderedDict[str, bytes]" = OrderedDict()
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.busy = False
+        self.closed = False
+        self.updates = 0
+        self.posts = 0
+        self.dropped = 0
+
+    def progress(self, request_id: str, progress_data: Dict[str, Any]):
+        """Queue an update of a request; never blocks on delivery"""
+        with self.condition:
+            self.updates += 1
+            if request_id not in self.pending and len(self.pending) >= self.max_pending:
+                self._drop_oldest()
+            self.pending[request_id] = progress_data
+            self._wake()
+
+    def preview(self, request_id: str, image: bytes):
+        """Queue a preview frame of a request; a frame not posted yet is replaced"""
+        if self.post_preview is None:
+            return
+        with self.condition:
+            if request_id not in self.previews and len(self.previews) >= self.max_pending:
+                self.previews.popitem(last=False)
+            self.previews[request_id] = image
+            self._wake()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued has been posted; False if timeout ran out first"""
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.pending and not self.previews and not self.busy, timeout
+            )
+
+    def close(self, timeout: Optional[float] = None):
+        """Post what is still queued, waiting at most timeout seconds, and stop the sender"""
+        if not self.flush(timeout):
+            logger.warning(f"Gave up on {len(self.pending)} progress updates still queued")
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        logger.debug(f"Progress updates: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {'updates': self.updates, 'posts': self.posts, 'dropped': self.dropped}
+
+    def _drop_oldest(self):
+        # Only drop a request's final update if every waiting update is one
+        oldest = next((request_id for request_id, data in self.pending.items()
+                       if data.get('status') not in FINAL_STATUSES), next(iter(self.pending)))
+        del self.pending[oldest]
+        self.dropped += 1
+
+    def _wake(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.closed = False
+            # A daemon, so a sender stuck on an unreachable bot can't keep the process alive
+            self.thread = threading.Thread(target=self._run, name='progress-emitter', daemon=True)
+            self.thread.start()
+        self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.previews or self.closed)
+                if not self.pending and not self.previews:
+                    return
+                batch = [self.pending.popitem(last=False) for _ in range(min(self.batch_size, len(self.pending)))]
+                previews = list(self.previews.items())
+                self.previews.clear()
+                self.busy = True
+            try:
+                if batch:
+                    self._post_batch(batch)
+                for request_id, image in previews:
+                    try:
+                        self.post_preview(request_id, image)
+                    except Exception as e:
+                        logger.warning(f"Error sending preview update: {str(e)}")
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def _post_batch(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        retry_delay = self.retry_delay
+        for attempt in range(self.retries):
+            try:
+                self.post_progress(batch)
+                self.posts += 1
+                logger.debug(f"Progress updates sent: {batch}")
+                return
+            except Exception as e:
+                if attempt == self.retries - 1:
+                    logger.error(f"All retry attempts failed: {str(e)}")
+                    self.dropped += len(batch)
+                    return
+                logger.warning(f"Attempt {attempt + 1} failed, retrying in {retry_delay} seconds...")
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            with self.condition:
+                # Updates queued since supersede the ones being retried
+                batch = [(request_id, data) for request_id, data in batch if request_id not in self.pending]
+            if not batch:
+                return
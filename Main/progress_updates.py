@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Set
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+class ChannelBudget:
+    """Sliding-window limit on the message edits made in each Discord channel"""
+
+    def __init__(self, edits: int, window: float):
+        self.edits = max(1, edits)
+        self.window = window
+        # channel_id -> times of its recent edits
+        self.recent: Dict[int, Deque[float]] = {}
+
+    def wait_time(self, channel_id: int, now: float) -> float:
+        """Seconds until the channel has an edit to spare"""
+        recent = self.recent.setdefault(channel_id, deque())
+        while recent and recent[0] <= now - self.window:
+            recent.popleft()
+        if len(recent) < self.edits:
+            return 0
+        return recent[0] + self.window - now
+
+    async def acquire(self, channel_id: int):
+        """Wait for, and take, one edit of the channel's budget"""
+        loop = asyncio.get_running_loop()
+        wait = self.wait_time(channel_id, loop.time())
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.wait_time(channel_id, loop.time())
+        now = loop.time()
+        self.recent[channel_id].append(now)
+        # Channels whose edits have all left the window don't limit anything
+        for idle in [channel for channel, recent in self.recent.items()
+                     if not recent or recent[-1] <= now - self.window]:
+            del self.recent[idle]
+
+class ProgressDispatcher:
+    """
+    Edits progress messages in the background, sending only the newest text of each.
+
+    Progress comes in bursts (queue positions of every waiting request, milestones of
+    several jobs) faster than Discord takes edits. Each channel has one sender that
+    waits for the channel's budget, `channel_edits` per `channel_window` seconds, and
+    then edits the message that has waited longest with its newest text; texts
+    replaced in the meantime are dropped. Messages are edited through cached
+    PartialMessages, so an update costs one API call instead of fetching the channel
+    and the message first.
+    """
+
+    def __init__(self, bot: discord.Client, channel_edits: int = 3, channel_window: float = 5.0):
+        self.bot = bot
+        self.budget = ChannelBudget(channel_edits, channel_window)
+        self.messages: Dict[int, discord.PartialMessage] = {}
+        # channel_id -> message_id -> newest text not sent yet, longest waiting first
+        self.pending: Dict[int, "OrderedDict[int, str]"] = {}
+        self.senders: Dict[int, asyncio.Task] = {}
+        # message_id -> its edit in flight
+        self.sending: Dict[int, asyncio.Task] = {}
+        # Messages to forget once their last text is sent
+        self.finishing: Set[int] = set()
+        self.updates = 0
+        self.edits = 0
+
+    def message(self, channel_id, message_id) -> discord.PartialMessage:
+        message_id = int(message_id)
+        message = self.messages.get(message_id)
+        if message is None:
+            message = self.messages[message_id] = self.bot.get_partial_messageable(
+                int(channel_id)
+            ).get_partial_message(message_id)
+        return message
+
+    def update(self, channel_id, message_id, content: str):
+        """Show content in a message as soon as its channel's budget allows"""
+        self.updates += 1
+        message = self.message(channel_id, message_id)
+        # A message already waiting keeps its place
+        self.pending.setdefault(message.channel.id, OrderedDict())[message.id] = content
+        self.finishing.discard(message.id)
+        if message.channel.id not in self.senders:
+            self.senders[message.channel.id] = asyncio.create_task(self._send_loop(message.channel.id))
+
+    async def finish(self, message_id, flush: bool = False):
+        """
+        Forget a message. Its pending text is dropped, and this returns once no edit
+        of it is in flight, unless flush is set: then the text is still sent first.
+        """
+        message_id = int(message_id)
+        message = self.messages.get(message_id)
+        pending = self.pending.get(message.channel.id, {}) if message is not None else {}
+        if flush and message_id in pending:
+            self.finishing.add(message_id)
+            return
+        pending.pop(message_id, None)
+        self.messages.pop(message_id, None)
+        sending = self.sending.get(message_id)
+        if sending is not None:
+            await asyncio.gather(sending, return_exceptions=True)
+
+    async def close(self):
+        for sender in self.senders.values():
+            sender.cancel()
+        await asyncio.gather(*self.senders.values(), *self.sending.values(), return_exceptions=True)
+        logger.info(f"Progress updates: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        """Updates received and edits sent; each update used to cost three API calls"""
+        return {
+            'updates': self.updates,
+            'edits': self.edits,
+            'dropped': self.updates - self.edits - sum(len(pending) for pending in self.pending.values()),
+            'api_calls_saved': 3 * self.updates - self.edits
+        }
+
+    async def _send_loop(self, channel_id: int):
+        try:
+            while self.pending.get(channel_id):
+                await self.budget.acquire(channel_id)
+                pending = self.pending.get(channel_id)
+                if not pending:
+                    break
+                message_id, content = pending.popitem(last=False)
+                # Shielded, so finish() can wait for an edit that has already started
+                sending = self.sending[message_id] = asyncio.create_task(
+                    self._edit(self.messages[message_id], content)
+                )
+                try:
+                    await asyncio.shield(sending)
+                finally:
+                    self.sending.pop(message_id, None)
+                if message_id in self.finishing and message_id not in pending:
+                    self.finishing.discard(message_id)
+                    self.messages.pop(message_id, None)
+        finally:
+            if self.senders.get(channel_id) is asyncio.current_task():
+                del self.senders[channel_id]
+                if not self.pending.get(channel_id):
+                    self.pending.pop(channel_id, None)
+
+    async def _edit(self, message: discord.PartialMessage, content: str):
+        self.edits += 1
+        try:
+            await message.edit(content=content)
+            logger.debug(f"Updated progress message: {content}")
+        except discord.errors.NotFound:
+            logger.warning(f"Message {message.id} not found")
+            self.pending.get(message.channel.id, {}).pop(message.id, None)
+            self.messages.pop(message.id, None)
+            self.finishing.discard(message.id)
+        except discord.errors.Forbidden:
+            logger.warning("Bot lacks permission to edit message")
+        except Exception as e:
+            logger.error(f"Error updating progress message: {str(e)}")
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, served strictly in this order
+PRIORITY_ADMIN = 0
+PRIORITY_NORMAL = 1
+
+# classify(item) -> (priority, guild key, user key, request type)
+Classifier = Callable[[Any], Tuple[int, Hashable, Hashable, str]]
+# dispatch(item, slot) -> awaitable that completes when the generation has finished,
+# resolving to False if it failed; slot is what the admission policy's acquire() returned, e.g. the chosen backend
+Dispatcher = Callable[[Any, Any], Awaitable[Awaitable]]
+# position_handler(item, position, queue_size)
+PositionHandler = Callable[[Any, int, int], Awaitable[None]]
+
+class SurplusRoundRobin:
+    """
+    Weighted fair queue over flows (surplus round robin, a deficit round robin variant).
+
+    Each turn a flow is credited `quantum` and serves items while its credit is
+    positive; an item's cost is charged after it is served, so a flow that sent a
+    heavy request carries the debt into its next turns. A flow can itself be a
+    SurplusRoundRobin, which gives fairness between guilds and then between the
+    users of each guild.
+    """
+
+    def __init__(self, quantum: float = 1.0):
+        self.quantum = quantum
+        self.flows: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        # Credit of active flows, plus the debt of flows that went idle owing some
+        self.deficits: Dict[Hashable, float] = {}
+        self._current: Optional[Hashable] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, path: Tuple[Hashable, ...], item: Any, cost: float):
+        key = path[0]
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = deque() if len(path) == 1 else SurplusRoundRobin(self.quantum)
+            self.flows[key] = flow
+            self.deficits.setdefault(key, 0.0)
+        if len(path) == 1:
+            flow.append((item, cost))
+        else:
+            flow.push(path[1:], item, cost)
+        self._size += 1
+
+    def pop(self) -> Tuple[Any, float]:
+        while True:
+            key, flow = next(iter(self.flows.items()))
+            if key != self._current:
+                self._current = key
+                self.deficits[key] += self.quantum
+            if self.deficits[key] <= 0:
+                # Still paying off earlier heavy requests; skip this turn
+                self._end_turn(key, flow)
+                continue
+
+            item, cost = flow.popleft() if isinstance(flow, deque) else flow.pop()
+            self._size -= 1
+            self.deficits[key] -= cost
+            if not flow or self.deficits[key] <= 0:
+                self._end_turn(key, flow)
+            return item, cost
+
+    def peek(self) -> Any:
+        """The item pop() would return, without changing any state"""
+        # Credits of the flows whose turns would be skipped on the way to it
+        credits: Dict[Hashable, float] = {}
+        while True:
+            for key, flow in self.flows.items():
+                credit = credits.get(key, self.deficits[key])
+                if key != self._current or key in credits:
+                    credit += self.quantum
+                if credit > 0:
+                    return flow[0][0] if isinstance(flow, deque) else flow.peek()
+                credits[key] = credit
+
+    def _end_turn(self, key: Hashable, flow):
+        self._current = None
+        if flow:
+            self.flows.move_to_end(key)
+            return
+        del self.flows[key]
+        # An idle flow keeps its debt but not its credit
+        if self.deficits[key] >= 0:
+            del self.deficits[key]
+        if not self.flows:
+            self.deficits.clear()
+
+    def copy(self) -> 'SurplusRoundRobin':
+        clone = SurplusRoundRobin(self.quantum)
+        clone.flows = OrderedDict(
+            (key, deque(flow) if isinstance(flow, deque) else flow.copy()) for key, flow in self.flows.items()
+        )
+        clone.deficits = dict(self.deficits)
+        clone._current = self._current
+        clone._size = self._size
+        return clone
+
+class FairScheduler:
+    """
+    Request queue that replaces the bot's FIFO: strict priority classes, fair sharing
+    between guilds and then users within each class, weighted by request type.
+
+    The next request is only dispatched once `admission` lets it in: acquire(item)
+    returns a slot (the chosen backend for a BackendPool)
+    that is passed to dispatch and handed back to release() with the generation's
+    duration per unit of request cost and whether it succeeded.
+
+    put() has the asyncio.Queue signature, so callers enqueue request items as before.
+    Queued requests are told their position when it changes, at most once per loop
+    iteration however many requests were queued or dispatched in it.
+    """
+
+    def __init__(self, classify: Classifier, dispatch: Dispatcher, admission,
+                 weights: Optional[Dict[str, float]] = None,
+                 position_handler: Optional[PositionHandler] = None, quantum: float = 1.0):
+        self.classify = classify
+        self.dispatch = dispatch
+        self.admission = admission
+        self.weights = weights or {}
+        self.position_handler = position_handler
+        self.quantum = quantum
+        self.classes: Dict[int, SurplusRoundRobin] = {}
+        self.running = 0
+        self._available = asyncio.Event()
+        # Last position reported per request id
+        self._positions: Dict[Hashable, int] = {}
+        self._report: Optional[asyncio.Handle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[asyncio.Task] = None
+
+    def qsize(self) -> int:
+        return sum(len(queue) for queue in self.classes.values())
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    async def put(self, item: Any):
+        priority, guild_key, user_key, request_type = self.classify(item)
+        cost = float(self.weights.get(request_type, 1.0))
+        queue = self.classes.get(priority)
+        if queue is None:
+            queue = self.classes[priority] = SurplusRoundRobin(self.quantum)
+        queue.push((guild_key, user_key), item, cost)
+        self._available.set()
+        logger.debug(f"Queued {request_type} request of user {user_key} in guild {guild_key} "
+                     f"(priority {priority}, cost {cost}, {self.qsize()} queued)")
+        self._report_positions()
+
+    def put_nowait(self, item: Any):
+        self._spawn(self.put(item))
+
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._tasks) + ([self._runner] if self._runner else [])
+        for task in tasks:
+            task.cancel()
+        if self._report is not None:
+            self._report.cancel()
+            self._report = None
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runner = None
+
+    def order(self) -> List[Any]:
+        """Queued items in the order they would be dispatched"""
+        items = []
+        for priority in sorted(self.classes):
+            queue = self.classes[priority].copy()
+            while queue:
+                items.append(queue.pop()[0])
+        return items
+
+    def _peek(self) -> Any:
+        for priority in sorted(self.classes):
+            queue = self.classes[priority]
+            if queue:
+                return queue.peek()
+        raise IndexError("peek at an empty scheduler")
+
+    def _pop(self) -> Tuple[Any, float]:
+        for priority in sorted(self.classes):
+            queue = self.classes[priority]
+            if queue:
+                return queue.pop()
+        raise IndexError("pop from an empty scheduler")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while self.empty():
+                self._available.clear()
+                await self._available.wait()
+            item, cost, slot = await self._admit()
+            self._report_positions()
+
+            started = loop.time()
+            try:
+                done = await self.dispatch(item, slot)
+            except Exception as e:
+                logger.error(f"Error dispatching request: {e}", exc_info=True)
+                self.admission.release(slot, success=False)
+                continue
+            self.running += 1
+            self._spawn(self._wait_for(done, slot, started, cost))
+
+    async def _admit(self) -> Tuple[Any, float, Any]:
+        """
+        Wait until the next request is admitted and take it off the queue. It stays
+        queued while it waits, so admission is asked for a request that arrives in the
+        meantime and comes first, such as an admin's, instead.
+        """
+        while True:
+            # Admission sees the request so it can route it
+            item = self._peek()
+            acquiring = asyncio.ensure_future(self.admission.acquire(item))
+            try:
+                while not acquiring.done():
+                    self._available.clear()
+                    arrived = asyncio.ensure_future(self._available.wait())
+                    try:
+                        await asyncio.wait((acquiring, arrived), return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        arrived.cancel()
+                    if not acquiring.done() and self._peek() is not item:
+                        acquiring.cancel()
+                        await asyncio.wait((acquiring,))
+                        break
+            except asyncio.CancelledError:
+                acquiring.cancel()
+                raise
+            if acquiring.cancelled():
+                continue
+            # If another request came first just as this one was admitted, the slot is its
+            slot = acquiring.result()
+            item, cost = self._pop()
+            return item, cost, slot
+
+    async def _wait_for(self, done: Awaitable, slot: Any, started: float, cost: float):
+        success = False
+        try:
+            # Dispatchers resolve to False for a failed generation
+            success = (await done) is not False
+        except Exception as e:
+            logger.error(f"Generation ended with an error: {e}")
+        finally:
+            self.running -= 1
+            latency = (asyncio.get_running_loop().time() - started) / max(cost, 1e-6)
+            self.admission.release(slot, latency=latency, success=success)
+
+    def _report_positions(self):
+        """Report positions once the current loop iteration's puts and pops are done"""
+        if self.position_handler is None or self._report is not None:
+            return
+        self._report = asyncio.get_running_loop().call_soon(self._send_positions)
+
+    def _send_positions(self):
+        self._report = None
+        items = self.order()
+        positions = {}
+        for position, item in enumerate(items, start=1):
+            key = getattr(item, 'id', None) or id(item)
+            positions[key] = position
+            if self._positions.get(key) != position:
+                self._spawn(self.position_handler(item, position, len(items)))
+        # Dispatched requests drop out here
+        self._positions = positions
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,77 @@
+import hashlib
+import json
+from typing import Any, Dict, Tuple
+
+# Workflows built from the same DataSets file have the same nodes and differ only in a
+# few inputs (prompt, seed, resolution, LoRAs). They are stored as a shared template,
+# keyed by the hash of its content, plus a small per-request delta against it.
+
+def canonical_json(value: Any) -> str:
+    """JSON with sorted keys and no whitespace, so equal graphs serialize identically"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+def content_hash(value: Any) -> str:
+    return hashlib.sha256(canonical_json(value).encode('utf-8')).hexdigest()
+
+def workflow_shape(workflow: Dict[str, Any]) -> str:
+    """Hash of the node ids and class types; workflows of one shape share a template"""
+    nodes = sorted((node_id, node.get('class_type') if isinstance(node, dict) else None)
+                   for node_id, node in workflow.items())
+    return content_hash(nodes)
+
+def model_signature(workflow: Dict[str, Any]) -> str:
+    """The model files a workflow loads (checkpoint, CLIP, VAE, ...), LoRAs excepted"""
+    files = set()
+    for node in workflow.values():
+        class_type = node.get('class_type', '') if isinstance(node, dict) else ''
+        if 'Loader' in class_type and 'lora' not in class_type.lower():
+            files.update(value for value in node.get('inputs', {}).values() if isinstance(value, str))
+    return '|'.join(sorted(files))
+
+def diff_workflow(template: Dict[str, Any], workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Delta that turns template into workflow; both must have the same shape.
+
+    A node whose only differences are in its inputs is recorded as the changed inputs
+    (and any removed input names), anything else as the whole node.
+    """
+    delta = {}
+    for node_id, node in workflow.items():
+        base = template[node_id]
+        if node == base:
+            continue
+        if (isinstance(node, dict) and isinstance(base, dict)
+                and isinstance(node.get('inputs'), dict) and isinstance(base.get('inputs'), dict)
+                and node.keys() == base.keys()
+                and all(node[key] == base[key] for key in node if key != 'inputs')):
+            inputs, base_inputs = node['inputs'], base['inputs']
+            entry = {'inputs': {name: value for name, value in inputs.items()
+                                if name not in base_inputs or base_inputs[name] != value}}
+            removed = [name for name in base_inputs if name not in inputs]
+            if removed:
+                entry['removed'] = removed
+            delta[node_id] = entry
+        else:
+            delta[node_id] = {'node': node}
+    return delta
+
+def apply_delta(template: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild a workflow from its template and delta; the template is not modified"""
+    workflow = dict(template)
+    for node_id, entry in delta.items():
+        if 'node' in entry:
+            workflow[node_id] = entry['node']
+            continue
+        node = dict(template[node_id])
+        inputs = dict(node['inputs'])
+        for name in entry.get('removed', ()):
+            inputs.pop(name, None)
+        inputs.update(entry['inputs'])
+        node['inputs'] = inputs
+        workflow[node_id] = node
+    return workflow
+
+def normalize_workflow(workflow: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """The workflow's content hash and the workflow as it will read back from JSON"""
+    serialized = canonical_json(workflow)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest(), json.loads(serialized)
@@ -7,6 +7,7 @@ SECURITY_CONFIG = SecurityConfig(
     allowed_methods={'POST'},  # Only allow POST method
     allowed_paths={
         '/update_progress',
+        '/update_preview',
         '/send_image',
         '/image_generated'
     },
@@ -0,0 +1,113 @@
+"""
+Prompt enhancement latency through LMStudioProvider against a stub OpenAI-compatible
+server on 127.0.0.1:--port that answers /v1/chat/completions after --latency seconds.
+--requests enhancements are made by --concurrency users at once, three ways:
+
+  session per call   a new aiohttp session, so a new TCP connection, for every
+                     request (the behaviour before AIProvider kept a session)
+  shared session     the provider's keep-alive session, unthrottled (the default)
+  shared, limited    the keep-alive session with AI_MAX_CONCURRENT_REQUESTS
+                     (--max-concurrent) requests in flight at once
+
+Reports p50/p99 latency of generate_response, requests per second and how many
+connections the stub server saw. The stub speaks plain HTTP; against a hosted API
+every new connection also costs a TLS handshake. From the repository root:
+    python -m benchmarks.bench_ai_providers --requests 2000 --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from aiohttp import web
+
+from Main.LMstudio_bot.ai_providers import AIProviderFactory
+from Main.LMstudio_bot.ai_providers.lmstudio.provider import LMStudioProvider
+
+class SessionPerCallProvider(LMStudioProvider):
+    """Opens a session per request, as every provider did before AIProvider.post"""
+
+    @asynccontextmanager
+    async def post(self, url, **kwargs):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, **kwargs) as response:
+                yield response
+
+class StubServer:
+    """OpenAI-compatible chat completions that count the connections they arrive on"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.connections = set()
+
+    async def chat_completions(self, request):
+        self.connections.add(request.transport.get_extra_info('peername'))
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        prompt = payload['messages'][-1]['content']
+        return web.json_response({
+            'id': 'chatcmpl-benchmark',
+            'object': 'chat.completion',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': f"{prompt}, golden hour, volumetric light"}}]
+        })
+
+async def run(provider, args):
+    latencies = []
+
+    async def user(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            enhanced = await provider.generate_response('a lighthouse on a cliff at dusk', temperature=0.5)
+            latencies.append(time.perf_counter() - started)
+            if enhanced == 'a lighthouse on a cliff at dusk':
+                raise RuntimeError("The stub server did not answer")
+
+    per_user = args.requests // args.concurrency
+    started = time.perf_counter()
+    await asyncio.gather(*(user(per_user) for _ in range(args.concurrency)))
+    return latencies, time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-concurrent', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds the stub takes per completion")
+    parser.add_argument('--port', type=int, default=18234)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ['LMSTUDIO_HOST'] = '127.0.0.1'
+    os.environ['LMSTUDIO_PORT'] = str(args.port)
+
+    print(f"{args.requests} enhancements by {args.concurrency} users, stub answers in {args.latency * 1000:.0f} ms")
+    for name in ('session per call', 'shared session', 'shared, limited'):
+        server = StubServer(args.latency)
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', server.chat_completions)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host='127.0.0.1', port=args.port).start()
+        AIProviderFactory.configure(
+            pool_size=args.concurrency,
+            max_concurrent=args.max_concurrent if name == 'shared, limited' else 0
+        )
+        provider = SessionPerCallProvider() if name == 'session per call' else LMStudioProvider()
+        try:
+            # Warm up code paths and, for the shared session, its connections
+            await provider.generate_response('warm up', temperature=0.5)
+            latencies, elapsed = await run(provider, args)
+        finally:
+            await provider.close()
+            await runner.cleanup()
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"  {name:<18} p50 {statistics.median(latencies) * 1000:7.2f} ms   p99 {p99 * 1000:7.2f} ms   "
+              f"{len(latencies) / elapsed:7.1f} per second   connections {len(server.connections)}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
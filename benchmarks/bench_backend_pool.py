@@ -0,0 +1,125 @@
+"""
+Route a burst of generations through the fair scheduler and a BackendPool spread
+over several local stub ComfyUI servers of different speeds. Halfway through, one
+backend is stopped and later restarted to exercise the circuit breaker.
+
+Reports makespan, per-backend share, warm routing hits and breaker transitions.
+The stubs listen on consecutive ports from --base-port. From the repository root:
+    python -m benchmarks.bench_backend_pool --backends 3 --jobs 120 --users 12
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import Counter
+
+# Main.comfy imports Main.custom_commands and with it config, which needs these to be set
+for key, value in {
+    'DISCORD_TOKEN': 'benchmark', 'CHANNEL_IDS': '0', 'ALLOWED_SERVERS': '0',
+    'BOT_MANAGER_ROLE_ID': '0', 'PULIDWORKFLOW': 'PulidFluxDev.json', 'server_address': '127.0.0.1'
+}.items():
+    os.environ.setdefault(key, value)
+
+from benchmarks.stub_comfyui import start_stub_comfyui
+from Main.comfy import AdmissionController, Backend, BackendPool, ComfyClient
+from Main.scheduler import FairScheduler, PRIORITY_NORMAL
+
+WORKFLOW = {'9': {'class_type': 'SaveImage', 'inputs': {}}}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=120)
+    parser.add_argument('--users', type=int, default=12)
+    parser.add_argument('--workflows', type=int, default=3)
+    parser.add_argument('--base-port', type=int, default=18188)
+    parser.add_argument('--max-in-flight', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    rng = random.Random(args.seed)
+
+    # Backend i is (i + 1) times slower than backend 0
+    ports = [args.base_port + index for index in range(args.backends)]
+    stub_delays = {port: 0.004 * (index + 1) for index, port in enumerate(ports)}
+    stubs = {port: await start_stub_comfyui(port=port, steps=10, step_delay=stub_delays[port], image_size=1024)
+             for port in ports}
+    clients = {f"127.0.0.1:{port}": ComfyClient('127.0.0.1', port=port, reconnect_delay=0.2, outage_timeout=2) for port in ports}
+    await asyncio.gather(*(client.connect() for client in clients.values()))
+
+    pool = BackendPool(
+        [Backend(AdmissionController('127.0.0.1', args.max_in_flight, port=port, probe_interval=0.05),
+                 failure_threshold=2, retry_after=0.5) for port in ports],
+        models=lambda item: (item[2], ()),
+        health_interval=0.2
+    )
+    served = Counter()
+    warm_hits = 0
+    failures = 0
+
+    async def dispatch(item, backend):
+        nonlocal warm_hits
+        warm_hits += backend.warmth((item[2], ())) > 0
+        await pool.prepare(backend, item)
+        served[backend.address] += 1
+
+        async def run():
+            nonlocal failures
+
+            async def on_progress(data):
+                pass
+            try:
+                await clients[backend.address].run_prompt(WORKFLOW, on_progress)
+                return True
+            except Exception:
+                failures += 1
+                return False
+        return asyncio.create_task(run())
+
+    scheduler = FairScheduler(lambda item: (PRIORITY_NORMAL, 'guild', item[1], 'standard'), dispatch, pool)
+    pool.start()
+    for job in range(args.jobs):
+        await scheduler.put((job, f"user{rng.randrange(args.users)}", f"workflow{rng.randrange(args.workflows)}.json"))
+
+    started = time.perf_counter()
+    scheduler.start()
+    victim = ports[0]
+    stopped = restarted = False
+    transitions = []
+    while scheduler.qsize() or scheduler.running:
+        done = args.jobs - scheduler.qsize() - scheduler.running
+        if not stopped and done >= args.jobs // 3:
+            runner, stub = stubs[victim]
+            for ws in list(stub.sockets.values()):
+                await ws.close()
+            await runner.cleanup()
+            stopped = True
+        elif stopped and not restarted and done >= 2 * args.jobs // 3:
+            stubs[victim] = await start_stub_comfyui(port=victim, steps=10, step_delay=stub_delays[victim],
+                                                     image_size=1024)
+            restarted = True
+        availability = tuple(backend.available for backend in pool.backends)
+        if not transitions or transitions[-1][1] != availability:
+            transitions.append((round(time.perf_counter() - started, 2), availability))
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.jobs} jobs from {args.users} users over {args.backends} backends in {elapsed:.2f} s, "
+          f"{failures} failed generations")
+    for address in clients:
+        print(f"  {address}  step delay {stub_delays[int(address.rsplit(':', 1)[1])] * 1000:.0f} ms   "
+              f"served {served[address]:4d}")
+    print(f"  routed to a backend with the workflow loaded: {warm_hits} of {args.jobs}")
+    print("  availability over time (s, per backend): " + ", ".join(f"{t}: {a}" for t, a in transitions))
+
+    await scheduler.stop()
+    await pool.close()
+    for client in clients.values():
+        await client.close()
+    for runner, _ in stubs.values():
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    asyncio.run(main())
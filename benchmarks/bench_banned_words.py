@@ -0,0 +1,73 @@
+"""
+Banned word checks against a large list: one regex or substring test per word (the
+previous approach) against the compiled Aho-Corasick matcher.
+
+From the repository root:
+    python -m benchmarks.bench_banned_words --words 10000 --prompts 200
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from Main.moderation import BannedWordMatcher, normalize_text
+
+def make_words(count, rng):
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))))
+    return list(words)
+
+def make_prompt(words, rng, length, hits):
+    filler = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(length)]
+    for _ in range(hits):
+        filler[rng.randrange(len(filler))] = rng.choice(words).upper()
+    return ' '.join(filler) + ', highly detailed, 8k, cinematic lighting'
+
+def legacy_first_word(words, prompt):
+    prompt_lower = prompt.lower()
+    for word in words:
+        if re.search(r'\b' + re.escape(word.lower()) + r'\b', prompt_lower):
+            return word
+    return None
+
+def legacy_obfuscated(words, prompt):
+    normalized_text = normalize_text(prompt)
+    return [word for word in words if normalize_text(word) in normalized_text]
+
+def time_per_call(check, prompts):
+    started = time.perf_counter()
+    results = [check(prompt) for prompt in prompts]
+    return (time.perf_counter() - started) / len(prompts), results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=10000)
+    parser.add_argument('--prompts', type=int, default=200)
+    parser.add_argument('--prompt-words', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = make_words(args.words, rng)
+    prompts = [make_prompt(words, rng, args.prompt_words, hits=index % 3) for index in range(args.prompts)]
+
+    started = time.perf_counter()
+    matcher = BannedWordMatcher(words)
+    build = time.perf_counter() - started
+
+    print(f"{args.words} banned words, {args.prompts} prompts of ~{args.prompt_words} words, "
+          f"matcher built in {build * 1000:.0f} ms")
+    for name, legacy, compiled in (
+        ("whole-word check", lambda p: legacy_first_word(words, p), matcher.first_word),
+        ("obfuscated check", lambda p: legacy_obfuscated(words, p), matcher.find_obfuscated),
+    ):
+        before, expected = time_per_call(legacy, prompts)
+        after, actual = time_per_call(compiled, prompts)
+        assert expected == actual, f"{name}: results differ"
+        print(f"{name:<18} per word {before * 1000:9.2f} ms   automaton {after * 1000:7.3f} ms   "
+              f"({before / after:.0f}x faster)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Latency and CPU cost of comfygen.py's callbacks to the bot over the two transports:
+
+  http     POST to the bot's web server on 127.0.0.1:8080, through its routing and
+           SecurityMiddleware; images as multipart/form-data
+  socket   length-prefixed frames over the bot's UNIX domain socket
+
+Both run the bot's real handlers against a stand-in for Discord whose edits return
+at once, so what differs is the transport. Each image is a finished request: its
+fields are validated, its message edited with the spooled file and the image
+recorded in the history database. CPU is the time of the whole process, client and
+bot, per callback. Port 8080 must be free while this runs. From the repository root:
+    python -m benchmarks.bench_callback_transport --images 500 --progress 2000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+# comfygen imports config, which needs these to be set
+for key, value in {
+    'DISCORD_TOKEN': 'benchmark', 'CHANNEL_IDS': '0', 'ALLOWED_SERVERS': '0',
+    'BOT_MANAGER_ROLE_ID': '0', 'PULIDWORKFLOW': 'PulidFluxDev.json',
+    'server_address': '127.0.0.1', 'BOT_SERVER': '127.0.0.1',
+    'BOT_IPC_SOCKET': os.path.join(tempfile.gettempdir(), f'bench_callbacks_{os.getpid()}.sock'),
+    'IMAGE_HISTORY_DB': os.path.join(tempfile.gettempdir(), 'bench_image_history.db')
+}.items():
+    os.environ.setdefault(key, value)
+
+from config import IMAGE_SPOOL_DIR
+from Main.custom_commands.models import RequestItem
+from Main.database import init_db
+from Main.discord_resolver import DiscordResolver
+from Main.image_spool import spool_file_path
+from Main.lora_catalog import LoraCatalog
+from Main.progress_updates import ProgressDispatcher
+from web_server import start_web_server
+
+class FakeChannel:
+    id = 1
+    guild = None
+
+    def get_partial_message(self, message_id):
+        async def edit(**kwargs):
+            # discord.py closes the files it uploads
+            for attachment in kwargs.get('attachments') or []:
+                attachment.close()
+        return SimpleNamespace(id=message_id, channel=self, edit=edit)
+
+class FakeBot:
+    """The parts of the bot the callback handlers use, with Discord answering at once"""
+
+    def __init__(self):
+        self.pending_requests = {}
+        self.previews = None
+        self.ipc_server = None
+        self.ipc_socket = None
+        self.lora_catalog = LoraCatalog([])
+        self.resolver = DiscordResolver(self)
+        self.progress = ProgressDispatcher(self, channel_edits=1000000, channel_window=1.0)
+
+    def get_channel(self, channel_id):
+        return FakeChannel()
+
+    def get_partial_messageable(self, channel_id):
+        return FakeChannel()
+
+    def get_user(self, user_id):
+        return SimpleNamespace(display_name='benchmark')
+
+    def add_view(self, view, message_id=None):
+        pass
+
+def start_bot(bot):
+    """Runs the bot's web server and callback socket on a loop in a thread"""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    async def start():
+        await start_web_server(bot)
+        ready.set()
+
+    thread = threading.Thread(target=lambda: (loop.run_until_complete(start()), loop.run_forever()), daemon=True)
+    thread.start()
+    ready.wait()
+    return loop
+
+def new_request(bot):
+    request_id = str(uuid.uuid4())
+    bot.pending_requests[request_id] = RequestItem(
+        id=request_id, user_id='1', channel_id='1', interaction_id='1', original_message_id='1',
+        resolution='1:1 [1024x1024 square]', workflow_filename=f'flux3_{request_id}.json',
+        prompt='a lighthouse on a cliff at dusk', loras=[], upscale_factor=1
+    )
+    return request_id
+
+def measure(calls):
+    """Runs each call; returns latencies and process CPU time per call"""
+    latencies = []
+    cpu = time.process_time()
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return latencies, (time.process_time() - cpu) / len(latencies)
+
+def report(name, latencies, cpu):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"  {name:<16} p50 {statistics.median(latencies) * 1000:7.3f} ms   p99 {p99 * 1000:7.3f} ms   "
+          f"CPU {cpu * 1000:7.3f} ms per callback")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=500)
+    parser.add_argument('--progress', type=int, default=2000)
+    parser.add_argument('--image-size', type=int, default=1024 * 1024, help="bytes per spooled image")
+    args = parser.parse_args()
+
+    init_db()
+    bot = FakeBot()
+    start_bot(bot)
+    # Connects to the socket the bot is now listening on
+    import comfygen
+    logging.getLogger().setLevel(logging.WARNING)
+    socket_client = comfygen.bot_ipc
+    if socket_client is None:
+        raise SystemExit("The callback socket is not available on this platform")
+    image = os.urandom(args.image_size)
+    images_sent = []
+
+    def image_call():
+        request_id = new_request(bot)
+        images_sent.append(request_id)
+        image_path = spool_file_path(IMAGE_SPOOL_DIR, 'bench.png')
+        with open(image_path, 'wb') as f:
+            f.write(image)
+        return lambda: comfygen.send_final_image(
+            request_id, '1', '1', '1', '1', 'a lighthouse on a cliff at dusk', '1:1 [1024x1024 square]',
+            '1:1 [1024x1024 square]', [], 1, 42, image_path
+        )
+
+    def progress_call():
+        request_id = new_request(bot)
+        return lambda: comfygen.post_progress_updates([(request_id, {'status': 'generating', 'progress': 50})])
+
+    print(f"{args.images} images of {args.image_size // 1024} KB, {args.progress} progress updates")
+    for name, client in (('http', None), ('socket', socket_client)):
+        comfygen.bot_ipc = client
+        # Warm up connections and code paths
+        measure([image_call() for _ in range(5)] + [progress_call() for _ in range(5)])
+        report(f"{name} image", *measure([image_call() for _ in range(args.images)]))
+        report(f"{name} progress", *measure([progress_call() for _ in range(args.progress)]))
+    # A delivered image's request is no longer pending
+    undelivered = sum(1 for request_id in images_sent if request_id in bot.pending_requests)
+    print(f"  images not delivered: {undelivered}")
+    if bot.ipc_socket and os.path.exists(bot.ipc_socket):
+        os.remove(bot.ipc_socket)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+image_history lookups on a large database, before and after the schema migrations:
+get_image_info, get_user_history and the duplicate check run by add_to_history.
+
+Seeds a throwaway database (nothing is written to image_history.db). From the
+repository root:
+    python -m benchmarks.bench_history_db --rows 1000000 --queries 50
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+# The duplicate check as it was before the migration: applying datetime() to the
+# column forces a scan of every row
+LEGACY_DUPLICATE_QUERY = """
+    SELECT id FROM image_history
+    WHERE user_id = ? AND prompt = ? AND
+    datetime(timestamp, 'unixepoch') = datetime(?, 'unixepoch')
+"""
+
+# image_history as created before the first migration
+UNMIGRATED_SCHEMA = """
+    CREATE TABLE image_history
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+     user_id TEXT,
+     prompt TEXT,
+     workflow JSON,
+     image_filename TEXT,
+     resolution TEXT,
+     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+     loras JSON,
+     upscale_factor INTEGER)
+"""
+
+DUPLICATE_QUERY = """
+    SELECT id FROM image_history
+    WHERE user_id = ? AND timestamp = datetime(?, 'unixepoch') AND prompt = ?
+"""
+
+def seed(conn, rows, users, rng):
+    now = int(time.time())
+    workflow = json.dumps({'69': {'inputs': {'prompt': ''}, 'class_type': 'CLIPTextEncode'}})
+    loras = json.dumps(['example.safetensors'])
+
+    def generate():
+        for index in range(rows):
+            timestamp = now - rng.randrange(365 * 24 * 3600)
+            yield (str(rng.randrange(users)), f"prompt {index}", workflow, f"image_{index}.png",
+                   '1024x1024', time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp)), loras, 1)
+
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO image_history (user_id, prompt, workflow, image_filename, resolution, timestamp, loras, upscale_factor) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", generate()
+    )
+    conn.commit()
+
+def time_per_call(check, args_list):
+    started = time.perf_counter()
+    for args in args_list:
+        check(*args)
+    return (time.perf_counter() - started) / len(args_list)
+
+def query_plan(conn, sql, params):
+    return '; '.join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='bench_history_')
+    db_path = os.path.join(workdir, 'image_history.db')
+    os.environ['IMAGE_HISTORY_DB'] = db_path
+
+    from Main import database
+
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.execute(UNMIGRATED_SCHEMA)
+        started = time.perf_counter()
+        seed(conn, args.rows, args.users, rng)
+        conn.close()
+        print(f"Seeded {args.rows} rows for {args.users} users in {time.perf_counter() - started:.1f} s")
+
+        filenames = [(f"image_{rng.randrange(args.rows)}.png",) for _ in range(args.queries)]
+        users = [(str(rng.randrange(args.users)),) for _ in range(args.queries)]
+        now = int(time.time())
+        duplicates = [(user, f"prompt {rng.randrange(args.rows)}", now) for (user,) in users]
+
+        def run_duplicate_check(sql, reorder):
+            def check(user_id, prompt, timestamp):
+                with database._db() as conn:
+                    params = (user_id, timestamp, prompt) if reorder else (user_id, prompt, timestamp)
+                    return conn.execute(sql, params).fetchone()
+            return check
+
+        def measure():
+            return {
+                'get_image_info': time_per_call(database.get_image_info, filenames),
+                'get_user_history': time_per_call(database.get_user_history, users),
+            }
+
+        before = measure()
+        before['duplicate check'] = time_per_call(run_duplicate_check(LEGACY_DUPLICATE_QUERY, False), duplicates)
+
+        started = time.perf_counter()
+        database.init_db()
+        with database._db() as conn:
+            version = database.get_schema_version(conn)
+        print(f"Migrated to schema version {version} in {time.perf_counter() - started:.1f} s")
+
+        after = measure()
+        after['duplicate check'] = time_per_call(run_duplicate_check(DUPLICATE_QUERY, True), duplicates)
+
+        for name in before:
+            print(f"{name:<18} before {before[name] * 1000:9.3f} ms   after {after[name] * 1000:7.3f} ms   "
+                  f"({before[name] / after[name]:.0f}x faster)")
+
+        with database._db() as conn:
+            print("Query plans after migration:")
+            print(f"  get_image_info:   {query_plan(conn, 'SELECT * FROM image_history WHERE image_filename = ?', filenames[0])}")
+            print(f"  get_user_history: {query_plan(conn, 'SELECT * FROM image_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?', (users[0][0], 10))}")
+            print(f"  duplicate check:  {query_plan(conn, DUPLICATE_QUERY, (users[0][0], now, 'prompt'))}")
+    finally:
+        database.close_db()
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+if __name__ == '__main__':
+    main()
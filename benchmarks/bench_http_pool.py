@@ -0,0 +1,91 @@
+"""
+Burst-load the ComfyUI HTTP endpoints with and without a keep-alive pool and report
+how many TCP connections each approach had to open.
+
+Starts a stub ComfyUI server on 127.0.0.1:8188. From the repository root:
+    python -m benchmarks.bench_http_pool --requests 500 --concurrency 16
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_comfyui import start_stub_comfyui
+from Main.http_pool import ConnectionStats, PooledSession, create_client_session
+
+BASE_URL = 'http://127.0.0.1:8188'
+PATHS = ['/history/unknown', '/queue', '/system_stats']
+
+def run_threaded(fetch, total, concurrency):
+    timings = []
+    lock = threading.Lock()
+
+    def timed(index):
+        started = time.perf_counter()
+        fetch(BASE_URL + PATHS[index % len(PATHS)])
+        with lock:
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(total)))
+    return time.perf_counter() - started, timings
+
+def fetch_urlopen(url):
+    with urllib.request.urlopen(url, timeout=120) as response:
+        response.read()
+
+async def run_aiohttp(total, concurrency, max_per_host):
+    stats = ConnectionStats()
+    session = create_client_session(stats, pool_size=concurrency, max_per_host=max_per_host)
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def timed(index):
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.get(BASE_URL + PATHS[index % len(PATHS)]) as response:
+                await response.read()
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(timed(index) for index in range(total)))
+    finally:
+        await session.close()
+    return time.perf_counter() - started, timings, stats.snapshot()
+
+def report(name, elapsed, timings, stats):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<18} {elapsed:7.2f} s  mean {statistics.mean(timings) * 1000:6.2f} ms  "
+          f"p99 {p99 * 1000:6.2f} ms  opened {stats['opened']:5d}  reused {stats['reused']:5d}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    runner, _ = await start_stub_comfyui(port=8188)
+    try:
+        elapsed, timings = await asyncio.to_thread(run_threaded, fetch_urlopen, args.requests, args.concurrency)
+        report("urlopen", elapsed, timings, {'opened': args.requests, 'reused': 0})
+
+        session = PooledSession(pool_size=4, max_per_host=args.concurrency)
+        elapsed, timings = await asyncio.to_thread(
+            run_threaded, lambda url: session.get(url).content, args.requests, args.concurrency
+        )
+        report("PooledSession", elapsed, timings, session.connection_stats())
+        session.close()
+
+        elapsed, timings, stats = await run_aiohttp(args.requests, args.concurrency, args.concurrency)
+        report("aiohttp pool", elapsed, timings, stats)
+    finally:
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+"""
+Peak Python memory and time to hand one large finished image from ComfyUI to the
+Discord upload, buffered as before against spooled to disk:
+
+  buffered   /view read into bytes, re-posted as a multipart part to the bot, read
+             into bytes again and uploaded from a BytesIO
+  streamed   /view streamed into a spool file, which is posted as a multipart part;
+             the bot streams it into a SpooledTemporaryFile and uploads from that
+  spooled    /view streamed into a spool file, its path posted to the bot, uploaded
+             from the file
+
+The bot endpoint and the Discord upload sink run in this process, so tracemalloc
+sees every copy the bot side makes; the stub ComfyUI runs as a separate process,
+like the real one. From the repository root:
+    python -m benchmarks.bench_image_delivery --size-mb 48 --runs 3
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Main.comfy imports Main.custom_commands and with it config, which needs these to be set
+for key, value in {
+    'DISCORD_TOKEN': 'benchmark', 'CHANNEL_IDS': '0', 'ALLOWED_SERVERS': '0',
+    'BOT_MANAGER_ROLE_ID': '0', 'PULIDWORKFLOW': 'PulidFluxDev.json', 'server_address': '127.0.0.1'
+}.items():
+    os.environ.setdefault(key, value)
+
+import aiohttp
+from aiohttp import web
+
+from Main.comfy import ComfyClient
+from Main.image_spool import SPOOL_CHUNK_SIZE, in_spool, remove_spooled, spool_upload
+
+IMAGE = {'filename': 'bench_upscaled.png', 'subfolder': '', 'type': 'output'}
+
+async def start_servers(port, spool_dir):
+    """The bot's /send_image and a Discord stand-in that discards uploads as they stream in"""
+    async def discord_upload(request):
+        reader = await request.multipart()
+        async for part in reader:
+            while await part.read_chunk(SPOOL_CHUNK_SIZE):
+                pass
+        return web.Response(text="ok")
+
+    async def send_image(request):
+        reader = await request.multipart()
+        image_data = image_path = image_file = None
+        async for part in reader:
+            if part.name == 'image_data' and 'stream' in request.query:
+                image_file = await spool_upload(part, spool_dir, 4 * 1024 ** 2, 1024 ** 3)
+            elif part.name == 'image_data':
+                image_data = await part.read(decode=False)
+            elif part.name == 'image_path':
+                image_path = await part.text()
+        async with aiohttp.ClientSession() as session:
+            form = aiohttp.FormData()
+            if image_path:
+                if not in_spool(image_path, spool_dir):
+                    return web.Response(status=400)
+                with open(image_path, 'rb') as f:
+                    form.add_field('file', f, filename='image.png')
+                    async with session.post(f"http://127.0.0.1:{port}/discord", data=form) as response:
+                        await response.read()
+                remove_spooled(image_path)
+            elif image_file:
+                with image_file:
+                    form.add_field('file', image_file, filename='image.png')
+                    async with session.post(f"http://127.0.0.1:{port}/discord", data=form) as response:
+                        await response.read()
+            else:
+                form.add_field('file', io.BytesIO(image_data), filename='image.png')
+                async with session.post(f"http://127.0.0.1:{port}/discord", data=form) as response:
+                    await response.read()
+        return web.Response(text="Success")
+
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_post('/discord', discord_upload)
+    app.router.add_post('/send_image', send_image)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host='127.0.0.1', port=port).start()
+    return runner
+
+async def deliver_buffered(client, session, port, spool_dir):
+    image_data, filename = await client.get_image(IMAGE['filename'], IMAGE['subfolder'], IMAGE['type'])
+    form = aiohttp.FormData()
+    form.add_field('request_id', 'bench')
+    form.add_field('image_data', image_data, filename=filename)
+    async with session.post(f"http://127.0.0.1:{port}/send_image", data=form) as response:
+        await response.read()
+
+async def deliver_streamed(client, session, port, spool_dir):
+    image_path = await client.download_image(IMAGE, spool_dir)
+    try:
+        with open(image_path, 'rb') as f:
+            form = aiohttp.FormData()
+            form.add_field('request_id', 'bench')
+            form.add_field('image_data', f, filename=IMAGE['filename'])
+            async with session.post(f"http://127.0.0.1:{port}/send_image?stream=1", data=form) as response:
+                await response.read()
+    finally:
+        remove_spooled(image_path)
+
+async def deliver_spooled(client, session, port, spool_dir):
+    image_path = await client.download_image(IMAGE, spool_dir)
+    form = aiohttp.FormData(default_to_multipart=True)
+    form.add_field('request_id', 'bench')
+    form.add_field('image_path', image_path)
+    async with session.post(f"http://127.0.0.1:{port}/send_image", data=form) as response:
+        await response.read()
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=48)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--comfy-port', type=int, default=18488)
+    parser.add_argument('--bot-port', type=int, default=18489)
+    args = parser.parse_args()
+
+    spool_dir = tempfile.mkdtemp(prefix='bench_spool_')
+    comfyui = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'benchmarks.stub_comfyui', '--port', str(args.comfy_port),
+        '--image-size', str(args.size_mb * 1024 ** 2),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    bot_runner = await start_servers(args.bot_port, spool_dir)
+    client = ComfyClient('127.0.0.1', port=args.comfy_port)
+    for _ in range(100):
+        try:
+            await client.connect()
+            break
+        except aiohttp.ClientError:
+            # The stub is still starting
+            await asyncio.sleep(0.1)
+    session = aiohttp.ClientSession()
+    print(f"Delivering a {args.size_mb} MB image, {args.runs} runs each")
+    try:
+        for name, deliver in (('buffered', deliver_buffered), ('streamed', deliver_streamed),
+                              ('spooled', deliver_spooled)):
+            peaks, timings = [], []
+            for _ in range(args.runs):
+                tracemalloc.start()
+                started = time.perf_counter()
+                await deliver(client, session, args.bot_port, spool_dir)
+                timings.append(time.perf_counter() - started)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            print(f"  {name:<9} peak Python memory {max(peaks) / 1024 ** 2:7.1f} MB   "
+                  f"median time {statistics.median(timings) * 1000:7.1f} ms")
+    finally:
+        await session.close()
+        await client.close()
+        await bot_runner.cleanup()
+        comfyui.terminate()
+        await comfyui.wait()
+        os.rmdir(spool_dir)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""
+SecurityMiddleware under a flood of scanners, with its permanent blocks kept two ways:
+
+  json rewrite   exact-address dict, the whole JSON file rewritten on the event loop
+                 for every new block (the behaviour before BlockLog and IpMatcher)
+  block log      IpMatcher tries for trusted and blocked networks, new blocks
+                 appended to a log by a background thread and compacted into the
+                 JSON file every --compact-after blocks
+
+--scanners distinct IPs each request a path that isn't served, which blocks them;
+then --requests requests from allowed IPs go through while --ranges blocked CIDR
+ranges and every scanner block are in place. Reports the middleware's time per
+request on the event loop, and for the flood how long until every block was on
+disk and how many bytes were written for it. Files go to a temporary directory.
+From the repository root:
+    python -m benchmarks.bench_ip_blocks --scanners 5000 --requests 50000
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from aiohttp import web
+
+from security_middleware import SecurityConfig, SecurityMiddleware
+
+logger = logging.getLogger(__name__)
+
+class JsonRewriteMiddleware(SecurityMiddleware):
+    """Keeps permanent blocks the way SecurityMiddleware did before BlockLog"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.trusted_ips = set(config.trusted_networks)
+        self.bytes_written = 0
+
+    def save_permanent_blocks(self):
+        logger.warning(f"Attempting to save blocks to: {self.permanent_blocks_file}")
+        logger.warning(f"Current blocks to save: {self.permanent_blocks}")
+        with open(self.permanent_blocks_file, 'w') as f:
+            json.dump(self.permanent_blocks, f, indent=2)
+        self.bytes_written += os.path.getsize(self.permanent_blocks_file)
+        logger.warning("Successfully saved blocked IPs to file")
+
+    def add_permanent_block(self, ip, reason):
+        if not self.is_trusted_ip(ip):
+            logger.warning(f"Adding permanent block for IP {ip} with reason: {reason}")
+            current_time = datetime.now().isoformat()
+            self.permanent_blocks[ip] = {'timestamp': current_time, 'reason': reason}
+            logger.info(f"Added block for {ip} at {current_time}")
+            self.save_permanent_blocks()
+            logger.warning(f"IP {ip} permanently blocked: {reason}")
+
+    def is_trusted_ip(self, ip):
+        return ip in self.trusted_ips
+
+    def is_permanently_blocked(self, ip):
+        return ip in self.permanent_blocks
+
+    def close(self, timeout=None):
+        pass
+
+async def handler(request):
+    return web.Response(text="Progress updated")
+
+def addresses(first, count):
+    start = int(ipaddress.IPv4Address(first))
+    return [str(ipaddress.IPv4Address(start + index)) for index in range(count)]
+
+async def replay(security, ips, path):
+    """Returns the middleware's seconds per request and the statuses it answered with"""
+    elapsed = 0.0
+    statuses = {}
+    for ip in ips:
+        request = SimpleNamespace(method='POST', path=path, remote=ip, headers={'X-Forwarded-For': ip})
+        started = time.perf_counter()
+        response = await security.middleware(request, handler)
+        elapsed += time.perf_counter() - started
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+    return elapsed / len(ips), statuses
+
+def disk_bytes(security):
+    if isinstance(security, JsonRewriteMiddleware):
+        return security.bytes_written
+    # Log lines plus every snapshot written, approximated by the final one per compaction
+    log_bytes = os.path.getsize(security.block_log.log_file) if os.path.exists(security.block_log.log_file) else 0
+    snapshot = os.path.getsize(security.permanent_blocks_file) if os.path.exists(security.permanent_blocks_file) else 0
+    return log_bytes + snapshot * max(1, security.block_log.compactions)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scanners', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=50000)
+    parser.add_argument('--ranges', type=int, default=200, help="blocked /24 ranges besides the scanners")
+    parser.add_argument('--compact-after', type=int, default=1000)
+    args = parser.parse_args()
+    # Both keep their log calls; the lines just aren't printed
+    logging.disable(logging.CRITICAL)
+
+    scanners = addresses('198.18.0.0', args.scanners)
+    # Allowed clients, outside the blocked ranges
+    clients = addresses('100.64.0.0', args.requests)
+    ranges = [f"203.0.{index % 256}.0/24" if index < 256 else f"192.0.{index % 256}.0/24" for index in range(args.ranges)]
+
+    print(f"{args.scanners} scanners blocked, then {args.requests} allowed requests with {args.ranges} "
+          f"blocked ranges")
+    for name, cls in (('json rewrite', JsonRewriteMiddleware), ('block log', SecurityMiddleware)):
+        with tempfile.TemporaryDirectory() as directory:
+            config = SecurityConfig(
+                max_requests_per_minute=10,
+                blocked_networks=set(ranges),
+                permanent_blocks_file=os.path.join(directory, 'BlockedSecurityIps.json'),
+                block_log_compact_after=args.compact_after
+            )
+            security = cls(config)
+
+            started = time.perf_counter()
+            flood, flood_statuses = await replay(security, scanners, '/wp-login.php')
+            security.close(60)
+            on_disk = time.perf_counter() - started
+            written = disk_bytes(security)
+            allowed, allowed_statuses = await replay(security, clients, '/update_progress')
+            blocked_again, _ = await replay(security, scanners, '/update_progress')
+
+            print(f"  {name:<13} flood {flood * 1e6:8.1f} us per request, all on disk after {on_disk:6.2f} s, "
+                  f"{written / 2 ** 20:8.1f} MB written {flood_statuses}")
+            print(f"  {'':<13} allowed {allowed * 1e6:6.2f} us per request {allowed_statuses}   "
+                  f"blocked scanner {blocked_again * 1e6:6.2f} us per request")
+
+if __name__ == '__main__':
+    asyncio.run(main())
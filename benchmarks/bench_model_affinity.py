@@ -0,0 +1,121 @@
+"""
+Mixed workload of several workflows and LoRA sets on stub ComfyUI backends that
+take --load-delay seconds to load a checkpoint, routed two ways:
+
+  clear every job   least expected wait, model cache cleared before every prompt
+                    (the behaviour before model-affinity routing)
+  model affinity    warm backends first, cache cleared only under memory pressure
+
+Reports makespan, mean and p95 latency, checkpoint loads and cache clears. From the
+repository root:
+    python -m benchmarks.bench_model_affinity --backends 2 --jobs 80 --workflows 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import time
+
+# Main.comfy imports Main.custom_commands and with it config, which needs these to be set
+for key, value in {
+    'DISCORD_TOKEN': 'benchmark', 'CHANNEL_IDS': '0', 'ALLOWED_SERVERS': '0',
+    'BOT_MANAGER_ROLE_ID': '0', 'PULIDWORKFLOW': 'PulidFluxDev.json', 'server_address': '127.0.0.1'
+}.items():
+    os.environ.setdefault(key, value)
+
+from benchmarks.stub_comfyui import start_stub_comfyui
+from Main.comfy import AdmissionController, Backend, BackendPool, ComfyClient
+from Main.scheduler import FairScheduler, PRIORITY_NORMAL
+
+def build_workflow(workflow, loras):
+    nodes = {'1': {'class_type': 'UNETLoader', 'inputs': {'unet_name': workflow}}}
+    for index, lora in enumerate(loras):
+        nodes[f"lora{index}"] = {'class_type': 'LoraLoader', 'inputs': {'lora_name': lora}}
+    nodes['9'] = {'class_type': 'SaveImage', 'inputs': {}}
+    return nodes
+
+def make_jobs(args):
+    rng = random.Random(args.seed)
+    lora_sets = [(), ('detail.safetensors',), ('anime.safetensors', 'detail.safetensors')]
+    jobs = []
+    for job in range(args.jobs):
+        user = rng.randrange(args.users)
+        # Users mostly stick to one workflow
+        workflow = user % args.workflows if rng.random() < 0.8 else rng.randrange(args.workflows)
+        jobs.append((job, f"user{user}", f"workflow{workflow}.safetensors", rng.choice(lora_sets)))
+    return jobs
+
+async def run(args, jobs, affinity):
+    ports = [args.base_port + index for index in range(args.backends)]
+    stubs = [await start_stub_comfyui(port=port, steps=10, step_delay=0.005, image_size=1024,
+                                      load_delay=args.load_delay) for port in ports]
+    clients = {f"127.0.0.1:{port}": ComfyClient('127.0.0.1', port=port) for port in ports}
+    await asyncio.gather(*(client.connect() for client in clients.values()))
+    pool = BackendPool(
+        [Backend(AdmissionController('127.0.0.1', args.max_in_flight, port=port, probe_interval=0.05))
+         for port in ports],
+        models=(lambda item: (item[2], item[3])) if affinity else None,
+        health_interval=1.0
+    )
+    latencies = []
+    started = time.perf_counter()
+
+    async def dispatch(item, backend):
+        clear_cache = await pool.prepare(backend, item) if affinity else True
+
+        async def generate():
+            async def on_progress(data):
+                pass
+            client = clients[backend.address]
+            if clear_cache:
+                await client.clear_cache()
+            await client.run_prompt(build_workflow(item[2], item[3]), on_progress)
+            latencies.append(time.perf_counter() - started)
+            return True
+        return asyncio.create_task(generate())
+
+    scheduler = FairScheduler(lambda item: (PRIORITY_NORMAL, 'guild', item[1], 'standard'), dispatch, pool)
+    pool.start()
+    for item in jobs:
+        await scheduler.put(item)
+    scheduler.start()
+    while scheduler.qsize() or scheduler.running:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    await scheduler.stop()
+    await pool.close()
+    for client in clients.values():
+        await client.close()
+    loads = sum(stub.model_loads for _, stub in stubs)
+    clears = sum(stub.cache_clears for _, stub in stubs)
+    for runner, _ in stubs:
+        await runner.cleanup()
+    latencies.sort()
+    return elapsed, statistics.mean(latencies), latencies[int(len(latencies) * 0.95) - 1], loads, clears
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', type=int, default=2)
+    parser.add_argument('--jobs', type=int, default=80)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--workflows', type=int, default=4)
+    parser.add_argument('--load-delay', type=float, default=0.2)
+    parser.add_argument('--max-in-flight', type=int, default=2)
+    parser.add_argument('--base-port', type=int, default=18288)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    jobs = make_jobs(args)
+    print(f"{args.jobs} jobs, {args.workflows} workflows, {args.backends} backends, "
+          f"{args.load_delay * 1000:.0f} ms per checkpoint load")
+    for name, affinity in (('clear every job', False), ('model affinity', True)):
+        elapsed, mean, p95, loads, clears = await run(args, jobs, affinity)
+        print(f"  {name:<16} makespan {elapsed:6.2f} s   mean latency {mean:6.2f} s   p95 {p95:6.2f} s   "
+              f"checkpoint loads {loads:3d}   cache clears {clears:3d}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+Live previews of concurrent generations in one Discord channel, from stub ComfyUI
+backends that send a preview frame per sampler step, shown two ways:
+
+  every frame   each frame recompressed on the event loop and edited in at once
+  publisher     PreviewPublisher: newest frame per request, per-request interval,
+                per-channel edit budget, recompressed in a thread
+
+The Discord edit is a sink that takes --edit-latency seconds. Reports frames,
+edits, the most edits in any 5 s (Discord allows 5 per channel), edits over that
+limit (each would be a 429) and the worst event loop stall. From the repository root:
+    python -m benchmarks.bench_previews --backends 3 --jobs 9
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+# Main.comfy imports Main.custom_commands and with it config, which needs these to be set
+for key, value in {
+    'DISCORD_TOKEN': 'benchmark', 'CHANNEL_IDS': '0', 'ALLOWED_SERVERS': '0',
+    'BOT_MANAGER_ROLE_ID': '0', 'PULIDWORKFLOW': 'PulidFluxDev.json', 'server_address': '127.0.0.1'
+}.items():
+    os.environ.setdefault(key, value)
+
+from benchmarks.stub_comfyui import start_stub_comfyui
+from Main.comfy import ComfyClient
+from Main.previews import PreviewPublisher
+
+WORKFLOW = {'3': {'class_type': 'KSampler', 'inputs': {}}, '9': {'class_type': 'SaveImage', 'inputs': {}}}
+DISCORD_EDITS, DISCORD_WINDOW = 5, 5.0
+
+def edit_stats(times):
+    """Most edits in any Discord window, and edits beyond its limit"""
+    window, peak, over = deque(), 0, 0
+    for edited in sorted(times):
+        while window and window[0] <= edited - DISCORD_WINDOW:
+            window.popleft()
+        if len(window) >= DISCORD_EDITS:
+            over += 1
+            continue
+        window.append(edited)
+        peak = max(peak, len(window))
+    return peak, over
+
+async def run(args, use_publisher):
+    ports = [args.base_port + index for index in range(args.backends)]
+    stubs = [await start_stub_comfyui(port=port, steps=args.steps, step_delay=args.step_delay,
+                                      image_size=1024, preview_size=args.preview_size) for port in ports]
+    clients = [ComfyClient('127.0.0.1', port=port) for port in ports]
+    await asyncio.gather(*(client.connect() for client in clients))
+    edits = []
+    frames = 0
+
+    async def discord_edit(request_id, preview):
+        edits.append(time.perf_counter())
+        await asyncio.sleep(args.edit_latency)
+
+    publisher = PreviewPublisher(discord_edit)
+    # Encoding settings shared by both ways
+    encode = publisher.encode
+
+    stall = 0.0
+    running = True
+
+    async def watch_loop():
+        nonlocal stall
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stall = max(stall, time.perf_counter() - started - 0.005)
+    watcher = asyncio.create_task(watch_loop())
+
+    async def generate(job, client):
+        async def on_progress(data):
+            pass
+
+        async def on_preview(image):
+            nonlocal frames
+            frames += 1
+            if use_publisher:
+                publisher.publish(job, 'channel', image)
+            else:
+                await discord_edit(job, encode(image))
+        await client.execute_prompt(WORKFLOW, on_progress, preview_callback=on_preview)
+        await publisher.finish(job)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(generate(f"job{job}", clients[job % len(clients)]) for job in range(args.jobs)))
+    elapsed = time.perf_counter() - started
+    running = False
+    await watcher
+
+    await publisher.close()
+    for client in clients:
+        await client.close()
+    for runner, _ in stubs:
+        await runner.cleanup()
+    return elapsed, frames, len(edits), *edit_stats(edits), stall
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=9)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--step-delay', type=float, default=0.15)
+    parser.add_argument('--preview-size', type=int, default=512)
+    parser.add_argument('--edit-latency', type=float, default=0.1)
+    parser.add_argument('--base-port', type=int, default=18588)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    print(f"{args.jobs} jobs of {args.steps} steps on {args.backends} backends, one channel, "
+          f"{args.preview_size} px previews")
+    for name, use_publisher in (('every frame', False), ('publisher', True)):
+        elapsed, frames, edits, peak, over, stall = await run(args, use_publisher)
+        print(f"  {name:<12} {elapsed:6.2f} s   frames {frames:4d}   edits {edits:4d}   "
+              f"most in {DISCORD_WINDOW:.0f} s {peak:2d}   over the limit {over:4d}   "
+              f"worst loop stall {stall * 1000:6.1f} ms")
+
+if __name__ == '__main__':
+    asyncio.run(main())
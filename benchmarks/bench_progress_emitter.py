@@ -0,0 +1,146 @@
+"""
+How long comfygen's websocket read loop takes to follow a generation while the bot is
+slow to answer progress callbacks, with progress posted three ways:
+
+  none       no progress posted, how long following the generation takes at best
+  blocking   each update posted from the read loop, waiting for the bot's answer
+             (the behaviour before ProgressEmitter)
+  emitter    ProgressEmitter: updates queued, newest per request, posted in batches
+             from a background thread
+
+--jobs generations run at once, each reading its own websocket in a thread, like
+requests sharing a process. The stub ComfyUI listens on 127.0.0.1:--port and a stub
+bot that takes --bot-latency seconds per request on 127.0.0.1:8080, so nothing else
+may use that port while this runs. From the repository root:
+    python -m benchmarks.bench_progress_emitter --jobs 4 --bot-latency 0.25
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import websocket
+
+# comfygen imports config, which needs these to be set
+for key, value in {
+    'DISCORD_TOKEN': 'benchmark', 'CHANNEL_IDS': '0', 'ALLOWED_SERVERS': '0',
+    'BOT_MANAGER_ROLE_ID': '0', 'PULIDWORKFLOW': 'PulidFluxDev.json',
+    'server_address': '127.0.0.1', 'BOT_SERVER': '127.0.0.1'
+}.items():
+    os.environ.setdefault(key, value)
+
+from aiohttp import web
+
+from benchmarks.stub_comfyui import start_stub_comfyui
+
+WORKFLOW = {'3': {'class_type': 'KSampler', 'inputs': {}}, '9': {'class_type': 'SaveImage', 'inputs': {}}}
+
+class StubBot:
+    """Answers /update_progress after a delay and records what it was told"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.posts = 0
+        # request_id -> time its final status arrived
+        self.finished = {}
+
+    async def update_progress(self, request):
+        data = await request.json()
+        await asyncio.sleep(self.latency)
+        self.posts += 1
+        for update in data.get('updates', [data]):
+            if update.get('progress_data', {}).get('status') == 'complete':
+                self.finished[update['request_id']] = time.perf_counter()
+        return web.Response(text="Progress updated")
+
+def start_servers(args, bot):
+    """Runs the stub ComfyUI and the stub bot on a loop in a thread"""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    runners = []
+
+    async def start():
+        runner, _ = await start_stub_comfyui(port=args.port, steps=args.steps, step_delay=args.step_delay,
+                                             image_size=1024)
+        runners.append(runner)
+        app = web.Application()
+        app.router.add_post('/update_progress', bot.update_progress)
+        bot_runner = web.AppRunner(app, access_log=None)
+        await bot_runner.setup()
+        await web.TCPSite(bot_runner, host='127.0.0.1', port=8080).start()
+        runners.append(bot_runner)
+        ready.set()
+
+    thread = threading.Thread(target=lambda: (loop.run_until_complete(start()), loop.run_forever()), daemon=True)
+    thread.start()
+    ready.wait()
+
+    def stop():
+        for runner in runners:
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+    return stop
+
+def follow(comfygen, mode):
+    """Follows one generation; returns its request_id and how long the read loop took"""
+    request_id = str(uuid.uuid4())
+    ws_client_id = str(uuid.uuid4())
+    ws = websocket.create_connection(f"ws://{comfygen.comfyui_address}/ws?clientId={ws_client_id}", timeout=120)
+
+    def progress_callback(data):
+        if mode == 'blocking':
+            comfygen.post_progress_updates([(request_id, data)])
+        elif mode == 'emitter':
+            comfygen.send_progress_update(request_id, data)
+
+    try:
+        started = time.perf_counter()
+        comfygen.get_outputs(ws, WORKFLOW, progress_callback, prompt_client_id=ws_client_id)
+        return request_id, started, time.perf_counter() - started
+    finally:
+        ws.close()
+
+def run(comfygen, args, mode):
+    bot = StubBot(args.bot_latency)
+    stop = start_servers(args, bot)
+    try:
+        with ThreadPoolExecutor(args.jobs) as executor:
+            results = list(executor.map(lambda _: follow(comfygen, mode), range(args.jobs)))
+        comfygen.progress_emitter.flush()
+        # From the start of a generation until the bot knew it was complete
+        known = [bot.finished[request_id] - started for request_id, started, _ in results
+                 if request_id in bot.finished]
+        return [elapsed for _, _, elapsed in results], known, bot.posts
+    finally:
+        stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--step-delay', type=float, default=0.02)
+    parser.add_argument('--bot-latency', type=float, default=0.25)
+    parser.add_argument('--port', type=int, default=18688)
+    args = parser.parse_args()
+    os.environ['COMFYUI_BACKEND'] = f'127.0.0.1:{args.port}'
+    import comfygen
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{args.jobs} generations of {args.steps} steps at once, bot answers in {args.bot_latency * 1000:.0f} ms")
+    for mode in ('none', 'blocking', 'emitter'):
+        read_loop, known, posts = run(comfygen, args, mode)
+        line = f"  {mode:<9} read loop {statistics.mean(read_loop):6.2f} s mean, {max(read_loop):6.2f} s max"
+        if mode != 'none':
+            line += (f"   posts {posts:4d}   bot knew of completion after "
+                     f"{statistics.mean(known):6.2f} s mean, {max(known):6.2f} s max")
+        print(line)
+    comfygen.progress_emitter.close()
+
+if __name__ == '__main__':
+    main()
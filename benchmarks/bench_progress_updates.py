@@ -0,0 +1,129 @@
+"""
+Progress updates of concurrent jobs in a few Discord channels, sent two ways:
+
+  fetch + edit   every update fetches the channel and the message, then edits it
+                 (the behaviour before ProgressDispatcher)
+  dispatcher     ProgressDispatcher: cached PartialMessages, newest text only,
+                 per-channel edit budget
+
+Jobs wait in a queue (every finished job moves the rest up a place) and then report
+ten progress milestones. Discord is a stand-in that takes --latency seconds per call
+and, like the real one, allows 5 edits per 5 s per channel; an edit over that limit
+gets a 429 and is retried when the bucket resets, as discord.py does. Reports API
+calls, 429s, and how long after a job's last update its message showed it. From the
+repository root:
+    python -m benchmarks.bench_progress_updates --jobs 12 --channels 2 --concurrency 4
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import deque
+from types import SimpleNamespace
+
+from Main.progress_updates import ProgressDispatcher
+
+DISCORD_EDITS, DISCORD_WINDOW = 5, 5.0
+
+class FakeDiscord:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.rate_limited = 0
+        self.recent = {}
+        # message_id -> (text, time it was shown)
+        self.shown = {}
+
+    async def call(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+    async def edit(self, channel_id, message_id, content):
+        recent = self.recent.setdefault(channel_id, deque())
+        while True:
+            now = time.perf_counter()
+            while recent and recent[0] <= now - DISCORD_WINDOW:
+                recent.popleft()
+            if len(recent) < DISCORD_EDITS:
+                break
+            self.calls += 1
+            self.rate_limited += 1
+            await asyncio.sleep(recent[0] + DISCORD_WINDOW - now)
+        recent.append(time.perf_counter())
+        await self.call()
+        self.shown[message_id] = (content, time.perf_counter())
+
+    # discord.Client.get_partial_messageable(...).get_partial_message(...)
+    def get_partial_messageable(self, channel_id):
+        discord = self
+
+        class Channel:
+            id = channel_id
+
+            def get_partial_message(self, message_id):
+                async def edit(content):
+                    await discord.edit(channel_id, message_id, content)
+                return SimpleNamespace(id=message_id, channel=self, edit=edit)
+        return Channel()
+
+async def run(args, use_dispatcher):
+    discord = FakeDiscord(args.latency)
+    dispatcher = ProgressDispatcher(discord)
+    last_update = {}
+
+    async def update(job, content):
+        channel_id, message_id = job % args.channels, job
+        last_update[message_id] = (content, time.perf_counter())
+        if use_dispatcher:
+            dispatcher.update(channel_id, message_id, content)
+        else:
+            await discord.call()  # fetch_channel
+            await discord.call()  # fetch_message
+            await discord.edit(channel_id, message_id, content)
+
+    waiting = list(range(args.jobs))
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def job_task(job):
+        async with slots:
+            waiting.remove(job)
+            for position, other in enumerate(waiting, 1):
+                await update(other, f"queued, position {position} of {len(waiting)}")
+            await update(job, "Starting execution...")
+            for milestone in range(10, 101, 10):
+                await asyncio.sleep(args.step)
+                await update(job, f"Generating image... {milestone}%")
+            await update(job, "Generation complete!")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(job_task(job) for job in range(args.jobs)))
+    # Let the dispatcher catch up
+    while dispatcher.senders:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    staleness = [discord.shown[message_id][1] - updated for message_id, (content, updated) in last_update.items()
+                 if discord.shown.get(message_id, (None,))[0] == content]
+    stats = dispatcher.stats()
+    await dispatcher.close()
+    return elapsed, discord.calls, discord.rate_limited, statistics.mean(staleness), max(staleness), stats
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=12)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--step', type=float, default=0.5, help="seconds between progress milestones")
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"{args.jobs} jobs in {args.channels} channels, {args.concurrency} at a time")
+    for name, use_dispatcher in (('fetch + edit', False), ('dispatcher', True)):
+        elapsed, calls, rate_limited, mean_lag, max_lag, stats = await run(args, use_dispatcher)
+        print(f"  {name:<13} {elapsed:6.2f} s   API calls {calls:5d}   429s {rate_limited:4d}   "
+              f"final text shown after {mean_lag:5.2f} s mean, {max_lag:5.2f} s max")
+        if use_dispatcher:
+            print(f"  {'':<13} {stats}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Burst of standard requests through the in-process workers against a stub ComfyUI,
+each request its own prompt versus compatible requests coalesced into merged prompts.
+
+Uses the real workflow file, so the merge runs on the actual graph. The stub charges
+--prompt-overhead seconds per prompt on top of the sampler steps of every branch;
+batching saves that, the per-prompt round trips and the idle gaps between prompts,
+never the sampling itself. The stub listens on --port. From the repository root:
+    python -m benchmarks.bench_prompt_batching --jobs 40 --workers 4 --batch-size 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+
+# comfygen imports config, which needs these to be set
+for key, value in {
+    'DISCORD_TOKEN': 'benchmark', 'CHANNEL_IDS': '0', 'ALLOWED_SERVERS': '0',
+    'BOT_MANAGER_ROLE_ID': '0', 'PULIDWORKFLOW': 'PulidFluxDev.json', 'server_address': '127.0.0.1'
+}.items():
+    os.environ.setdefault(key, value)
+
+from benchmarks.stub_comfyui import start_stub_comfyui
+from Main.comfy import ComfyClient, ComfyWorkerPool
+from Main.utils import load_json
+
+WORKFLOW = os.getenv('fluxversion', 'FluxDev24GB.json').strip('"')
+
+def make_job(request_id, rng):
+    return {
+        'request_id': request_id, 'user_id': '0', 'channel_id': '0', 'interaction_id': '0',
+        'original_message_id': '0', 'request_type': 'standard',
+        'prompt': f'a lighthouse on a cliff at dusk, variation {rng.randrange(1000)}',
+        'resolution': '1:1 [1024x1024 square]', 'loras': [], 'upscale_factor': 1,
+        'seed': str(rng.randrange(2 ** 32)),
+        'workflow_filename': f'flux3_bench_{request_id}.json', 'workflow': load_json(WORKFLOW)
+    }
+
+async def run(args, batch_size):
+    rng = random.Random(args.seed)
+    runner, stub = await start_stub_comfyui(port=args.port, steps=args.steps, step_delay=args.step_delay,
+                                            image_size=1024, prompt_overhead=args.prompt_overhead)
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+
+    async def on_progress(request_id, progress_data):
+        pass
+
+    async def on_result(job, metadata, final_image, workflow):
+        latencies.append(time.perf_counter() - started)
+
+    pool = ComfyWorkerPool(args.workers, ComfyClient('127.0.0.1', port=args.port), on_progress, on_result,
+                           batch_window=args.window, batch_max_size=batch_size)
+    await pool.start()
+    try:
+        started = time.perf_counter()
+        done = [await pool.submit(str(uuid.uuid4()), make_job(uuid.uuid4().hex, rng))
+                for _ in range(args.jobs)]
+        failures = sum(1 for succeeded in await asyncio.gather(*done) if not succeeded)
+        elapsed = time.perf_counter() - started
+    finally:
+        await pool.stop()
+        await runner.cleanup()
+    return elapsed, latencies, failures, stub.prompts_queued
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--window', type=float, default=0.25)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--step-delay', type=float, default=0.01)
+    parser.add_argument('--prompt-overhead', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=18388)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.jobs} jobs on {args.workers} workers, {args.steps} steps of {args.step_delay * 1000:.0f} ms, "
+          f"{args.prompt_overhead * 1000:.0f} ms per prompt")
+    for name, batch_size in (('one prompt each', 1), (f"batches of {args.batch_size}", args.batch_size)):
+        elapsed, latencies, failures, prompts = await run(args, batch_size)
+        print(f"  {name:<16} makespan {elapsed:6.2f} s   mean latency {statistics.mean(latencies):5.2f} s   "
+              f"ComfyUI prompts {prompts:3d}   failed {failures}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+Load test of SecurityMiddleware's rate limiting: requests from --ips distinct client
+IPs, --requests-per-ip each, round robin so every IP stays active, replayed through
+the middleware three ways:
+
+  sliding window   a list of request times per IP, rebuilt on every request and
+                   never dropped (the behaviour before RateLimiter)
+  token bucket     RateLimiter, one LRU table of buckets
+  token bucket x8  RateLimiter split into 8 shards by IP hash
+
+Reports the middleware's time per request (the handler returns at once) and the
+memory it holds: the peak during the replay and what is left after it. From the
+repository root:
+    python -m benchmarks.bench_rate_limiter --ips 100000 --requests-per-ip 3
+"""
+import argparse
+import asyncio
+import gc
+import ipaddress
+import logging
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from aiohttp import web
+
+from security_middleware import SecurityConfig, SecurityMiddleware
+
+class SlidingWindowMiddleware(SecurityMiddleware):
+    """Rate limits with the per-IP lists of request times used before RateLimiter"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.request_counts = {}
+
+    def is_rate_limited(self, ip):
+        if self.is_trusted_ip(ip):
+            return False
+        current_time = time.time()
+        if ip not in self.request_counts:
+            self.request_counts[ip] = []
+        self.request_counts[ip] = [t for t in self.request_counts[ip] if current_time - t < 60]
+        if len(self.request_counts[ip]) >= self.config.max_requests_per_minute:
+            self.add_permanent_block(ip, "Rate limit exceeded")
+            return True
+        self.request_counts[ip].append(current_time)
+        return False
+
+async def handler(request):
+    return web.Response(text="Progress updated")
+
+def make_middleware(name, args):
+    config = SecurityConfig(max_requests_per_minute=10, rate_limit_max_ips=args.max_ips,
+                            rate_limit_shards=8 if name == 'token bucket x8' else 1)
+    if name == 'sliding window':
+        return SlidingWindowMiddleware(config)
+    return SecurityMiddleware(config)
+
+async def replay(security, ips, requests_per_ip):
+    """Returns the middleware's seconds per request and the statuses it answered with"""
+    elapsed = 0.0
+    statuses = {}
+    for _ in range(requests_per_ip):
+        for ip in ips:
+            # What the middleware reads of a request; aiohttp's mocked requests are far slower
+            request = SimpleNamespace(method='POST', path='/update_progress', remote=ip,
+                                      headers={'X-Forwarded-For': ip})
+            started = time.perf_counter()
+            response = await security.middleware(request, handler)
+            elapsed += time.perf_counter() - started
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+    return elapsed / (len(ips) * requests_per_ip), statuses
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ips', type=int, default=100000)
+    parser.add_argument('--requests-per-ip', type=int, default=3)
+    parser.add_argument('--max-ips', type=int, default=10000, help="RateLimiter table size")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    first = int(ipaddress.IPv4Address('10.0.0.0'))
+    ips = [str(ipaddress.IPv4Address(first + index)) for index in range(args.ips)]
+
+    print(f"{args.ips} IPs, {args.requests_per_ip} requests each, limit 10 per minute")
+    for name in ('sliding window', 'token bucket', 'token bucket x8'):
+        per_request, statuses = await replay(make_middleware(name, args), ips, args.requests_per_ip)
+
+        # Memory in a second run, as tracing slows everything down
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        security = make_middleware(name, args)
+        await replay(security, ips, args.requests_per_ip)
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del security
+
+        print(f"  {name:<16} {per_request * 1e6:6.2f} us per request   "
+              f"peak {(peak - baseline) / 2 ** 20:6.1f} MB   held after {(current - baseline) / 2 ** 20:6.1f} MB   "
+              f"statuses {statuses}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""
+Compare time-to-first-progress of cold comfygen.py subprocesses against warm
+in-process workers, both talking to a local stub ComfyUI server.
+
+The stub listens on 127.0.0.1:8188 and a fake bot callback server on 127.0.0.1:8080,
+so nothing else may use those ports while this runs. From the repository root:
+    python -m benchmarks.bench_worker_pool --jobs 10 --workers 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+# comfygen imports config, which needs these to be set
+for key, value in {
+    'DISCORD_TOKEN': 'benchmark', 'CHANNEL_IDS': '0', 'ALLOWED_SERVERS': '0',
+    'BOT_MANAGER_ROLE_ID': '0', 'PULIDWORKFLOW': 'PulidFluxDev.json',
+    'server_address': '127.0.0.1', 'BOT_SERVER': '127.0.0.1',
+    'IMAGE_HISTORY_DB': os.path.join(tempfile.gettempdir(), 'bench_image_history.db')
+}.items():
+    os.environ.setdefault(key, value)
+
+from aiohttp import web
+
+from benchmarks.stub_comfyui import start_stub_comfyui
+from Main.comfy import ComfyClient, ComfyWorkerPool
+from Main.database import init_db
+from Main.utils import load_json
+
+WORKFLOW = os.getenv('fluxversion', 'FluxDev24GB.json').strip('"')
+
+class ProgressRecorder:
+    """Records when each request first reports sampler progress and when it finishes."""
+
+    def __init__(self):
+        self.first_progress = {}
+        self.done = {}
+
+    def waiter(self, request_id):
+        self.first_progress[request_id] = asyncio.Event()
+        self.done[request_id] = asyncio.Event()
+
+    def record(self, request_id, progress_data):
+        status = progress_data.get('status')
+        if status == 'generating' and request_id in self.first_progress:
+            self.first_progress[request_id].set()
+        elif status == 'error' and request_id in self.done:
+            print(f"  request {request_id} failed: {progress_data.get('message')}")
+            self.done[request_id].set()
+
+    def finish(self, request_id):
+        if request_id in self.done:
+            self.done[request_id].set()
+
+async def start_bot_stub(recorder: ProgressRecorder):
+    async def update_progress(request):
+        data = await request.json()
+        for update in data.get('updates', [data]):
+            recorder.record(update['request_id'], update.get('progress_data', {}))
+        return web.Response(text="Progress updated")
+
+    async def send_image(request):
+        reader = await request.multipart()
+        async for part in reader:
+            value = await part.read(decode=False)
+            if part.name == 'request_id':
+                recorder.finish(value.decode())
+        return web.Response(text="Success")
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post('/update_progress', update_progress)
+    app.router.add_post('/send_image', send_image)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host='127.0.0.1', port=8080).start()
+    return runner
+
+def make_job(request_id):
+    return {
+        'request_id': request_id, 'user_id': '0', 'channel_id': '0', 'interaction_id': '0',
+        'original_message_id': '0', 'request_type': 'standard',
+        'prompt': 'a lighthouse on a cliff at dusk', 'resolution': '1:1 [1024x1024 square]',
+        'loras': [], 'upscale_factor': 1, 'seed': '42',
+        'workflow_filename': f'flux3_bench_{request_id}.json', 'workflow': load_json(WORKFLOW)
+    }
+
+async def time_job(recorder, start_job):
+    request_id = str(uuid.uuid4())
+    recorder.waiter(request_id)
+    job = make_job(request_id)
+    started = time.perf_counter()
+    await start_job(request_id, job)
+    await asyncio.wait_for(recorder.first_progress[request_id].wait(), timeout=120)
+    elapsed = time.perf_counter() - started
+    await asyncio.wait_for(recorder.done[request_id].wait(), timeout=120)
+    return elapsed
+
+async def run_cold(recorder, jobs):
+    python_cmd = sys.executable
+    processes = []
+
+    async def spawn(request_id, job):
+        # As the bot starts it, with the job spec on stdin
+        process = await asyncio.create_subprocess_exec(
+            python_cmd, 'comfygen.py', '-', stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        process.stdin.write(json.dumps(job).encode('utf-8'))
+        await process.stdin.drain()
+        process.stdin.close()
+        processes.append(process)
+
+    timings = [await time_job(recorder, spawn) for _ in range(jobs)]
+    await asyncio.gather(*(process.wait() for process in processes))
+    return timings
+
+async def run_warm(recorder, jobs, workers):
+    async def on_progress(request_id, progress_data):
+        recorder.record(request_id, progress_data)
+
+    async def on_result(job, metadata, final_image, workflow):
+        recorder.finish(job['request_id'])
+
+    pool = ComfyWorkerPool(workers, ComfyClient('127.0.0.1'), on_progress, on_result)
+    await pool.start()
+    try:
+        # Warm up the shared connection before timing anything
+        await time_job(recorder, pool.submit)
+        timings = [await time_job(recorder, pool.submit) for _ in range(jobs)]
+        # Let the last job finish cleaning up
+        await pool.queue.join()
+        return timings
+    finally:
+        await pool.stop()
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<22} mean {statistics.mean(timings) * 1000:8.1f} ms   "
+          f"median {statistics.median(timings) * 1000:8.1f} ms   p95 {p95 * 1000:8.1f} ms")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    init_db()
+    recorder = ProgressRecorder()
+    comfy_runner, _ = await start_stub_comfyui(port=8188)
+    bot_runner = await start_bot_stub(recorder)
+    try:
+        cold = await run_cold(recorder, args.jobs)
+        warm = await run_warm(recorder, args.jobs, args.workers)
+    finally:
+        await bot_runner.cleanup()
+        await comfy_runner.cleanup()
+
+    print(f"Time to first progress over {args.jobs} jobs")
+    report("cold subprocess", cold)
+    report(f"warm workers ({args.workers})", warm)
+
+if __name__ == '__main__':
+    asyncio.run(main())
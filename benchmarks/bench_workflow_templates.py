@@ -0,0 +1,81 @@
+"""
+Per-request cost of building a Flux workflow: reloading and patching the JSON
+from disk (the previous approach) against rendering a precompiled template.
+
+From the repository root:
+    python -m benchmarks.bench_workflow_templates --iterations 2000
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault('fluxversion', 'FluxDev24GB.json')
+
+from Main.custom_commands.workflow_templates import (
+    get_lora_info, get_workflow_template, render_workflow, validate_workflow
+)
+from Main.utils import load_json
+
+WORKFLOW = os.environ['fluxversion'].strip('"')
+
+def legacy_update_workflow(prompt, resolution, loras, upscale_factor, seed):
+    """The previous request path: load both files, validate, deep copy and patch"""
+    workflow = load_json(WORKFLOW)
+    validate_workflow(workflow)
+    workflow = json.loads(json.dumps(workflow))
+    workflow['69']['inputs']['prompt'] = prompt
+    workflow['258']['inputs']['ratio_selected'] = resolution
+
+    lora_loader = workflow['271']['inputs']
+    lora_config = load_json('lora.json')
+    lora_info = {lora['file']: lora for lora in lora_config['available_loras']}
+    for key in list(lora_loader.keys()):
+        if key.startswith('lora_'):
+            del lora_loader[key]
+    for i, lora in enumerate(loras, start=1):
+        if lora in lora_info:
+            base_strength = float(lora_info[lora].get('weight', 1.0))
+            lora_loader[f'lora_{i}'] = {
+                'on': True,
+                'lora': lora,
+                'strength': min(base_strength, 0.5) if len(loras) > 1 else base_strength
+            }
+
+    workflow['279']['inputs']['rescale_factor'] = upscale_factor
+    workflow['198:2']['inputs']['noise_seed'] = seed
+    validate_workflow(workflow)
+    if '198:4' in workflow:
+        workflow['198:4']['inputs']['guidance'] = 3.5
+    return workflow
+
+def time_per_call(build, iterations):
+    started = time.perf_counter()
+    for seed in range(iterations):
+        build(seed)
+    return (time.perf_counter() - started) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    loras = list(get_lora_info())[:2]
+    request = ('a lighthouse on a cliff at dusk', '1:1 [1024x1024 square]', loras, 2)
+
+    # Both paths must produce the same payload
+    legacy = legacy_update_workflow(*request, 42)
+    rendered = render_workflow(WORKFLOW, *request, 42)
+    assert json.dumps(legacy, sort_keys=True) == json.dumps(rendered, sort_keys=True), "payloads differ"
+    base = get_workflow_template(WORKFLOW).base
+    untouched = sum(1 for node_id in rendered if rendered[node_id] is base[node_id])
+
+    before = time_per_call(lambda seed: legacy_update_workflow(*request, seed), args.iterations)
+    after = time_per_call(lambda seed: render_workflow(WORKFLOW, *request, seed), args.iterations)
+
+    print(f"{WORKFLOW}: {len(rendered)} nodes, {len(rendered) - untouched} copied per request, {len(loras)} LoRAs")
+    print(f"reload + deep copy   {before * 1e6:9.1f} us/request")
+    print(f"compiled template    {after * 1e6:9.1f} us/request   ({before / after:.1f}x faster)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Minimal stand-in for a ComfyUI server, used by the benchmarks.
+
+It implements just enough of the ComfyUI API for the bot: /prompt, /ws, /history,
+/view, /queue and /system_stats. Every queued prompt takes prompt_overhead seconds to
+start, then "runs" a configurable number of steps for each sampler node in it (at
+least once) and produces one fake PNG per image save node. With a load_delay, loading the models
+named by a prompt's loader nodes takes time too: load_delay for each checkpoint that
+is not in memory and a quarter of it per LoRA when the LoRA set changes. Checkpoints
+stay loaded, least recently used evicted first, until they no longer fit in VRAM or
+a clear_cache message arrives. With a preview_size, every step is followed by a binary
+preview frame, a preview_size pixel square JPEG, like ComfyUI started with a
+--preview-method.
+
+Run standalone with:
+    python -m benchmarks.stub_comfyui --port 8188
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import uuid
+
+from collections import OrderedDict
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+GB = 1024 ** 3
+SAMPLER_TYPES = ('KSampler', 'KSamplerAdvanced', 'SamplerCustom', 'SamplerCustomAdvanced')
+
+class StubComfyUI:
+    def __init__(self, steps: int = 10, step_delay: float = 0.005, image_size: int = 256 * 1024,
+                 load_delay: float = 0.0, vram_total: int = 24 * GB, model_size: int = 11 * GB,
+                 prompt_overhead: float = 0.0, preview_size: int = 0):
+        self.steps = steps
+        self.step_delay = step_delay
+        self.prompt_overhead = prompt_overhead
+        self.load_delay = load_delay
+        self.vram_total = vram_total
+        self.model_size = model_size
+        # checkpoint -> LoRAs patched onto it, least recently used first
+        self.loaded = OrderedDict()
+        self.model_loads = 0
+        self.cache_clears = 0
+        self.image = PNG_HEADER + os.urandom(image_size)
+        self.preview_frame = self.make_preview_frame(preview_size) if preview_size else None
+        self.previews_sent = 0
+        self.sockets = {}
+        self.history = {}
+        self.running = []
+        self.pending = []
+        self.prompts_queued = 0
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def make_preview_frame(size: int) -> bytes:
+        from PIL import Image
+        output = io.BytesIO()
+        Image.effect_noise((size, size), 64).convert('RGB').save(output, 'JPEG', quality=85)
+        # PREVIEW_IMAGE event, JPEG image type
+        return (1).to_bytes(4, 'big') + (1).to_bytes(4, 'big') + output.getvalue()
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/prompt', self.prompt)
+        app.router.add_get('/ws', self.websocket)
+        app.router.add_get('/history/{prompt_id}', self.get_history)
+        app.router.add_get('/view', self.view)
+        app.router.add_get('/queue', self.queue)
+        app.router.add_get('/system_stats', self.system_stats)
+        return app
+
+    async def send(self, client_id, message):
+        ws = self.sockets.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_str(json.dumps(message))
+
+    async def send_bytes(self, client_id, frame):
+        ws = self.sockets.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_bytes(frame)
+            self.previews_sent += 1
+
+    async def prompt(self, request):
+        data = await request.json()
+        prompt_id = str(uuid.uuid4())
+        self.prompts_queued += 1
+        self.pending.append(prompt_id)
+        asyncio.create_task(self.execute(prompt_id, data.get('client_id'), data.get('prompt', {})))
+        return web.json_response({'prompt_id': prompt_id, 'number': self.prompts_queued, 'node_errors': {}})
+
+    async def execute(self, prompt_id, client_id, workflow):
+        # Like ComfyUI, prompts run one at a time
+        async with self.lock:
+            self.pending.remove(prompt_id)
+            self.running.append(prompt_id)
+            await self.send(client_id, {'type': 'execution_start', 'data': {'prompt_id': prompt_id}})
+            await asyncio.sleep(self.prompt_overhead)
+            await self.load_models(workflow)
+            samplers = sum(1 for node in workflow.values()
+                           if isinstance(node, dict) and node.get('class_type') in SAMPLER_TYPES) or 1
+            for _ in range(samplers):
+                for step in range(1, self.steps + 1):
+                    await asyncio.sleep(self.step_delay)
+                    await self.send(client_id, {
+                        'type': 'progress',
+                        'data': {'value': step, 'max': self.steps, 'prompt_id': prompt_id}
+                    })
+                    if self.preview_frame is not None:
+                        await self.send_bytes(client_id, self.preview_frame)
+
+            save_nodes = [node_id for node_id, node in workflow.items()
+                          if isinstance(node, dict) and 'Save' in node.get('class_type', '')] or ['9']
+            self.history[prompt_id] = {
+                'prompt': [self.prompts_queued, prompt_id, workflow, {}, save_nodes],
+                'outputs': {
+                    node_id: {'images': [{
+                        'filename': f'bot_{prompt_id[:8]}_{node_id}.png',
+                        'subfolder': '',
+                        'type': 'output'
+                    }]}
+                    for node_id in save_nodes
+                }
+            }
+            self.running.remove(prompt_id)
+            await self.send(client_id, {'type': 'executing', 'data': {'node': None, 'prompt_id': prompt_id}})
+
+    async def load_models(self, workflow):
+        checkpoints, loras = [], []
+        for node in workflow.values():
+            class_type = node.get('class_type', '') if isinstance(node, dict) else ''
+            if 'Loader' not in class_type:
+                continue
+            names = [str(value) for value in node.get('inputs', {}).values() if isinstance(value, str)]
+            (loras if 'lora' in class_type.lower() else checkpoints).extend(names)
+        patches = frozenset(loras)
+        for checkpoint in checkpoints:
+            if checkpoint not in self.loaded:
+                self.model_loads += 1
+                await asyncio.sleep(self.load_delay)
+                while self.loaded and (len(self.loaded) + 1) * self.model_size > self.vram_total:
+                    self.loaded.popitem(last=False)
+                self.loaded[checkpoint] = frozenset()
+            if self.loaded[checkpoint] != patches:
+                await asyncio.sleep(self.load_delay / 4 * len(patches))
+                self.loaded[checkpoint] = patches
+            self.loaded.move_to_end(checkpoint)
+
+    async def websocket(self, request):
+        client_id = request.query.get('clientId') or str(uuid.uuid4())
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets[client_id] = ws
+        await ws.send_str(json.dumps({'type': 'status', 'data': {'sid': client_id}}))
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+                if msg.type == WSMsgType.TEXT and json.loads(msg.data).get('type') == 'clear_cache':
+                    self.loaded.clear()
+                    self.cache_clears += 1
+        finally:
+            if self.sockets.get(client_id) is ws:
+                del self.sockets[client_id]
+        return ws
+
+    async def get_history(self, request):
+        prompt_id = request.match_info['prompt_id']
+        if prompt_id in self.history:
+            return web.json_response({prompt_id: self.history[prompt_id]})
+        return web.json_response({})
+
+    async def view(self, request):
+        return web.Response(body=self.image, content_type='image/png')
+
+    async def queue(self, request):
+        return web.json_response({
+            'queue_running': [[0, prompt_id] for prompt_id in self.running],
+            'queue_pending': [[0, prompt_id] for prompt_id in self.pending]
+        })
+
+    async def system_stats(self, request):
+        return web.json_response({
+            'system': {'os': 'stub', 'python_version': '', 'embedded_python': False},
+            'devices': [{
+                'name': 'stub', 'type': 'cuda', 'index': 0,
+                'vram_total': self.vram_total,
+                'vram_free': max(0, self.vram_total - 2 * GB - len(self.loaded) * self.model_size),
+                'torch_vram_total': 0, 'torch_vram_free': 0
+            }]
+        })
+
+async def start_stub_comfyui(host: str = '127.0.0.1', port: int = 8188, **kwargs):
+    """Start a stub server on the running loop; returns (runner, stub)."""
+    stub = StubComfyUI(**kwargs)
+    runner = web.AppRunner(stub.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner, stub
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a stub ComfyUI server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8188)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--step-delay', type=float, default=0.05)
+    parser.add_argument('--image-size', type=int, default=256 * 1024, help="bytes per output image")
+    args = parser.parse_args()
+    web.run_app(StubComfyUI(args.steps, args.step_delay, args.image_size).make_app(), host=args.host, port=args.port)
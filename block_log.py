@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class BlockLog:
+    """
+    Keeps the permanent IP blocks on disk without rewriting them all per block.
+
+    The blocks are a JSON snapshot, {ip: {'timestamp': ..., 'reason': ...}}, plus
+    an append-only log of the blocks added since, one JSON line each. New blocks are
+    written by a background thread in batches; once `compact_after` lines have been
+    logged the thread writes a fresh snapshot and empties the log.
+    """
+
+    def __init__(self, snapshot_file: str, log_file: Optional[str] = None, compact_after: int = 1000,
+                 retry_delay: float = 5.0):
+        self.snapshot_file = snapshot_file
+        self.log_file = log_file or os.path.splitext(snapshot_file)[0] + '.log'
+        self.compact_after = max(1, compact_after)
+        self.retry_delay = retry_delay
+        self.blocks: Dict[str, dict] = {}
+        self.pending: List[Tuple[str, dict]] = []
+        self.logged = 0
+        self.compact_requested = False
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.busy = False
+        self.closed = False
+        self.appends = 0
+        self.compactions = 0
+
+    def load(self) -> Dict[str, dict]:
+        """Read the snapshot and replay the log over it; returns the blocks"""
+        try:
+            if os.path.exists(self.snapshot_file):
+                with open(self.snapshot_file, 'r') as f:
+                    self.blocks.update(json.load(f))
+        except Exception as e:
+            logger.error(f"Error loading permanent blocks: {str(e)}")
+        try:
+            if os.path.exists(self.log_file):
+                with open(self.log_file, 'r') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            self.blocks[entry.pop('ip')] = entry
+                            self.logged += 1
+                        except (ValueError, KeyError, AttributeError):
+                            # A line cut short by a crash mid-write
+                            logger.warning(f"Skipping unreadable line in {self.log_file}")
+        except Exception as e:
+            logger.error(f"Error replaying permanent blocks log: {str(e)}")
+        if self.logged >= self.compact_after:
+            self.compact()
+        return self.blocks
+
+    def add(self, ip: str, entry: dict):
+        """Record a block; returns at once, the write happens in the background"""
+        with self.condition:
+            self.blocks[ip] = entry
+            self.pending.append((ip, entry))
+            self._wake()
+
+    def compact(self):
+        """Have the background thread write a full snapshot and empty the log"""
+        with self.condition:
+            self.compact_requested = True
+            self._wake()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every block has been written; False if timeout ran out first"""
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.pending and not self.compact_requested and not self.busy, timeout
+            )
+
+    def close(self, timeout: Optional[float] = None):
+        """Write what is still queued, waiting at most timeout seconds, and stop the writer"""
+        if not self.flush(timeout):
+            logger.warning(f"Gave up writing {len(self.pending)} permanent blocks")
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {'blocks': len(self.blocks), 'appends': self.appends, 'compactions': self.compactions}
+
+    def _wake(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='block-log', daemon=True)
+            self.thread.start()
+        self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.compact_requested or self.closed)
+                if not self.pending and not self.compact_requested:
+                    return
+                batch, self.pending = self.pending, []
+                compact = self.compact_requested or self.logged + len(batch) >= self.compact_after
+                # A snapshot taken now already holds the batch
+                snapshot = dict(self.blocks) if compact else None
+                self.compact_requested = False
+                self.busy = True
+            failed = False
+            try:
+                if compact:
+                    self._write_snapshot(snapshot)
+                else:
+                    self._append(batch)
+            except Exception as e:
+                logger.error(f"Error saving permanent blocks: {str(e)}")
+                failed = True
+                with self.condition:
+                    # Kept for the next write rather than lost
+                    self.pending = batch + self.pending
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+            with self.condition:
+                if self.closed and (failed or not self.pending):
+                    return
+                if failed:
+                    self.condition.wait_for(lambda: self.closed, self.retry_delay)
+
+    def _append(self, batch: List[Tuple[str, dict]]):
+        lines = ''.join(json.dumps({'ip': ip, **entry}) + '\n' for ip, entry in batch)
+        with open(self.log_file, 'a') as f:
+            f.write(lines)
+        self.logged += len(batch)
+        self.appends += 1
+
+    def _write_snapshot(self, snapshot: Dict[str, dict]):
+        os.makedirs(os.path.dirname(self.snapshot_file) or '.', exist_ok=True)
+        temp_file = self.snapshot_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(temp_file, self.snapshot_file)
+        # Everything logged so far is in the snapshot now
+        with open(self.log_file, 'w'):
+            pass
+        self.logged = 0
+        self.compactions += 1
@@ -1,11 +1,10 @@
 import discord
 from discord.ext import commands as discord_commands
 import asyncio
-import subprocess
 import os
 import platform
 import uuid
-from typing import Dict, Optional, Any
+from typing import Awaitable, Dict, Optional, Any, Tuple
 
 # Third-party imports
 from discord import Interaction, Intents, app_commands
@@ -23,17 +22,60 @@ from config import (
     ENABLE_PROMPT_ENHANCEMENT,  
     AI_PROVIDER,               
     LMSTUDIO_HOST,
-    LMSTUDIO_PORT             
+    LMSTUDIO_PORT,
+    COMFY_EXECUTION_MODE,
+    COMFYUI_BACKENDS,
+    BACKEND_HEALTH_INTERVAL,
+    BACKEND_FAILURE_THRESHOLD,
+    BACKEND_RETRY_AFTER,
+    BACKEND_WARM_WORKFLOWS,
+    BACKEND_MIN_FREE_VRAM,
+    COMFY_WORKER_COUNT,
+    COMFY_BATCH_WINDOW,
+    COMFY_BATCH_MAX_SIZE,
+    IMAGE_SPOOL_DIR,
+    PROGRESS_CHANNEL_EDITS,
+    PROGRESS_CHANNEL_WINDOW,
+    DISCORD_USER_CACHE_TTL,
+    DISCORD_USER_CACHE_SIZE,
+    PROGRESS_PREVIEWS,
+    PREVIEW_INTERVAL,
+    PREVIEW_MAX_SIZE,
+    PREVIEW_QUALITY,
+    PREVIEW_CHANNEL_EDITS,
+    PREVIEW_CHANNEL_WINDOW,
+    SCHEDULER_MAX_CONCURRENT,
+    SCHEDULER_WEIGHTS,
+    ADMISSION_CONTROL,
+    ADMISSION_LATENCY_TOLERANCE,
+    ADMISSION_PROBE_INTERVAL,
+    HTTP_POOL_SIZE,
+    HTTP_POOL_PER_HOST,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    AI_HTTP_POOL_SIZE,
+    AI_MAX_CONCURRENT_REQUESTS,
+    AI_HTTP_CONNECT_TIMEOUT,
+    AI_HTTP_READ_TIMEOUT
 )
 from Main.custom_commands import (
     RequestItem, ReduxRequestItem, ReduxPromptRequestItem,
     ImageControlView, setup_commands
 )
-from Main.database import init_db, get_all_image_info
-from Main.custom_commands.web_handlers import handle_generated_image
+from Main.database import init_db, get_all_image_info, run_db, close_db
+from Main.custom_commands.web_handlers import (
+    handle_generated_image, deliver_generated_image, update_progress_message, update_preview_message
+)
+from Main.comfy import AdmissionController, Backend, BackendPool, ComfyClient, ComfyWorkerPool, parse_backends
+from Main.discord_resolver import DiscordResolver
+from Main.previews import PreviewPublisher
+from Main.progress_updates import ProgressDispatcher
+from Main.scheduler import FairScheduler, PRIORITY_ADMIN, PRIORITY_NORMAL
 from Main.utils import load_json
+from Main.workflow_store import model_signature
 from web_server import start_web_server
 from Main.lora_monitor import setup_lora_monitor, cleanup_lora_monitor
+from Main.lora_catalog import LoraCatalog
 try:
     from Main.LMstudio_bot.ai_providers import AIProviderFactory
 except ImportError:
@@ -45,6 +87,7 @@ import json
 import uuid
 from discord import app_commands
 from Main.custom_commands.views import ReduxModal, ImageControlView
+from Main.custom_commands.workflow_templates import get_workflow_models
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -56,14 +99,91 @@ discord_logger.setLevel(logging.WARNING)
 class MyBot(discord_commands.Bot):
     def __init__(self):
         super().__init__(command_prefix=COMMAND_PREFIX, intents=intents)
-        self.subprocess_queue = asyncio.Queue()
+        backend_addresses = parse_backends(COMFYUI_BACKENDS)
+        self.backends = BackendPool(
+            [
+                Backend(
+                    AdmissionController(
+                        host,
+                        SCHEDULER_MAX_CONCURRENT,
+                        port=port,
+                        latency_tolerance=ADMISSION_LATENCY_TOLERANCE,
+                        probe_interval=ADMISSION_PROBE_INTERVAL,
+                        adaptive=ADMISSION_CONTROL
+                    ),
+                    failure_threshold=BACKEND_FAILURE_THRESHOLD,
+                    retry_after=BACKEND_RETRY_AFTER,
+                    warm_slots=BACKEND_WARM_WORKFLOWS
+                )
+                for host, port in backend_addresses
+            ],
+            models=self.request_models,
+            health_interval=BACKEND_HEALTH_INTERVAL,
+            min_free_vram=BACKEND_MIN_FREE_VRAM
+        )
+        # Fair-share scheduler with the asyncio.Queue put() interface
+        self.subprocess_queue = FairScheduler(
+            self.classify_request,
+            self.start_generation,
+            self.backends,
+            weights=SCHEDULER_WEIGHTS,
+            position_handler=self.on_queue_position
+        )
         self.pending_requests = {}
         self.ai_provider = None
         self.allowed_channels = set(CHANNEL_IDS)
         self.resolution_options = []
-        self.lora_options = []
+        self.lora_catalog = LoraCatalog([])
         self.tree.on_error = self.on_tree_error
+        self.progress = ProgressDispatcher(
+            self,
+            channel_edits=PROGRESS_CHANNEL_EDITS,
+            channel_window=PROGRESS_CHANNEL_WINDOW
+        )
+        self.resolver = DiscordResolver(self, ttl=DISCORD_USER_CACHE_TTL, max_size=DISCORD_USER_CACHE_SIZE)
+        # Callback socket for comfygen.py processes, set once it is listening
+        self.ipc_server = None
+        self.ipc_socket = None
+        # The web server's SecurityMiddleware, which writes permanent blocks in the background
+        self.security = None
+        self.previews = None
+        if PROGRESS_PREVIEWS:
+            self.previews = PreviewPublisher(
+                self.send_preview,
+                interval=PREVIEW_INTERVAL,
+                max_size=PREVIEW_MAX_SIZE,
+                quality=PREVIEW_QUALITY,
+                channel_edits=PREVIEW_CHANNEL_EDITS,
+                channel_window=PREVIEW_CHANNEL_WINDOW
+            )
+        self.worker_pool = None
+        if COMFY_EXECUTION_MODE == 'worker':
+            self.worker_pool = ComfyWorkerPool(
+                COMFY_WORKER_COUNT * len(backend_addresses),
+                [
+                    ComfyClient(
+                        host,
+                        port=port,
+                        pool_size=HTTP_POOL_SIZE,
+                        max_per_host=HTTP_POOL_PER_HOST,
+                        connect_timeout=HTTP_CONNECT_TIMEOUT,
+                        read_timeout=HTTP_READ_TIMEOUT
+                    )
+                    for host, port in backend_addresses
+                ],
+                self.on_worker_progress,
+                self.on_worker_result,
+                batch_window=COMFY_BATCH_WINDOW,
+                batch_max_size=COMFY_BATCH_MAX_SIZE,
+                spool_dir=IMAGE_SPOOL_DIR,
+                preview_handler=self.on_worker_preview if self.previews else None
+            )
         setup_lora_monitor(self)
+
+    @property
+    def lora_options(self):
+        """LoRA entries in lora.json order, for the paginated selection views"""
+        return self.lora_catalog.entries
         
     def get_python_command(self):
         """Get the appropriate Python command based on the platform"""
@@ -71,112 +191,221 @@ class MyBot(discord_commands.Bot):
             return "python"
         return "python3"
 
-    async def process_redux_request(self, request_id: str, request_item) -> None:
-        """Process a redux image generation request."""
+    def save_redux_images(self, request_item) -> Tuple[str, str]:
+        """Save the two redux reference images and return their paths."""
+        # Create temp directory with absolute path
+        temp_dir = os.path.abspath(os.path.join('Main', 'DataSets', 'temp'))
+        os.makedirs(temp_dir, exist_ok=True)
+
+        # Use the original filenames from the attachments
+        image1_path = os.path.join(temp_dir, request_item.image1_filename)
+        image2_path = os.path.join(temp_dir, request_item.image2_filename)
+
+        # Save images
+        with open(image1_path, 'wb') as f:
+            f.write(request_item.image1)
+        with open(image2_path, 'wb') as f:
+            f.write(request_item.image2)
+
+        # Convert to absolute paths and use forward slashes
+        image1_path = image1_path.replace('\\', '/')
+        image2_path = image2_path.replace('\\', '/')
+
+        logger.debug(f"Saved images at: {image1_path}, {image2_path}")
+        return image1_path, image2_path
+
+    def build_job(self, request_id: str, request_item) -> Dict[str, Any]:
+        """Build the comfygen job spec for a request, with its workflow in memory."""
+        job = {
+            'request_id': request_id,
+            'user_id': request_item.user_id,
+            'channel_id': request_item.channel_id,
+            'interaction_id': request_item.interaction_id,
+            'original_message_id': request_item.original_message_id,
+            'workflow_filename': request_item.workflow_filename,
+            'workflow': request_item.workflow
+        }
+
+        if isinstance(request_item, ReduxRequestItem):
+            image1_path, image2_path = self.save_redux_images(request_item)
+            job.update({
+                'request_type': 'redux',
+                'resolution': request_item.resolution,
+                'strength1': request_item.strength1,
+                'strength2': request_item.strength2,
+                'image1_path': image1_path,
+                'image2_path': image2_path
+            })
+        elif isinstance(request_item, ReduxPromptRequestItem):
+            job.update({
+                'request_type': 'reduxprompt',
+                'prompt': request_item.prompt,
+                'resolution': request_item.resolution,
+                'strength': str(request_item.strength),
+                'image_path': request_item.image_path  # Use the already saved image path
+            })
+        else:
+            # Standard request processing
+            job.update({
+                'request_type': 'standard',
+                'prompt': request_item.prompt,
+                'resolution': request_item.resolution,
+                'loras': request_item.loras,
+                'upscale_factor': request_item.upscale_factor,
+                'seed': str(request_item.seed) if request_item.seed is not None else None,
+                'is_pulid': str(request_item.is_pulid).lower() == 'true'
+            })
+        return job
+
+    async def dispatch_generation(self, request_id: str, job: Dict[str, Any], backend: Backend,
+                                  clear_cache: bool = False) -> Awaitable:
+        """
+        Hand a request to the in-process workers or a new comfygen.py process, to run
+        on the given backend, clearing its model cache first if asked. A comfygen.py
+        process reads the job spec from its stdin. Returns an awaitable that resolves
+        to whether the generation succeeded.
+        """
+        if self.worker_pool:
+            done = await self.worker_pool.submit(request_id, job, backend.address, clear_cache=clear_cache)
+        else:
+            process = await asyncio.create_subprocess_exec(
+                self.get_python_command(), 'comfygen.py', '-',
+                stdin=asyncio.subprocess.PIPE,
+                env={**os.environ, 'COMFYUI_BACKEND': backend.address,
+                     'COMFYUI_CLEAR_CACHE': str(clear_cache).lower(),
+                     'BOT_IPC_SOCKET': self.ipc_socket or ''}
+            )
+            try:
+                process.stdin.write(json.dumps(job, separators=(',', ':')).encode('utf-8'))
+                await process.stdin.drain()
+            finally:
+                process.stdin.close()
+
+            async def wait_for_exit():
+                return await process.wait() == 0
+            done = wait_for_exit()
+        logger.debug(f"Dispatched request {request_id} ({job['request_type']}) to {backend.address}")
+        return done
+
+    async def start_generation(self, request_item, backend: Backend) -> Awaitable:
+        """Scheduler dispatch callback: register the request and start generating it."""
+        request_id = str(uuid.uuid4())
+        self.pending_requests[request_id] = request_item
         try:
-            # Create temp directory with absolute path
-            temp_dir = os.path.abspath(os.path.join('Main', 'DataSets', 'temp'))
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # Use the original filenames from the attachments
-            image1_path = os.path.join(temp_dir, request_item.image1_filename)
-            image2_path = os.path.join(temp_dir, request_item.image2_filename)
-            
-            # Save images
-            with open(image1_path, 'wb') as f:
-                f.write(request_item.image1)
-            with open(image2_path, 'wb') as f:
-                f.write(request_item.image2)
-
-            # Convert to absolute paths and use forward slashes
-            image1_path = image1_path.replace('\\', '/')
-            image2_path = image2_path.replace('\\', '/')
-
-            logger.debug(f"Saved images at: {image1_path}, {image2_path}")
-
-            python_cmd = self.get_python_command()
-            
-            subprocess.Popen([
-                python_cmd,
-                'comfygen.py',
-                request_id,
-                request_item.user_id,
-                request_item.channel_id,
-                request_item.interaction_id,
-                request_item.original_message_id,
-                'redux',
-                request_item.resolution,
-                str(request_item.strength1),
-                str(request_item.strength2),
-                request_item.workflow_filename,
-                image1_path,
-                image2_path
-            ])
-            
-            logger.debug(f"Started redux processing for request {request_id}")
-            
-        except Exception as e:
-            logger.error(f"Error in process_redux_request: {e}", exc_info=True)
-            if request_id in self.pending_requests:
-                del self.pending_requests[request_id]
+            job = self.build_job(request_id, request_item)
+            clear_cache = await self.backends.prepare(backend, request_item)
+            return await self.dispatch_generation(request_id, job, backend, clear_cache)
+        except Exception:
+            self.pending_requests.pop(request_id, None)
             raise
 
-    async def process_subprocess_queue(self):
-        while True:
-            try:
-                request_item = await self.subprocess_queue.get()
-                request_id = str(uuid.uuid4())
-                self.pending_requests[request_id] = request_item
-
-                if isinstance(request_item, ReduxRequestItem):
-                    await self.process_redux_request(request_id, request_item)
-                elif isinstance(request_item, ReduxPromptRequestItem):
-                    # Image is already saved, use the path directly
-                    python_cmd = self.get_python_command()
-                    subprocess.Popen([
-                        python_cmd,
-                        'comfygen.py',
-                        request_id,
-                        request_item.user_id,
-                        request_item.channel_id,
-                        request_item.interaction_id,
-                        request_item.original_message_id,
-                        'reduxprompt',
-                        request_item.prompt,
-                        request_item.resolution,
-                        str(request_item.strength),
-                        request_item.workflow_filename,
-                        request_item.image_path  # Use the already saved image path
-                    ])
-                else:
-                    # Standard request processing
-                    python_cmd = self.get_python_command()
-                    subprocess.Popen([
-                        python_cmd,
-                        'comfygen.py',
-                        request_id,
-                        request_item.user_id,
-                        request_item.channel_id,
-                        request_item.interaction_id,
-                        request_item.original_message_id,
-                        'standard',  # Indicate this is a standard request
-                        request_item.prompt,
-                        request_item.resolution,
-                        json.dumps(request_item.loras),
-                        str(request_item.upscale_factor),
-                        request_item.workflow_filename,  # Pass the workflow filename
-                        str(request_item.seed) if request_item.seed is not None else "None",
-                        str(request_item.is_pulid).lower()  # Pass is_pulid flag
-                    ])
-
-                self.subprocess_queue.task_done()
-                
-            except Exception as e:
-                logger.error(f"Error in process_subprocess_queue: {e}")
+    @staticmethod
+    def workflow_models(workflow_filename: str) -> str:
+        """Model files of a workflow file; its name if it can't be read"""
+        try:
+            # Cached until the file changes; a failed read isn't cached
+            return get_workflow_models(workflow_filename)
+        except Exception as e:
+            logger.warning(f"Could not read the models of {workflow_filename}: {e}")
+            return workflow_filename
+
+    def request_models(self, request_item) -> Tuple[str, Tuple[str, ...]]:
+        """The models a request loads: its workflow's model files and its LoRAs"""
+        workflow = getattr(request_item, 'workflow', None)
+        models = model_signature(workflow) if workflow is not None else self.workflow_models(request_item.workflow_filename)
+        return (models,
+                tuple(sorted(getattr(request_item, 'loras', None) or [])))
+
+    def classify_request(self, request_item) -> Tuple[int, Optional[int], str, str]:
+        """Scheduler classifier: (priority, guild, user, request type) of a request."""
+        if isinstance(request_item, ReduxRequestItem):
+            request_type = 'redux'
+        elif isinstance(request_item, ReduxPromptRequestItem):
+            request_type = 'reduxprompt'
+        elif str(getattr(request_item, 'is_pulid', False)).lower() == 'true':
+            # Request items keep the flag as text
+            request_type = 'pulid'
+        else:
+            request_type = 'standard'
+
+        # Recorded from the interaction when the request was made, as the bot can't
+        # look members up without the members intent
+        priority = PRIORITY_ADMIN if request_item.is_admin else PRIORITY_NORMAL
+        channel = self.get_channel(int(request_item.channel_id)) if request_item.channel_id.isdigit() else None
+        guild = getattr(channel, 'guild', None)
+        guild_id = guild.id if guild is not None else None
+        return priority, guild_id, request_item.user_id, request_type
+
+    async def on_queue_position(self, request_item, position: int, queue_size: int) -> None:
+        """Scheduler callback: show a waiting request its place in the queue."""
+        await update_progress_message(self, request_item, {
+            'status': 'queued',
+            'position': position,
+            'queue_size': queue_size
+        })
+
+    async def on_worker_progress(self, request_id: str, progress_data: Dict[str, Any]) -> None:
+        """Progress callback for the in-process workers, mirrors /update_progress."""
+        request_item = self.pending_requests.get(request_id)
+        if request_item is None:
+            return
+        await update_progress_message(self, request_item, progress_data)
+        if progress_data.get('status') == 'error':
+            self.pending_requests.pop(request_id, None)
+            if self.previews:
+                await self.previews.finish(request_id)
+
+    async def on_worker_preview(self, request_id: str, image: bytes) -> None:
+        """Preview callback for the in-process workers, mirrors /update_preview."""
+        request_item = self.pending_requests.get(request_id)
+        if request_item is not None:
+            self.previews.publish(request_id, request_item.channel_id, image)
+
+    async def send_preview(self, request_id: str, preview: bytes) -> None:
+        """PreviewPublisher callback: show a preview in the request's progress message."""
+        request_item = self.pending_requests.get(request_id)
+        if request_item is not None:
+            await update_preview_message(self, request_item, preview)
+
+    async def on_worker_result(self, job: Dict[str, Any], metadata: Dict[str, Any],
+                               final_image: Tuple[str, str], workflow: Dict) -> None:
+        """Result callback for the in-process workers, mirrors /send_image."""
+        request_id = job['request_id']
+        if request_id not in self.pending_requests:
+            logger.warning(f"Received response for unknown request_id: {request_id}")
+            return
+
+        image_path, filename = final_image
+        request_data = {
+            'request_id': request_id,
+            'user_id': job['user_id'],
+            'channel_id': job['channel_id'],
+            'interaction_id': job['interaction_id'],
+            'original_message_id': job['original_message_id'],
+            'prompt': metadata['prompt'],
+            'resolution': metadata['resolution'],
+            'upscaled_resolution': metadata['upscaled_resolution'],
+            'loras': metadata['loras'],
+            'upscale_factor': metadata['upscale_factor'],
+            'seed': metadata['seed'],
+            'image_path': image_path
+        }
+        try:
+            await deliver_generated_image(self, request_data, workflow)
+        except discord.HTTPException as e:
+            logger.error(f"Error delivering image for request {request_id}: {e}")
+            self.pending_requests.pop(request_id, None)
 
     async def setup_hook(self):
         """Setup hook that runs before the bot starts."""
         init_db()
+        if AIProviderFactory:
+            AIProviderFactory.configure(
+                pool_size=AI_HTTP_POOL_SIZE,
+                max_concurrent=AI_MAX_CONCURRENT_REQUESTS,
+                connect_timeout=AI_HTTP_CONNECT_TIMEOUT,
+                read_timeout=AI_HTTP_READ_TIMEOUT
+            )
         try:
             if ENABLE_PROMPT_ENHANCEMENT and AIProviderFactory:
                 logger.info(f"Initializing AI provider. Provider: {AI_PROVIDER}")
@@ -201,15 +430,17 @@ class MyBot(discord_commands.Bot):
             ratios_data = load_json('ratios.json')
             self.resolution_options = list(ratios_data['ratios'].keys())
 
-            lora_data = load_json('lora.json')
-            self.lora_options = lora_data['available_loras']
+            self.lora_catalog = LoraCatalog.from_config(load_json('lora.json'))
             
         except Exception as e:
             logger.error(f"Error loading options: {str(e)}")
 
         # Set up commands first
         await setup_commands(self)
-        self.loop.create_task(self.process_subprocess_queue())
+        self.backends.start()
+        self.subprocess_queue.start()
+        if self.worker_pool:
+            await self.worker_pool.start()
         await start_web_server(self)
 
         # Add redux command
@@ -251,7 +482,7 @@ class MyBot(discord_commands.Bot):
         except Exception as e:
             logger.error(f"Failed to sync commands during setup: {e}")
 
-        image_info = get_all_image_info()
+        image_info = await run_db(get_all_image_info)
         for info in image_info:
             self.add_view(ImageControlView(
                 self,
@@ -264,6 +495,24 @@ class MyBot(discord_commands.Bot):
 
     async def close(self):
         cleanup_lora_monitor(self)
+        await self.subprocess_queue.stop()
+        await self.backends.close()
+        if self.worker_pool:
+            await self.worker_pool.stop()
+        await self.progress.close()
+        if self.ipc_server:
+            self.ipc_server.close()
+            await self.ipc_server.wait_closed()
+            if os.path.exists(self.ipc_socket):
+                os.remove(self.ipc_socket)
+        if self.security:
+            await asyncio.to_thread(self.security.close, 5)
+        logger.info(f"Discord lookups: {self.resolver.stats()}")
+        if self.previews:
+            await self.previews.close()
+        if AIProviderFactory:
+            await AIProviderFactory.close_all()
+        await run_db(close_db)
         await super().close()
 
     async def on_ready(self):
@@ -293,8 +542,7 @@ class MyBot(discord_commands.Bot):
             ratios_data = load_json('ratios.json')
             self.resolution_options = list(ratios_data['ratios'].keys())
 
-            lora_data = load_json('lora.json')
-            self.lora_options = lora_data['available_loras']
+            self.lora_catalog = LoraCatalog.from_config(load_json('lora.json'))
             logger.info("Successfully reloaded options")
             
             # Reinitialize AI provider if enabled
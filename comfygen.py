@@ -1,128 +1,67 @@
 import websocket
 import uuid
 import json
-import urllib.request
-import urllib.parse
 import requests
 import sys
 import logging
 import os
 import time
 from Main.database import add_to_history
-from Main.utils import generate_random_seed, load_json, save_json
+from Main.utils import load_json
+from Main.http_pool import PooledSession
+from Main.image_spool import SPOOL_CHUNK_SIZE, remove_spooled, spool_file_path
+from Main.previews import decode_preview_frame
+from Main.progress_emitter import ProgressEmitter
+from Main import ipc
 import re
 from dotenv import load_dotenv
-from config import server_address, BOT_SERVER
-from Main.custom_commands.workflow_utils import (
-    update_workflow, 
-    update_reduxprompt_workflow,  # Add this import
-    validate_workflow
+from config import (
+    server_address, BOT_SERVER, IMAGE_SPOOL_DIR, PROGRESS_PREVIEWS, PREVIEW_INTERVAL,
+    PROGRESS_EMIT_QUEUE_SIZE, PROGRESS_EMIT_BATCH_SIZE, PROGRESS_EMIT_FLUSH_TIMEOUT, BOT_IPC_SOCKET,
+    HTTP_POOL_SIZE, HTTP_POOL_PER_HOST, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
 )
+from Main.comfy.jobs import cleanup_job_files, parse_job_args, prepare_job, select_final_image
 
 # Load environment variables
 load_dotenv()
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 client_id = str(uuid.uuid4())
 
-def open_workflow(workflow_filename):
-    """Opens and loads workflow file from DataSets directory with validation"""
-    try:
-        workflow_path = f"Main/DataSets/{workflow_filename}"
-        logger.debug(f"Opening workflow file: {workflow_path}")
-        
-        with open(workflow_path, "r", encoding="utf-8") as f:
-            # Read the file content
-            content = f.read().strip()
-            
-            # Remove any BOM characters that might be present
-            if content.startswith('\ufeff'):
-                content = content[1:]
-                
-            # Parse the JSON carefully
-            try:
-                workflow = json.loads(content)
-                if not isinstance(workflow, dict):
-                    raise ValueError("Workflow must be a dictionary")
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON parsing error in workflow: {e}")
-                raise
-
-            logger.debug(f"Successfully loaded workflow with {len(workflow)} nodes")
-            return workflow
-            
-    except FileNotFoundError:
-        logger.error(f"Workflow file not found: {workflow_path}")
-        raise
-    except Exception as e:
-        logger.error(f"Error loading workflow: {str(e)}")
-        raise
-
-def update_workflow(workflow, prompt, resolution, loras, upscale_factor, seed):
-    """Updates the workflow with the provided parameters with validation"""
-    try:
-        # Create a deep copy to avoid modifying original
-        workflow = json.loads(json.dumps(workflow))
-        
-        # Update prompt
-        if '69' in workflow:
-            workflow['69']['inputs']['prompt'] = prompt
-            logger.debug(f"Updated prompt in workflow")
-        
-        # Update resolution
-        if '258' in workflow:
-            workflow['258']['inputs']['ratio_selected'] = resolution
-            logger.debug(f"Updated resolution in workflow")
-
-        # Update LoRAs
-        if '271' in workflow:
-            lora_loader = workflow['271']['inputs']
-            
-            # Load lora config
-            lora_config = load_json('lora.json')
-            lora_info = {lora['file']: lora for lora in lora_config['available_loras']}
-
-            # Clean existing LoRA entries
-            for key in list(lora_loader.keys()):
-                if key.startswith('lora_'):
-                    del lora_loader[key]
-
-            # Add new LoRA entries
-            for i, lora in enumerate(loras, start=1):
-                if lora in lora_info:
-                    lora_key = f'lora_{i}'
-                    lora_loader[lora_key] = {
-                        'on': True,
-                        'lora': lora,
-                        'strength': float(lora_info[lora].get('weight', 1.0))
-                    }
-            logger.debug(f"Updated LoRAs in workflow: {len(loras)} LoRAs configured")
-
-        # Update upscale factor
-        if '279' in workflow:
-            workflow['279']['inputs']['rescale_factor'] = upscale_factor
-            logger.debug(f"Updated upscale factor in workflow")
-
-        # Update seed
-        if '198:2' in workflow:
-            workflow['198:2']['inputs']['noise_seed'] = seed
-            logger.debug(f"Updated seed in workflow: {seed}")
-
-        # Validate the final workflow
-        if not isinstance(workflow, dict):
-            raise ValueError("Workflow must remain a dictionary after updates")
+# host:port of the ComfyUI backend the bot routed this request to
+comfyui_address = os.getenv('COMFYUI_BACKEND') or f"{server_address}:8188"
+# The bot only asks for the model cache to be cleared when the backend is short of memory
+clear_cache_first = os.getenv('COMFYUI_CLEAR_CACHE', 'true').lower() == 'true'
+
+# One keep-alive session for every ComfyUI and bot callback request this process makes
+http_session = PooledSession(
+    pool_size=HTTP_POOL_SIZE,
+    max_per_host=HTTP_POOL_PER_HOST,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=HTTP_READ_TIMEOUT
+)
 
-        logger.debug("Successfully updated workflow with all parameters")
-        return workflow
+# On the bot's host, callbacks go over the bot's UNIX domain socket; HTTP otherwise
+bot_ipc = (ipc.IpcClient(BOT_IPC_SOCKET, timeout=HTTP_READ_TIMEOUT)
+           if BOT_IPC_SOCKET and ipc.ipc_supported() and os.path.exists(BOT_IPC_SOCKET) else None)
 
-    except Exception as e:
-        logger.error(f"Error updating workflow: {str(e)}")
-        raise ValueError(f"Failed to update workflow: {str(e)}")
+def call_bot(kind, payload, post):
+    """
+    Delivers a callback over the bot's socket, or with post, an HTTP request, when there
+    is no socket or it fails. Returns the bot's (status code, text)
+    """
+    if bot_ipc is not None:
+        try:
+            return bot_ipc.call(kind, payload)
+        except OSError as e:
+            logger.warning(f"Callback socket failed, using HTTP: {str(e)}")
+    response = post()
+    return response.status_code, response.text
 
-def queue_prompt(workflow):
+def queue_prompt(workflow, prompt_client_id=None):
     """Queue a prompt for processing with enhanced validation and debugging"""
+    prompt_client_id = prompt_client_id or client_id
     try:
         # Validate workflow is a dictionary
         if not isinstance(workflow, dict):
@@ -131,7 +70,7 @@ def queue_prompt(workflow):
         # Create the request data
         request_data = {
             "prompt": workflow,
-            "client_id": client_id
+            "client_id": prompt_client_id
         }
         
         # Convert to JSON with minimal whitespace
@@ -139,46 +78,31 @@ def queue_prompt(workflow):
         
         # Log the request data for debugging
         logger.debug(f"Sending request to ComfyUI prompt endpoint")
-        logger.debug(f"Client ID: {client_id}")
+        logger.debug(f"Client ID: {prompt_client_id}")
         logger.debug(f"Request size: {len(json_str)} bytes")
 
         # Encode as UTF-8
         data = json_str.encode('utf-8')
         
-        # Create and configure the request
-        url = f"http://{server_address}:8188/prompt"
-        headers = {
-            'Content-Type': 'application/json',
-            'Content-Length': str(len(data))
-        }
-
+        url = f"http://{comfyui_address}/prompt"
         logger.debug(f"Sending request to URL: {url}")
-        logger.debug(f"Headers: {headers}")
-        
-        req = urllib.request.Request(
-            url,
-            data=data,
-            method="POST",
-            headers=headers
-        )
-        
+
         # Send the request with error handling
         try:
-            with urllib.request.urlopen(req, timeout=120) as response:
-                response_data = response.read().decode('utf-8')
-                result = json.loads(response_data)
-                if not isinstance(result, dict):
-                    raise ValueError("Expected dictionary response from ComfyUI")
-                logger.debug("Successfully queued prompt with ComfyUI")
-                return result
-        except urllib.error.HTTPError as e:
-            logger.error(f"HTTP Error: {e.code} - {e.reason}")
-            logger.error(f"Response body: {e.read().decode('utf-8')}")
-            raise
-        except urllib.error.URLError as e:
-            logger.error(f"URL Error: {str(e)}")
+            response = http_session.post(url, data=data, headers={'Content-Type': 'application/json'})
+            if response.status_code != 200:
+                logger.error(f"HTTP Error: {response.status_code} - {response.reason}")
+                logger.error(f"Response body: {response.text}")
+                response.raise_for_status()
+            result = response.json()
+            if not isinstance(result, dict):
+                raise ValueError("Expected dictionary response from ComfyUI")
+            logger.debug("Successfully queued prompt with ComfyUI")
+            return result
+        except requests.exceptions.ConnectionError as e:
+            logger.error(f"Connection Error: {str(e)}")
             raise
-            
+
     except json.JSONDecodeError as e:
         logger.error(f"JSON encoding/decoding error: {str(e)}")
         logger.error(f"Problem data: {str(request_data)[:200]}...")
@@ -187,22 +111,29 @@ def queue_prompt(workflow):
         logger.error(f"Error in queue_prompt: {str(e)}")
         raise
 
-def get_image(filename, subfolder, folder_type):
-    data = {"filename": filename, "subfolder": subfolder, "type": folder_type}
-    url_values = urllib.parse.urlencode(data)
-    url = f"http://{server_address}:8188/view?{url_values}"
+def download_image(image, directory=IMAGE_SPOOL_DIR):
+    """Streams an output image into a spool file chunk by chunk and returns its path"""
+    data = {"filename": image['filename'], "subfolder": image['subfolder'], "type": image['type']}
+    url = f"http://{comfyui_address}/view"
+    path = spool_file_path(directory, image['filename'])
     try:
-        with urllib.request.urlopen(url, timeout=120) as response:
-            return response.read(), filename
+        with http_session.get(url, params=data, stream=True) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(SPOOL_CHUNK_SIZE):
+                    f.write(chunk)
+        return path
     except Exception as e:
-        logger.error(f"Error in get_image: {str(e)}")
+        remove_spooled(path)
+        logger.error(f"Error in download_image: {str(e)}")
         raise
 
 def get_history(prompt_id):
-    url = f"http://{server_address}:8188/history/{prompt_id}"
+    url = f"http://{comfyui_address}/history/{prompt_id}"
     try:
-        with urllib.request.urlopen(url, timeout=120) as response:
-            return json.loads(response.read())
+        response = http_session.get(url)
+        response.raise_for_status()
+        return response.json()
     except Exception as e:
         logger.error(f"Error in get_history: {str(e)}")
         raise
@@ -212,52 +143,71 @@ def clear_cache(ws):
     ws.send(clear_message)
     logger.debug("Sent clear_cache message to ComfyUI")
 
-def send_progress_update(request_id, progress_data):
+def post_progress_updates(updates):
+    """Posts the progress updates of one or more requests to the bot in one request"""
+    bot_server = os.getenv('BOT_SERVER', BOT_SERVER)
+    payload = ipc.encode_progress(updates)
+    status, text = call_bot(ipc.PROGRESS, payload, lambda: http_session.post(
+        f"http://{bot_server}:8080/update_progress",
+        data=payload,
+        headers={'Content-Type': 'application/json'}
+    ))
+    if status != 200:
+        raise requests.exceptions.HTTPError(f"Progress update failed with status {status}: {text}")
+
+def send_preview_update(request_id, image):
+    """Posts a preview of the image being sampled to the bot; a lost preview isn't retried"""
     try:
         bot_server = os.getenv('BOT_SERVER', BOT_SERVER)
-        retries = 3
-        retry_delay = 1
-
-        data = {
-            'request_id': request_id,
-            'progress_data': progress_data
-        }
-
-        for attempt in range(retries):
-            try:
-                response = requests.post(
-                    f"http://{bot_server}:8080/update_progress",
-                    json=data,
-                    timeout=120
-                )
-                if response.status_code == 200:
-                    logger.debug(f"Progress update sent: {progress_data}")
-                    return
-                else:
-                    logger.warning(f"Progress update failed with status {response.status_code}: {response.text}")
-            except requests.exceptions.RequestException as e:
-                if attempt < retries - 1:
-                    logger.warning(f"Attempt {attempt + 1} failed, retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    logger.error(f"All retry attempts failed: {str(e)}")
+        status, text = call_bot(ipc.PREVIEW, ipc.encode_preview(request_id, image), lambda: http_session.post(
+            f"http://{bot_server}:8080/update_preview",
+            params={'request_id': request_id},
+            data=image,
+            headers={'Content-Type': 'application/octet-stream'}
+        ))
+        if status != 200:
+            logger.warning(f"Preview update failed with status {status}: {text}")
     except Exception as e:
-        logger.error(f"Error sending progress update: {str(e)}")
+        logger.warning(f"Error sending preview update: {str(e)}")
+
+# Progress and previews are posted from a background thread, so reading ComfyUI's
+# websocket never waits on the bot
+progress_emitter = ProgressEmitter(
+    post_progress_updates,
+    send_preview_update,
+    max_pending=PROGRESS_EMIT_QUEUE_SIZE,
+    batch_size=PROGRESS_EMIT_BATCH_SIZE
+)
 
-def get_images(ws, workflow, progress_callback):
+def send_progress_update(request_id, progress_data):
+    """Queues a progress update for the bot; returns at once"""
+    progress_emitter.progress(request_id, progress_data)
+
+def get_outputs(ws, workflow, progress_callback, prompt_client_id=None, preview_callback=None):
+    """
+    Runs a workflow and returns its output images, undownloaded, by node id. Previews
+    ComfyUI sends while sampling go to preview_callback, at most one per PREVIEW_INTERVAL.
+    """
     try:
-        prompt_response = queue_prompt(workflow)
+        prompt_response = queue_prompt(workflow, prompt_client_id)
         if 'prompt_id' not in prompt_response:
             raise ValueError("No prompt_id in response from queue_prompt")
             
         prompt_id = prompt_response['prompt_id']
-        output_images = {}
         last_milestone = 0
+        last_preview = float('-inf')
 
         while True:
             out = ws.recv()
-            if isinstance(out, str):
+            if isinstance(out, bytes):
+                # Decoding is skipped for frames that would be throttled anyway
+                if preview_callback and time.monotonic() - last_preview >= PREVIEW_INTERVAL:
+                    preview = decode_preview_frame(out)
+                    if preview and preview[2] in (None, prompt_id):
+                        last_preview = time.monotonic()
+                        preview_callback(preview[0])
+
+            elif isinstance(out, str):
                 try:
                     message = json.loads(out)
                 except json.JSONDecodeError as e:
@@ -307,18 +257,11 @@ def get_images(ws, workflow, progress_callback):
                     })
 
         history = get_history(prompt_id)[prompt_id]
-        for node_id, node_output in history['outputs'].items():
-            if 'images' in node_output:
-                images_output = []
-                for image in node_output['images']:
-                    image_data, filename = get_image(image['filename'], image['subfolder'], image['type'])
-                    images_output.append((image_data, filename))
-                output_images[node_id] = images_output
-
-        return output_images
+        return {node_id: node_output['images'] for node_id, node_output in history['outputs'].items()
+                if 'images' in node_output}
 
     except Exception as e:
-        logger.error(f"Error in get_images: {str(e)}")
+        logger.error(f"Error in get_outputs: {str(e)}")
         progress_callback({
             "status": "error",
             "message": str(e)
@@ -344,39 +287,17 @@ def calculate_upscaled_resolution(resolution, upscale_factor):
         logger.error(f"Error calculating upscaled resolution: {str(e)}")
         raise ValueError(f"Unable to calculate upscaled resolution: {str(e)}")
 
-def cleanup_workflow_file(workflow_filename):
-    """Delete a temporary workflow file after it's been used"""
-    try:
-        file_path = os.path.join('Main', 'DataSets', workflow_filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.debug(f"Successfully deleted workflow file: {workflow_filename}")
-            
-            # Also cleanup any temporary images if this is a redux workflow
-            if workflow_filename.startswith('redux_'):
-                temp_dir = os.path.join('Main', 'DataSets', 'temp')
-                if os.path.exists(temp_dir):
-                    for file in os.listdir(temp_dir):
-                        try:
-                            file_path = os.path.join(temp_dir, file)
-                            if os.path.isfile(file_path):
-                                os.remove(file_path)
-                                logger.debug(f"Deleted temporary file: {file}")
-                        except Exception as e:
-                            logger.error(f"Error deleting temporary file {file}: {str(e)}")
-    except Exception as e:
-        logger.error(f"Error deleting workflow file {workflow_filename}: {str(e)}")
-
 def send_final_image(request_id, user_id, channel_id, interaction_id, original_message_id, 
                     prompt, resolution, upscaled_resolution, loras, upscale_factor, 
-                    seed, image_data, filename, workflow_filename=None):
+                    seed, image_path):
+    """Hands the spooled image to the bot by path; the bot uploads it from disk"""
     try:
         bot_server = os.getenv('BOT_SERVER', BOT_SERVER)
         retries = 3
         retry_delay = 1  # seconds
 
-        files = {'image_data': (filename, image_data)}
         data = {
+            'image_path': os.path.abspath(image_path),
             'request_id': request_id,
             'user_id': user_id,
             'channel_id': channel_id,
@@ -385,27 +306,25 @@ def send_final_image(request_id, user_id, channel_id, interaction_id, original_m
             'prompt': prompt,
             'resolution': resolution,
             'upscaled_resolution': upscaled_resolution,
-            'loras': json.dumps(loras),
+            'loras': loras,
             'upscale_factor': upscale_factor,
             'seed': seed
         }
+        payload = ipc.encode_json(data)
+        data['loras'] = json.dumps(loras)
 
         for attempt in range(retries):
             try:
-                response = requests.post(
+                # Over HTTP: fields without a file name, still sent as multipart/form-data
+                status, text = call_bot(ipc.IMAGE, payload, lambda: http_session.post(
                     f"http://{bot_server}:8080/send_image",
-                    files=files,
-                    data=data,
-                    timeout=120
-                )
-                if response.status_code == 200:
+                    files={name: (None, str(value)) for name, value in data.items() if value is not None}
+                ))
+                if status == 200:
                     logger.info("Successfully sent final image")
-                    # Clean up workflow file after successful send
-                    if workflow_filename:
-                        cleanup_workflow_file(workflow_filename)
-                    return response
+                    return status
                 else:
-                    logger.warning(f"Failed to send image, status code: {response.status_code}")
+                    logger.warning(f"Failed to send image, status code: {status}")
             except requests.exceptions.RequestException as e:
                 if attempt < retries - 1:
                     logger.warning(f"Attempt {attempt + 1} failed, retrying in {retry_delay} seconds...")
@@ -418,228 +337,103 @@ def send_final_image(request_id, user_id, channel_id, interaction_id, original_m
         logger.error(f"Error sending final image: {str(e)}")
         raise
 
-if __name__ == "__main__":
-    ws = None  # Define ws at the module level
-    workflow_filename = None
-    temp_workflow = None  # Track temporary workflow file
-    
-    # Define retry-related constants at the module level
-    max_retries = 3
-    retry_delay = 2  # seconds
-    
-    try:
-        if len(sys.argv) < 7:
-            raise ValueError(f"Expected at least 7 arguments, but got {len(sys.argv) - 1}")
-
-        request_id = sys.argv[1]
-        user_id = sys.argv[2]
-        channel_id = sys.argv[3]
-        interaction_id = sys.argv[4]
-        original_message_id = sys.argv[5]
-        request_type = sys.argv[6]
-
-        # Create temp directory if needed
-        temp_dir = os.path.join('Main', 'DataSets', 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-
-        # Process based on request type
-        if request_type == 'standard':  # Standard /comfy command
-            full_prompt = sys.argv[7]
-            resolution = sys.argv[8]
-            loras = json.loads(sys.argv[9])
-            upscale_factor = int(sys.argv[10])
-            workflow_filename = sys.argv[11]
-            seed = sys.argv[12] if len(sys.argv) > 12 else None
-            
-            # Send initial status
-            send_progress_update(request_id, {
-                'status': 'starting',
-                'message': 'Starting Generation process...'
+def read_job(args):
+    """
+    The job to run: a JSON job spec on stdin when the only argument is '-' (how the bot
+    starts this script), otherwise the positional arguments with a workflow file
+    """
+    if args == ['-']:
+        return json.load(sys.stdin)
+    return parse_job_args(args)
+
+def connect_websocket(ws_client_id, progress_callback, max_retries=3, retry_delay=2):
+    """Connects to the ComfyUI websocket with exponential backoff between attempts"""
+    for attempt in range(max_retries):
+        try:
+            progress_callback({
+                'status': 'connecting',
+                'message': f'Connecting to ComfyUI (attempt {attempt + 1})...'
             })
-
-            workflow = open_workflow(workflow_filename)
-            
-            # Process seed
-            try:
-                seed = int(seed) if seed != "None" else generate_random_seed()
-                logger.debug(f"Using seed: {seed}")
-            except ValueError:
-                seed = generate_random_seed()
-
-            # Update workflow with parameters
-            workflow = update_workflow(
-                workflow,
-                full_prompt,
-                resolution,
-                loras,
-                upscale_factor,
-                seed
+            return websocket.create_connection(
+                f"ws://{comfyui_address}/ws?clientId={ws_client_id}",
+                timeout=120
             )
+        except Exception as e:
+            if attempt < max_retries - 1:
+                logger.warning(f"WebSocket connection attempt {attempt + 1} failed: {str(e)}")
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                logger.error(f"All WebSocket connection attempts failed: {str(e)}")
+                raise
 
-            # Save updated workflow back to the same file
-            save_json(workflow_filename, workflow)
-            logger.debug(f"Updated workflow file: {workflow_filename}")
-
-            upscaled_resolution = resolution
+def main(args):
+    ws = None
+    # Until the job is read, errors are reported for the request named on the command line
+    job = {'request_id': args[0]} if args and args != ['-'] else {}
+    image_path = None
 
-        elif request_type == 'redux':  # Redux command
-            if len(sys.argv) < 13:
-                raise ValueError("Not enough arguments for redux request")
-                
-            resolution = sys.argv[7]
-            strength1 = float(sys.argv[8])
-            strength2 = float(sys.argv[9])
-            workflow_filename = sys.argv[10]
-            image1_path = sys.argv[11]
-            image2_path = sys.argv[12]
-
-            workflow = open_workflow(workflow_filename)
-            comfy_image1_path = os.path.abspath(image1_path)
-            comfy_image2_path = os.path.abspath(image2_path)
-
-            comfy_image1_path = comfy_image1_path.replace('\\', '/')
-            comfy_image2_path = comfy_image2_path.replace('\\', '/')
-
-            if '40' in workflow:
-                workflow['40']['inputs']['image'] = comfy_image1_path
-            if '46' in workflow:
-                workflow['46']['inputs']['image'] = comfy_image2_path
-            if '53' in workflow:
-                workflow['53']['inputs']['conditioning_to_strength'] = strength1
-            if '44' in workflow:
-                workflow['44']['inputs']['conditioning_to_strength'] = strength2
-            if '49' in workflow:
-                workflow['49']['inputs']['ratio_selected'] = resolution
-
-            upscale_factor = 1
-            full_prompt = "Redux image generation"
-            loras = []
-            seed = None
-            upscaled_resolution = resolution
-
-        elif request_type == 'reduxprompt':  # ReduxPrompt command
-            if len(sys.argv) < 12:
-                raise ValueError("Not enough arguments for reduxprompt request")
-                
-            prompt = sys.argv[7]
-            resolution = sys.argv[8]
-            strength = sys.argv[9]
-            workflow_filename = sys.argv[10]
-            temp_image_path = sys.argv[11]
-
-            # Send initial status
-            send_progress_update(request_id, {
-                'status': 'starting',
-                'message': 'Loading workflow and preparing generation...'
-            })
+    def progress_callback(data):
+        send_progress_update(job.get('request_id'), data)
 
-            workflow = open_workflow(workflow_filename)
+    def preview_callback(image):
+        progress_emitter.preview(job.get('request_id'), image)
 
-            # Update the workflow with our parameters
-            try:
-                workflow = update_reduxprompt_workflow(
-                    workflow,
-                    temp_image_path,  # Pass the full path
-                    prompt,
-                    strength
-                )
-                # Save the modified workflow
-                save_json(workflow_filename, workflow)
-                logger.debug(f"Saved modified workflow to: {workflow_filename}")
-            except Exception as e:
-                logger.error(f"Error updating workflow: {str(e)}")
-                send_progress_update(request_id, {
-                    'status': 'error',
-                    'message': f"Error updating workflow: {str(e)}"
-                })
-                sys.exit(1)
-
-            upscale_factor = 1
-            full_prompt = prompt
-            loras = []
-            seed = None
-            upscaled_resolution = resolution
-
-        else:
-            raise ValueError(f"Invalid request type: {request_type}")
-
-        # Get server address and client ID
-        server_address = os.getenv('server_address', server_address)
-        client_id = str(uuid.uuid4())
+    try:
+        job = read_job(args)
+        request_id = job['request_id']
+        workflow, metadata = prepare_job(job, progress_callback)
 
         # Connect to WebSocket with retries
-        for attempt in range(max_retries):
-            try:
-                send_progress_update(request_id, {
-                    'status': 'connecting',
-                    'message': f'Connecting to ComfyUI (attempt {attempt + 1})...'
-                })
-                ws = websocket.create_connection(
-                    f"ws://{server_address}:8188/ws?clientId={client_id}",
-                    timeout=120
-                )
-                break
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    logger.warning(f"WebSocket connection attempt {attempt + 1} failed: {str(e)}")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    logger.error(f"All WebSocket connection attempts failed: {str(e)}")
-                    raise
+        ws = connect_websocket(client_id, progress_callback)
 
         try:
-            # Clear cache and prepare for generation
-            clear_cache(ws)
-            
-            send_progress_update(request_id, {
+            # Clear cache if needed and prepare for generation
+            if clear_cache_first:
+                clear_cache(ws)
+
+            progress_callback({
                 'status': 'loading_models',
                 'message': 'Loading models and preparing generation...'
             })
 
             # Generate images
-            images = get_images(ws, workflow, lambda data: send_progress_update(request_id, data))
-
-            # Process output images
-            final_image = None
-            for node_id, image_data_list in reversed(images.items()):
-                for image_data, filename in reversed(image_data_list):
-                    if not filename.startswith('ComfyUI_temp'):
-                        final_image = (image_data, filename)
-                        break
-                if final_image:
-                    break
+            outputs = get_outputs(ws, workflow, progress_callback,
+                                  preview_callback=preview_callback if PROGRESS_PREVIEWS else None)
+            final_image = select_final_image(outputs)
 
             if final_image:
-                image_data, filename = final_image
-                response = send_final_image(
+                filename = final_image['filename']
+                image_path = download_image(final_image)
+                # Let the last progress text land before the image replaces it
+                progress_emitter.flush(PROGRESS_EMIT_FLUSH_TIMEOUT)
+                send_final_image(
                     request_id=request_id,
-                    user_id=user_id,
-                    channel_id=channel_id,
-                    interaction_id=interaction_id,
-                    original_message_id=original_message_id,
-                    prompt=full_prompt,
-                    resolution=resolution,
-                    upscaled_resolution=upscaled_resolution,
-                    loras=loras,
-                    upscale_factor=upscale_factor,
-                    seed=seed,
-                    image_data=image_data,
-                    filename=filename,
-                    workflow_filename=workflow_filename
+                    user_id=job['user_id'],
+                    channel_id=job['channel_id'],
+                    interaction_id=job['interaction_id'],
+                    original_message_id=job['original_message_id'],
+                    prompt=metadata['prompt'],
+                    resolution=metadata['resolution'],
+                    upscaled_resolution=metadata['upscaled_resolution'],
+                    loras=metadata['loras'],
+                    upscale_factor=metadata['upscale_factor'],
+                    seed=metadata['seed'],
+                    image_path=image_path
                 )
-                
-                add_to_history(user_id, full_prompt, workflow, filename, resolution, loras, upscale_factor)
+
+                add_to_history(job['user_id'], metadata['prompt'], workflow, filename,
+                               metadata['resolution'], metadata['loras'], metadata['upscale_factor'])
             else:
                 logger.error("No final image found to send.")
-                send_progress_update(request_id, {
+                progress_callback({
                     'status': 'error',
                     'message': 'No final image generated'
                 })
 
         except Exception as e:
             logger.error(f"Error during image generation: {str(e)}", exc_info=True)
-            send_progress_update(request_id, {
+            progress_callback({
                 'status': 'error',
                 'message': f'Error during generation: {str(e)}'
             })
@@ -647,13 +441,13 @@ if __name__ == "__main__":
 
     except ValueError as ve:
         logger.error(f"Argument error: {str(ve)}")
-        send_progress_update(request_id, {
+        progress_callback({
             'status': 'error',
             'message': f'Configuration error: {str(ve)}'
         })
     except Exception as e:
         logger.error(f"An unexpected error occurred: {str(e)}", exc_info=True)
-        send_progress_update(request_id, {
+        progress_callback({
             'status': 'error',
             'message': f'Unexpected error: {str(e)}'
         })
@@ -666,25 +460,15 @@ if __name__ == "__main__":
             except Exception as e:
                 logger.error(f"Error closing WebSocket: {str(e)}")
 
-        # Clean up temporary files
-        try:
-            # Clean up redux images if present
-            if request_type == 'reduxprompt':
-                if 'temp_image_path' in locals() and os.path.exists(temp_image_path):
-                    try:
-                        os.remove(temp_image_path)
-                        logger.debug(f"Deleted temp file: {temp_image_path}")
-                    except Exception as e:
-                        logger.error(f"Error removing temp file {temp_image_path}: {str(e)}")
-
-            # Clean up workflow file
-            if 'workflow_filename' in locals() and workflow_filename:
-                workflow_path = os.path.join("Main", "DataSets", workflow_filename)
-                if os.path.exists(workflow_path):
-                    try:
-                        os.remove(workflow_path)
-                        logger.debug(f"Deleted temporary workflow file: {workflow_filename}")
-                    except Exception as e:
-                        logger.error(f"Error removing temporary workflow file: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error during cleanup: {str(e)}")
\ No newline at end of file
+        # The bot removes the image once it is uploaded; this covers failed hand-offs
+        if image_path:
+            remove_spooled(image_path)
+        cleanup_job_files(job)
+        # Deliver the final status, an error in particular, before the process exits
+        progress_emitter.close(PROGRESS_EMIT_FLUSH_TIMEOUT)
+        logger.debug(f"HTTP connections: {http_session.connection_stats()}")
+
+if __name__ == "__main__":
+    # Only when run as a script; importing this module leaves logging alone
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
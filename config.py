@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 import discord
 
@@ -19,6 +20,111 @@ fluxversion = os.getenv('fluxversion')
 # Workflow configurations
 PULIDWORKFLOW = os.getenv('PULIDWORKFLOW').strip('"') 
 
+# ComfyUI servers to balance generations across, as 'host[:port],host[:port]'
+# (port 8188 when omitted); defaults to server_address alone
+COMFYUI_BACKENDS = os.getenv('COMFYUI_BACKENDS', '').strip('"') or f"{server_address}:8188"
+BACKEND_HEALTH_INTERVAL = float(os.getenv('BACKEND_HEALTH_INTERVAL', '10'))
+BACKEND_FAILURE_THRESHOLD = int(os.getenv('BACKEND_FAILURE_THRESHOLD', '3'))
+BACKEND_RETRY_AFTER = float(os.getenv('BACKEND_RETRY_AFTER', '30'))
+# Requests are routed to backends that have their workflow and LoRAs loaded; each
+# backend is assumed to keep the models of its last BACKEND_WARM_WORKFLOWS workflows.
+# ComfyUI's model cache is only cleared before loading new models on a backend with
+# less than BACKEND_MIN_FREE_VRAM (a fraction) of its VRAM free
+BACKEND_WARM_WORKFLOWS = int(os.getenv('BACKEND_WARM_WORKFLOWS', '2'))
+BACKEND_MIN_FREE_VRAM = float(os.getenv('BACKEND_MIN_FREE_VRAM', '0.15'))
+
+# ComfyUI execution: 'subprocess' spawns comfygen.py per request, 'worker' runs
+# requests on long-lived in-process workers
+COMFY_EXECUTION_MODE = os.getenv('COMFY_EXECUTION_MODE', 'subprocess').strip('"').lower()
+COMFY_WORKER_COUNT = int(os.getenv('COMFY_WORKER_COUNT', '2'))
+# Worker mode only: standard requests differing only in prompt and seed that reach a
+# busy backend within COMFY_BATCH_WINDOW seconds are merged into one ComfyUI prompt of
+# up to COMFY_BATCH_MAX_SIZE requests (1 disables batching). A batch can't be larger
+# than the requests running at once on a backend, see SCHEDULER_MAX_CONCURRENT
+COMFY_BATCH_WINDOW = float(os.getenv('COMFY_BATCH_WINDOW', '0.25'))
+COMFY_BATCH_MAX_SIZE = int(os.getenv('COMFY_BATCH_MAX_SIZE', '4'))
+
+# Request scheduling: generations running at once per backend, and the relative cost of each
+# request type when sharing the queue fairly between guilds and users
+SCHEDULER_MAX_CONCURRENT = int(os.getenv('SCHEDULER_MAX_CONCURRENT', str(COMFY_WORKER_COUNT)))
+SCHEDULER_WEIGHTS = {
+    request_type.strip(): float(weight)
+    for request_type, weight in (
+        entry.split('=', 1) for entry in
+        os.getenv('SCHEDULER_WEIGHTS', 'standard=1,pulid=2,redux=2,reduxprompt=2').split(',') if '=' in entry
+    )
+}
+
+# Adaptive admission: keep generations in the bot's queue while a backend's own queue
+# is full, and lower its in-flight limit (at most SCHEDULER_MAX_CONCURRENT per
+# backend) when completions take longer than ADMISSION_LATENCY_TOLERANCE times the
+# best seen
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'true').lower() == 'true'
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv('ADMISSION_LATENCY_TOLERANCE', '2.0'))
+ADMISSION_PROBE_INTERVAL = float(os.getenv('ADMISSION_PROBE_INTERVAL', '1.0'))
+
+# Finished images are streamed from ComfyUI into files here and uploaded to Discord
+# from disk; comfygen.py hands the bot the file's path
+IMAGE_SPOOL_DIR = os.getenv('IMAGE_SPOOL_DIR', '').strip('"') or os.path.join(tempfile.gettempdir(), 'fluxbot_images')
+# Images uploaded to /send_image are streamed into memory up to UPLOAD_SPOOL_THRESHOLD
+# bytes and into a file in IMAGE_SPOOL_DIR beyond that; larger than UPLOAD_MAX_SIZE
+# bytes is refused
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', str(4 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(256 * 1024 * 1024)))
+
+# Progress messages are edited in the background, only with the newest text, and at
+# most PROGRESS_CHANNEL_EDITS times per PROGRESS_CHANNEL_WINDOW seconds per channel.
+# Together with PREVIEW_CHANNEL_EDITS this should stay within Discord's edit rate
+# limit of 5 edits per 5 seconds per channel
+PROGRESS_CHANNEL_EDITS = int(os.getenv('PROGRESS_CHANNEL_EDITS', '3'))
+PROGRESS_CHANNEL_WINDOW = float(os.getenv('PROGRESS_CHANNEL_WINDOW', '5.0'))
+
+# Display names and role colors of users are cached for DISCORD_USER_CACHE_TTL
+# seconds, for at most DISCORD_USER_CACHE_SIZE users, when delivering images
+DISCORD_USER_CACHE_TTL = float(os.getenv('DISCORD_USER_CACHE_TTL', '600'))
+DISCORD_USER_CACHE_SIZE = int(os.getenv('DISCORD_USER_CACHE_SIZE', '1024'))
+
+# Live previews: ComfyUI's previews of the image being sampled (it must be started with
+# a --preview-method) are shown in the progress message, at most one every
+# PREVIEW_INTERVAL seconds per request, scaled down to PREVIEW_MAX_SIZE pixels and
+# recompressed as JPEG at PREVIEW_QUALITY. Previews in a channel are limited to
+# PREVIEW_CHANNEL_EDITS edits per PREVIEW_CHANNEL_WINDOW seconds, on top of the
+# progress text edits
+PROGRESS_PREVIEWS = os.getenv('PROGRESS_PREVIEWS', 'false').lower() == 'true'
+PREVIEW_INTERVAL = float(os.getenv('PREVIEW_INTERVAL', '3.0'))
+PREVIEW_MAX_SIZE = int(os.getenv('PREVIEW_MAX_SIZE', '384'))
+PREVIEW_QUALITY = int(os.getenv('PREVIEW_QUALITY', '70'))
+PREVIEW_CHANNEL_EDITS = int(os.getenv('PREVIEW_CHANNEL_EDITS', '2'))
+PREVIEW_CHANNEL_WINDOW = float(os.getenv('PREVIEW_CHANNEL_WINDOW', '5.0'))
+
+# comfygen.py posts progress to the bot from a background thread: the newest update
+# of at most PROGRESS_EMIT_QUEUE_SIZE requests waits, up to PROGRESS_EMIT_BATCH_SIZE
+# requests' updates go in one post, and a finishing process waits at most
+# PROGRESS_EMIT_FLUSH_TIMEOUT seconds for the last ones to be delivered
+PROGRESS_EMIT_QUEUE_SIZE = int(os.getenv('PROGRESS_EMIT_QUEUE_SIZE', '64'))
+PROGRESS_EMIT_BATCH_SIZE = int(os.getenv('PROGRESS_EMIT_BATCH_SIZE', '16'))
+PROGRESS_EMIT_FLUSH_TIMEOUT = float(os.getenv('PROGRESS_EMIT_FLUSH_TIMEOUT', '10'))
+
+# comfygen.py processes on the bot's host call back over this UNIX domain socket
+# instead of HTTP on port 8080; empty to always use HTTP. Not available on Windows
+BOT_IPC_SOCKET = os.getenv(
+    'BOT_IPC_SOCKET', os.path.join(tempfile.gettempdir(), 'fluxbot_callbacks.sock') if os.name == 'posix' else ''
+).strip('"')
+
+# Callback clients, as comma-separated addresses or CIDR ranges: trusted networks
+# (such as remote ComfyUI workers) are never blocked or rate limited, blocked ones are
+# refused on top of the blocks recorded in security/BlockedSecurityIps.json
+TRUSTED_NETWORKS = [network.strip() for network in os.getenv('TRUSTED_NETWORKS', '').strip('"').split(',') if network.strip()]
+BLOCKED_NETWORKS = [network.strip() for network in os.getenv('BLOCKED_NETWORKS', '').strip('"').split(',') if network.strip()]
+# Blocks are appended to a log that is folded into the JSON file after this many
+BLOCK_LOG_COMPACT_AFTER = int(os.getenv('BLOCK_LOG_COMPACT_AFTER', '1000'))
+
+# Keep-alive HTTP pool used for ComfyUI and bot callback requests
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '100'))
+HTTP_POOL_PER_HOST = int(os.getenv('HTTP_POOL_PER_HOST', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '120'))
+
 # LMStudio Integration
 ENABLE_PROMPT_ENHANCEMENT = os.getenv('ENABLE_PROMPT_ENHANCEMENT', 'false').lower() == 'true'
 LMSTUDIO_HOST = os.getenv('LMSTUDIO_HOST', 'localhost')
@@ -29,6 +135,13 @@ XAI_MODEL = os.getenv('XAI_MODEL', 'grok-beta')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
 EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-ada-002')
+# Each AI provider keeps up to AI_HTTP_POOL_SIZE keep-alive connections. Setting
+# AI_MAX_CONCURRENT_REQUESTS caps its prompt enhancements in flight (others wait);
+# 0, the default, leaves them unlimited
+AI_HTTP_POOL_SIZE = int(os.getenv('AI_HTTP_POOL_SIZE', '10'))
+AI_MAX_CONCURRENT_REQUESTS = int(os.getenv('AI_MAX_CONCURRENT_REQUESTS', '0'))
+AI_HTTP_CONNECT_TIMEOUT = float(os.getenv('AI_HTTP_CONNECT_TIMEOUT', '10'))
+AI_HTTP_READ_TIMEOUT = float(os.getenv('AI_HTTP_READ_TIMEOUT', '120'))
 
 # Discord intents
 intents = discord.Intents.default()
@@ -44,6 +157,45 @@ __all__ = [
     'BOT_MANAGER_ROLE_ID',
     'fluxversion',
     'PULIDWORKFLOW',
+    'COMFYUI_BACKENDS',
+    'BACKEND_HEALTH_INTERVAL',
+    'BACKEND_FAILURE_THRESHOLD',
+    'BACKEND_RETRY_AFTER',
+    'BACKEND_WARM_WORKFLOWS',
+    'BACKEND_MIN_FREE_VRAM',
+    'COMFY_EXECUTION_MODE',
+    'COMFY_WORKER_COUNT',
+    'COMFY_BATCH_WINDOW',
+    'COMFY_BATCH_MAX_SIZE',
+    'SCHEDULER_MAX_CONCURRENT',
+    'SCHEDULER_WEIGHTS',
+    'ADMISSION_CONTROL',
+    'ADMISSION_LATENCY_TOLERANCE',
+    'ADMISSION_PROBE_INTERVAL',
+    'IMAGE_SPOOL_DIR',
+    'UPLOAD_SPOOL_THRESHOLD',
+    'UPLOAD_MAX_SIZE',
+    'PROGRESS_CHANNEL_EDITS',
+    'PROGRESS_CHANNEL_WINDOW',
+    'DISCORD_USER_CACHE_TTL',
+    'DISCORD_USER_CACHE_SIZE',
+    'PROGRESS_PREVIEWS',
+    'PREVIEW_INTERVAL',
+    'PREVIEW_MAX_SIZE',
+    'PREVIEW_QUALITY',
+    'PREVIEW_CHANNEL_EDITS',
+    'PREVIEW_CHANNEL_WINDOW',
+    'PROGRESS_EMIT_QUEUE_SIZE',
+    'PROGRESS_EMIT_BATCH_SIZE',
+    'PROGRESS_EMIT_FLUSH_TIMEOUT',
+    'BOT_IPC_SOCKET',
+    'TRUSTED_NETWORKS',
+    'BLOCKED_NETWORKS',
+    'BLOCK_LOG_COMPACT_AFTER',
+    'HTTP_POOL_SIZE',
+    'HTTP_POOL_PER_HOST',
+    'HTTP_CONNECT_TIMEOUT',
+    'HTTP_READ_TIMEOUT',
     'ENABLE_PROMPT_ENHANCEMENT',
     'LMSTUDIO_HOST',
     'LMSTUDIO_PORT',
@@ -53,5 +205,9 @@ __all__ = [
     'OPENAI_API_KEY',
     'OPENAI_MODEL',
     'EMBEDDING_MODEL',
+    'AI_HTTP_POOL_SIZE',
+    'AI_MAX_CONCURRENT_REQUESTS',
+    'AI_HTTP_CONNECT_TIMEOUT',
+    'AI_HTTP_READ_TIMEOUT',
     'intents'
 ]
\ No newline at end of file
@@ -0,0 +1,135 @@
+import ipaddress
+import socket
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+def parse_network(text: str) -> Optional[Tuple[int, int, int]]:
+    """
+    (bits, network, prefix length) of an address or CIDR range, the network as an
+    integer of `bits` bits; None if text isn't one. IPv4-mapped IPv6 addresses are
+    taken as the IPv4 addresses they carry.
+    """
+    text = text.strip()
+    if '/' not in text:
+        # Plain addresses, what clients send, without building ipaddress objects
+        try:
+            return 32, int.from_bytes(socket.inet_pton(socket.AF_INET, text), 'big'), 32
+        except OSError:
+            pass
+        if ':' in text:
+            try:
+                address = int.from_bytes(socket.inet_pton(socket.AF_INET6, text), 'big')
+            except (OSError, ValueError):
+                address = None
+            if address is not None:
+                if address >> 32 == 0xffff:
+                    return 32, address & 0xffffffff, 32
+                return 128, address, 128
+    try:
+        network = ipaddress.ip_network(text, strict=False)
+    except ValueError:
+        return None
+    if network.version == 6 and network.prefixlen >= 96 and network.network_address.ipv4_mapped:
+        return 32, int(network.network_address.ipv4_mapped), network.prefixlen - 96
+    return network.max_prefixlen, int(network.network_address), network.prefixlen
+
+class _Node:
+    __slots__ = ('prefix', 'length', 'value', 'children')
+
+    def __init__(self, prefix: int, length: int, value: Any = None):
+        self.prefix = prefix
+        self.length = length
+        self.value = value
+        self.children = [None, None]
+
+class IpMatcher:
+    """
+    Longest-prefix match of client IPs against addresses and CIDR ranges.
+
+    Each address family has a path-compressed binary radix trie of its ranges: a node
+    stands for a network and only branches where its networks differ, so a lookup
+    visits a node per stored range containing the address and is not a walk over
+    every bit. Single addresses, most entries, are kept in a dict per family and
+    found first, as nothing is more specific. Entries that aren't addresses (such
+    as 'localhost') match their exact text.
+    """
+
+    def __init__(self, networks: Iterable[str] = ()):
+        self.roots = {32: _Node(0, 0), 128: _Node(0, 0)}
+        self.hosts: Dict[int, Dict[int, Any]] = {32: {}, 128: {}}
+        self.names: Dict[str, Any] = {}
+        self.size = 0
+        for network in networks:
+            self.add(network)
+
+    def add(self, network: str, value: Any = None):
+        """Store network (an address, CIDR range or name) with value, itself by default"""
+        value = network if value is None else value
+        parsed = parse_network(network)
+        if parsed is None:
+            if network not in self.names:
+                self.size += 1
+            self.names[network] = value
+            return
+        bits, prefix, length = parsed
+        if length == bits:
+            if prefix not in self.hosts[bits]:
+                self.size += 1
+            self.hosts[bits][prefix] = value
+            return
+        node = self.roots[bits]
+        while True:
+            if node.length == length:
+                if node.value is None:
+                    self.size += 1
+                node.value = value
+                return
+            bit = (prefix >> (bits - node.length - 1)) & 1
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = _Node(prefix, length, value)
+                self.size += 1
+                return
+            # Leading bits the child's network and the new one share
+            common = min(child.length, length, bits - (child.prefix ^ prefix).bit_length())
+            if common == child.length:
+                node = child
+                continue
+            if common == length:
+                branch = _Node(prefix, length, value)
+            else:
+                shift = bits - common
+                branch = _Node((prefix >> shift) << shift, common)
+                branch.children[(prefix >> (shift - 1)) & 1] = _Node(prefix, length, value)
+            branch.children[(child.prefix >> (bits - common - 1)) & 1] = child
+            node.children[bit] = branch
+            self.size += 1
+            return
+
+    def match(self, ip: str) -> Any:
+        """Value of the most specific network containing ip, or None"""
+        parsed = parse_network(ip)
+        if parsed is None:
+            return self.names.get(ip)
+        bits, address, length = parsed
+        if length == bits:
+            found = self.hosts[bits].get(address)
+            if found is not None:
+                return found
+        node = self.roots[bits]
+        found = None
+        while node is not None and node.length <= length:
+            shift = bits - node.length
+            if (address >> shift) != (node.prefix >> shift):
+                break
+            if node.value is not None:
+                found = node.value
+            if node.length == bits:
+                break
+            node = node.children[(address >> (shift - 1)) & 1]
+        return found
+
+    def __contains__(self, ip: str) -> bool:
+        return self.match(ip) is not None
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+class RateLimiter:
+    """
+    Token bucket rate limit per key (client IP), constant time per request.
+
+    Each key may make `burst` requests at once and earns `rate` more per second, up to
+    `burst` again. Buckets live in LRU tables split into `shards` by key hash, at most
+    `max_keys` across all of them. When a table is full, buckets idle long enough to
+    be full again are dropped first, as a key without a bucket gets a full one anyway;
+    then the least recently seen key goes.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000, shards: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.shard_count = max(1, shards)
+        self.shard_size = max(1, max_keys // self.shard_count)
+        # Seconds an empty bucket takes to fill up
+        self.refill_time = self.burst / rate if rate > 0 else float('inf')
+        # key -> [tokens, time they were counted], least recently seen first
+        self.shards: List["OrderedDict[str, List[float]]"] = [OrderedDict() for _ in range(self.shard_count)]
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        """Take a token from the key's bucket; False if it has none left"""
+        now = time.monotonic() if now is None else now
+        shard = self.shards[hash(key) % self.shard_count] if self.shard_count > 1 else self.shards[0]
+
+        bucket = shard.get(key)
+        if bucket is None:
+            if len(shard) >= self.shard_size:
+                self._evict(shard, now)
+            shard[key] = [self.burst - 1.0, now]
+            return True
+
+        shard.move_to_end(key)
+        tokens = bucket[0] + (now - bucket[1]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def _evict(self, shard: "OrderedDict[str, List[float]]", now: float):
+        # Least recently seen first; full buckets go until one that isn't, then the oldest
+        while shard:
+            key = next(iter(shard))
+            tokens, counted = shard[key]
+            if tokens + (now - counted) * self.rate < self.burst:
+                break
+            del shard[key]
+        if len(shard) >= self.shard_size:
+            shard.popitem(last=False)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
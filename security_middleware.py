@@ -1,14 +1,16 @@
-from typing import Optional, Set, Dict, List
+from typing import Optional, Set, Dict
 import re
 import time
 import logging
 import ipaddress
-import json
 import os
 from datetime import datetime, timedelta
 from aiohttp import web
 from aiohttp.web import middleware
 from dataclasses import dataclass, field
+from rate_limiter import RateLimiter
+from ip_matcher import IpMatcher
+from block_log import BlockLog
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,70 +22,71 @@ class SecurityConfig:
     max_requests_per_minute: int = 10
     block_duration_minutes: int = 60
     allowed_methods: Set[str] = field(default_factory=lambda: {'POST'})
-    allowed_paths: Set[str] = field(default_factory=lambda: {'/update_progress', '/send_image', '/image_generated'})
+    allowed_paths: Set[str] = field(default_factory=lambda: {'/update_progress', '/update_preview', '/send_image', '/image_generated'})
     blocked_user_agents: Set[str] = field(default_factory=set)
+    # Rate limit state is kept for at most this many IPs, split into shards by IP hash
+    rate_limit_max_ips: int = 10000
+    rate_limit_shards: int = 1
+    # Addresses or CIDR ranges; trusted ones are never blocked or rate limited
+    trusted_networks: Set[str] = field(default_factory=lambda: {'127.0.0.1', 'localhost', '::1'})
+    blocked_networks: Set[str] = field(default_factory=set)
+    # Permanent blocks file, security/BlockedSecurityIps.json by default; its log of
+    # newer blocks is folded into it after this many
+    permanent_blocks_file: Optional[str] = None
+    block_log_compact_after: int = 1000
 
 class SecurityMiddleware:
     def __init__(self, config: SecurityConfig = SecurityConfig()):
         self.config = config
-        self.request_counts: Dict[str, List[float]] = {}
+        # Bursts of max_requests_per_minute, refilled at the same rate per minute
+        self.rate_limiter = RateLimiter(
+            config.max_requests_per_minute / 60,
+            config.max_requests_per_minute,
+            max_keys=config.rate_limit_max_ips,
+            shards=config.rate_limit_shards
+        )
         self.blocked_ips: Dict[str, float] = {}
         self.suspicious_attempts: Dict[str, int] = {}
-        self.trusted_ips = {'127.0.0.1', 'localhost', '::1'}
+        self.trusted_ips = IpMatcher(config.trusted_networks)
         
         # Create security directory if it doesn't exist
         self.security_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'security')
         os.makedirs(self.security_dir, exist_ok=True)
         
-        # Set path for blocked IPs file
-        self.permanent_blocks_file = os.path.join(self.security_dir, "BlockedSecurityIps.json")
+        # Set path for blocked IPs file; blocks added since it was written are in a log beside it
+        self.permanent_blocks_file = config.permanent_blocks_file or os.path.join(self.security_dir, "BlockedSecurityIps.json")
+        self.block_log = BlockLog(self.permanent_blocks_file, compact_after=config.block_log_compact_after)
         self.permanent_blocks: Dict[str, dict] = self.load_permanent_blocks()
+        # Persisted blocks and the configured blocked networks, matched by address
+        self.blocked_networks = IpMatcher(config.blocked_networks)
+        for ip in self.permanent_blocks:
+            self.blocked_networks.add(ip)
 
     def load_permanent_blocks(self) -> Dict[str, dict]:
-        """Load permanently blocked IPs from JSON file"""
-        try:
-            if os.path.exists(self.permanent_blocks_file):
-                with open(self.permanent_blocks_file, 'r') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            logger.error(f"Error loading permanent blocks: {e}")
-            return {}
+        """Load permanently blocked IPs from the JSON file and the log of blocks since"""
+        return self.block_log.load()
 
     def save_permanent_blocks(self):
-        """Save permanently blocked IPs to JSON file"""
-        try:
-            logger.warning(f"Attempting to save blocks to: {self.permanent_blocks_file}")
-            logger.warning(f"Current blocks to save: {self.permanent_blocks}")
-            
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(self.permanent_blocks_file), exist_ok=True)
-            
-            with open(self.permanent_blocks_file, 'w') as f:
-                json.dump(self.permanent_blocks, f, indent=2)
-            logger.warning("Successfully saved blocked IPs to file")
-        except Exception as e:
-            logger.error(f"Error saving permanent blocks: {str(e)}")
-            logger.error(f"Current directory: {os.getcwd()}")
-            logger.error(f"File path: {self.permanent_blocks_file}")
-            logger.error(f"Directory exists? {os.path.exists(os.path.dirname(self.permanent_blocks_file))}")
-            logger.error(f"Full exception: {repr(e)}")
+        """Rewrite the JSON file with every permanent block, in the background"""
+        self.block_log.compact()
+
+    def close(self, timeout: Optional[float] = None):
+        """Finish writing permanent blocks"""
+        self.block_log.close(timeout)
 
     def add_permanent_block(self, ip: str, reason: str):
-        """Add an IP to permanent block list"""
-        if not self.is_trusted_ip(ip):
-            logger.warning(f"Adding permanent block for IP {ip} with reason: {reason}")
-            current_time = datetime.now().isoformat()
-            self.permanent_blocks[ip] = {
-                'timestamp': current_time,
-                'reason': reason
-            }
-            logger.info(f"Added block for {ip} at {current_time}")
-            self.save_permanent_blocks()
-            logger.warning(f"IP {ip} permanently blocked: {reason}")
+        """Add an IP or network to permanent block list"""
+        if self.is_trusted_ip(ip) or self.is_permanently_blocked(ip):
+            return
+        self.block_log.add(ip, {
+            'timestamp': datetime.now().isoformat(),
+            'reason': reason
+        })
+        self.blocked_networks.add(ip)
+        logger.warning(f"IP {ip} permanently blocked: {reason}")
 
     def is_trusted_ip(self, ip: str) -> bool:
-        """Check if IP is in trusted list"""
+        """Check if IP is in a trusted network"""
         return ip in self.trusted_ips
 
     def is_bot_endpoint(self, request: web.Request) -> bool:
@@ -91,8 +94,8 @@ class SecurityMiddleware:
         return request.path in self.config.allowed_paths and request.method == 'POST'
 
     def is_permanently_blocked(self, ip: str) -> bool:
-        """Check if IP is permanently blocked"""
-        return ip in self.permanent_blocks
+        """Check if IP is in a permanently blocked network"""
+        return ip in self.blocked_networks
 
     def is_ip_blocked(self, ip: str) -> bool:
         """Check if an IP is currently blocked"""
@@ -128,18 +131,10 @@ class SecurityMiddleware:
         """Check if an IP has exceeded the rate limit"""
         if self.is_trusted_ip(ip):
             return False
-        current_time = time.time()
-        if ip not in self.request_counts:
-            self.request_counts[ip] = []
-        
-        self.request_counts[ip] = [t for t in self.request_counts[ip] 
-                                 if current_time - t < 60]
-        
-        if len(self.request_counts[ip]) >= self.config.max_requests_per_minute:
+        if not self.rate_limiter.allow(ip):
+            logger.warning(f"Rate limit exceeded for IP: {ip}")
             self.add_permanent_block(ip, "Rate limit exceeded")
             return True
-            
-        self.request_counts[ip].append(current_time)
         return False
 
     def is_suspicious_request(self, request: web.Request) -> bool:
@@ -168,10 +163,10 @@ class SecurityMiddleware:
     async def middleware(self, request: web.Request, handler) -> web.Response:
         """Main middleware handler"""
         client_ip = request.headers.get('X-Forwarded-For', request.remote)
-        logger.info(f"Processing request from IP: {client_ip}, Path: {request.path}")
+        logger.debug(f"Processing request from IP: {client_ip}, Path: {request.path}")
 
         # Check if IP is permanently blocked
-        if client_ip in self.permanent_blocks:
+        if self.is_permanently_blocked(client_ip) and not self.is_trusted_ip(client_ip):
             logger.warning(f"Blocked request from permanently blocked IP: {client_ip}")
             return web.Response(
                 status=403,
@@ -200,27 +195,12 @@ class SecurityMiddleware:
             )
 
         # Check rate limiting
-        current_time = time.time()
-        if not self.is_trusted_ip(client_ip):
-            if client_ip not in self.request_counts:
-                self.request_counts[client_ip] = []
-            
-            # Clean old requests
-            self.request_counts[client_ip] = [t for t in self.request_counts[client_ip] 
-                                            if current_time - t < 60]
-            
-            # Check rate limit
-            if len(self.request_counts[client_ip]) >= self.config.max_requests_per_minute:
-                logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-                self.add_permanent_block(client_ip, "Rate limit exceeded")
-                return web.Response(
-                    status=429,
-                    text="Too Many Requests: Rate limit exceeded. Your IP has been blocked due to excessive requests.",
-                    content_type='text/plain'
-                )
-            
-            # Add current request
-            self.request_counts[client_ip].append(current_time)
+        if self.is_rate_limited(client_ip):
+            return web.Response(
+                status=429,
+                text="Too Many Requests: Rate limit exceeded. Your IP has been blocked due to excessive requests.",
+                content_type='text/plain'
+            )
 
         try:
             response = await handler(request)
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config.py reads these at import time; placeholders so the modules under test import
+for name, value in {
+    'DISCORD_TOKEN': 'test-token',
+    'CHANNEL_IDS': '1',
+    'ALLOWED_SERVERS': '1',
+    'BOT_MANAGER_ROLE_ID': '1',
+    'fluxversion': 'FluxDev24GB.json',
+    'PULIDWORKFLOW': 'PulidFluxDev.json',
+    'server_address': '127.0.0.1'
+}.items():
+    os.environ.setdefault(name, value)
+
+# Workflows and lora.json are looked up relative to the repository root
+os.chdir(ROOT)
+
+@pytest.fixture
+def history_db(tmp_path, monkeypatch):
+    """Main.database on an empty database in tmp_path"""
+    from Main import database
+
+    database.close_db()
+    database._workflow_templates.clear()
+    monkeypatch.setattr(database, 'DB_NAME', str(tmp_path / 'history.db'))
+    monkeypatch.setattr(database, 'BANNED_WORDS_FILE', str(tmp_path / 'banned.json'))
+    database.init_db()
+    yield database
+    database.close_db()
+    database._workflow_templates.clear()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from Main.comfy.batching import PromptBatcher, count_samplers, merge_workflows, split_outputs
+from Main.custom_commands.workflow_templates import WorkflowTemplate
+
+def flux_workflows(seeds, prompt='a red fox'):
+    with open(os.path.join('Main', 'Datasets', 'FluxDev24GB.json'), encoding='utf-8') as f:
+        template = WorkflowTemplate(json.load(f))
+    return [template.render(prompt, '1024x1024', [], 1, seed, {}) for seed in seeds]
+
+def fake_outputs(workflow):
+    """An image per save node, named after the node's id in the prompt that ran"""
+    return {node_id: [{'filename': f"{node_id}.png", 'type': 'output'}]
+            for node_id, node in workflow.items() if node['class_type'] == 'Image Save'}
+
+def test_merged_prompt_shares_loaders_and_branches_per_request():
+    workflows = flux_workflows([1, 2, 3])
+    merged, node_maps = merge_workflows(workflows)
+
+    # Loaders and everything fed only by them are kept once
+    for node_id in ('152', '153', '271', '288', '258', '198:1'):
+        assert all(node_map[node_id] == node_id for node_map in node_maps)
+    # The seed and everything downstream of it run once per request
+    for index, node_map in enumerate(node_maps):
+        assert node_map['198:2'] == f"batch{index}:198:2"
+        assert merged[node_map['198:2']]['inputs']['noise_seed'] == index + 1
+        assert merged[node_map['286']]['inputs']['images'] == [node_map['279'], 0]
+    assert count_samplers(merged) == 3
+    assert count_samplers(workflows[0]) == 1
+    # Every link points at a node of the merged prompt
+    for node in merged.values():
+        for value in node['inputs'].values():
+            if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str):
+                assert value[0] in merged
+
+def test_different_prompts_get_their_own_text_encoders():
+    first, = flux_workflows([1], prompt='a red fox')
+    second, = flux_workflows([1], prompt='a blue whale')
+    merged, node_maps = merge_workflows([first, second])
+    assert node_maps[0]['69'] != node_maps[1]['69']
+    assert merged[node_maps[1]['69']]['inputs']['prompt'] == 'a blue whale'
+
+def test_outputs_are_split_back_per_request():
+    workflows = flux_workflows([1, 2])
+    merged, node_maps = merge_workflows(workflows)
+    results = split_outputs(fake_outputs(merged), node_maps)
+
+    assert results == [
+        {'286': [{'filename': 'batch0:286.png', 'type': 'output'}]},
+        {'286': [{'filename': 'batch1:286.png', 'type': 'output'}]}
+    ]
+
+def test_only_one_shape_is_merged():
+    workflow, = flux_workflows([1])
+    other = dict(workflow)
+    del other['279']
+    with pytest.raises(ValueError):
+        merge_workflows([workflow, other])
+
+class FakeClient:
+    address = '127.0.0.1:8188'
+
+    def __init__(self, busy):
+        self.executions = {'running': None} if busy else {}
+        self.prompts = []
+
+    async def execute_prompt(self, workflow, progress_callback, preview_callback=None, sampler_runs=1):
+        self.prompts.append(workflow)
+        await progress_callback({'status': 'running'})
+        await asyncio.sleep(0)
+        return fake_outputs(workflow)
+
+def run_batch(busy, seeds, max_size=4):
+    async def main():
+        client = FakeClient(busy)
+        batcher = PromptBatcher(client, window=0.01, max_size=max_size)
+        progress = []
+
+        async def submit(workflow, index):
+            async def on_progress(data):
+                progress.append(index)
+            return await batcher.execute_prompt(workflow, on_progress, key='flux')
+
+        results = await asyncio.gather(*(submit(workflow, index)
+                                         for index, workflow in enumerate(flux_workflows(seeds))))
+        await batcher.close()
+        return client, results, progress
+
+    return asyncio.run(main())
+
+def test_busy_backend_gets_one_merged_prompt():
+    client, results, progress = run_batch(busy=True, seeds=[1, 2, 3])
+    assert len(client.prompts) == 1
+    assert [result['286'][0]['filename'] for result in results] == [
+        'batch0:286.png', 'batch1:286.png', 'batch2:286.png'
+    ]
+    assert sorted(progress) == [0, 1, 2]
+
+def test_batches_stop_at_max_size():
+    client, results, _ = run_batch(busy=True, seeds=[1, 2, 3, 4, 5], max_size=2)
+    assert len(client.prompts) == 3
+    assert len(results) == 5
+
+def test_close_cancels_waiting_prompts():
+    async def main():
+        batcher = PromptBatcher(FakeClient(busy=True), window=10)
+        waiting = asyncio.ensure_future(batcher.execute_prompt(flux_workflows([1])[0], None, key='flux'))
+        await asyncio.sleep(0)
+        await batcher.close()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+def flux_workflow(prompt, seed):
+    return {
+        '69': {'class_type': 'CR Prompt Text', 'inputs': {'prompt': prompt}},
+        '198:2': {'class_type': 'RandomNoise', 'inputs': {'noise_seed': seed}},
+        '258': {'class_type': 'CR Aspect Ratio', 'inputs': {'ratio_selected': '1024x1024'}},
+        '271': {'class_type': 'Power Lora Loader', 'inputs': {'lora_1': {'on': False}}}
+    }
+
+def test_images_from_the_same_prompt_are_all_kept(history_db):
+    for request_id in ('a', 'b', 'c'):
+        history_db.add_to_history('1', 'a red fox', None, f"generated_image_{request_id}.png",
+                                  '1024x1024', [], 1)
+    # The same image delivered twice is recorded once
+    history_db.add_to_history('1', 'a red fox', None, 'generated_image_a.png', '1024x1024', [], 1)
+
+    history = history_db.get_user_history('1', limit=10)
+    assert sorted(row[4] for row in history) == [
+        'generated_image_a.png', 'generated_image_b.png', 'generated_image_c.png'
+    ]
+
+def test_workflows_come_back_from_the_store(history_db):
+    workflows = {f"generated_image_{seed}.png": flux_workflow(f"prompt {seed}", seed) for seed in range(5)}
+    for filename, workflow in workflows.items():
+        history_db.add_to_history('1', workflow['69']['inputs']['prompt'], workflow, filename,
+                                  '1024x1024', [], 1)
+
+    for filename, workflow in workflows.items():
+        assert history_db.get_workflow(filename) == workflow
@@ -0,0 +1,85 @@
+import ipaddress
+import json
+import random
+
+from block_log import BlockLog
+from ip_matcher import IpMatcher, parse_network
+
+def test_most_specific_network_wins():
+    matcher = IpMatcher()
+    matcher.add('10.0.0.0/8', 'wide')
+    matcher.add('10.1.0.0/16', 'narrow')
+    matcher.add('10.1.2.3', 'host')
+    assert matcher.match('10.1.2.3') == 'host'
+    assert matcher.match('10.1.9.9') == 'narrow'
+    assert matcher.match('10.200.0.1') == 'wide'
+    assert matcher.match('11.0.0.1') is None
+    assert len(matcher) == 3
+
+def test_ipv6_and_mapped_ipv4():
+    matcher = IpMatcher(['2001:db8::/32', '192.168.0.0/16', 'localhost'])
+    assert '2001:db8:1::5' in matcher
+    assert '2001:db9::1' not in matcher
+    # An IPv4 client seen through a dual-stack socket
+    assert '::ffff:192.168.4.2' in matcher
+    assert 'localhost' in matcher
+    assert 'not an address' not in matcher
+    assert parse_network('::ffff:10.0.0.0/104') == (32, 0x0a000000, 8)
+
+def test_matches_a_scan_of_every_network():
+    rng = random.Random(11)
+    networks = {}
+    for index in range(300):
+        prefix = rng.choice([8, 12, 16, 20, 24, 28, 32])
+        address = ipaddress.IPv4Address(rng.getrandbits(8) << 24 | rng.getrandbits(24))
+        networks[str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))] = index
+    matcher = IpMatcher()
+    for network, value in networks.items():
+        matcher.add(network, value)
+
+    parsed = [(ipaddress.ip_network(network), value) for network, value in networks.items()]
+    for _ in range(3000):
+        # Mostly addresses inside a stored network, so the lookups have something to find
+        base = rng.choice(parsed)[0]
+        ip = base.network_address + rng.randrange(base.num_addresses) if rng.random() < 0.8 else \
+            ipaddress.IPv4Address(rng.getrandbits(32))
+        containing = [(network.prefixlen, value) for network, value in parsed if ip in network]
+        expected = max(containing)[1] if containing else None
+        assert matcher.match(str(ip)) == expected, ip
+
+def test_blocks_survive_a_restart(tmp_path):
+    snapshot = tmp_path / 'blocks.json'
+    log = BlockLog(str(snapshot), compact_after=1000)
+    log.load()
+    log.add('198.18.0.1', {'timestamp': 't1', 'reason': 'scan'})
+    log.add('198.18.0.2', {'timestamp': 't2', 'reason': 'scan'})
+    log.close(10)
+    # Appended to the log, the snapshot isn't rewritten per block
+    assert not snapshot.exists()
+
+    reloaded = BlockLog(str(snapshot)).load()
+    assert reloaded == {'198.18.0.1': {'timestamp': 't1', 'reason': 'scan'},
+                        '198.18.0.2': {'timestamp': 't2', 'reason': 'scan'}}
+
+def test_log_is_compacted_into_the_snapshot(tmp_path):
+    snapshot = tmp_path / 'blocks.json'
+    log = BlockLog(str(snapshot), compact_after=3)
+    log.load()
+    for index in range(5):
+        log.add(f"198.18.0.{index}", {'timestamp': str(index), 'reason': 'scan'})
+        log.flush(10)
+    log.close(10)
+
+    assert log.compactions >= 1
+    on_disk = json.loads(snapshot.read_text())
+    logged = [json.loads(line)['ip'] for line in open(log.log_file)]
+    assert set(on_disk) | set(logged) == {f"198.18.0.{index}" for index in range(5)}
+    assert len(BlockLog(str(snapshot)).load()) == 5
+
+def test_a_line_cut_short_is_skipped(tmp_path):
+    snapshot = tmp_path / 'blocks.json'
+    snapshot.write_text(json.dumps({'198.18.0.1': {'timestamp': 't1', 'reason': 'scan'}}))
+    (tmp_path / 'blocks.log').write_text(
+        json.dumps({'ip': '198.18.0.2', 'timestamp': 't2', 'reason': 'scan'}) + '\n{"ip": "198.18'
+    )
+    assert set(BlockLog(str(snapshot)).load()) == {'198.18.0.1', '198.18.0.2'}
@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+from Main.comfy.jobs import cleanup_job_files, parse_job_args, prepare_job, update_workflow
+from Main.custom_commands.workflow_utils import update_workflow as update_request_workflow
+
+def load_dataset(filename):
+    with open(os.path.join('Main', 'Datasets', filename), encoding='utf-8') as f:
+        return json.load(f)
+
+def standard_job(workflow, **overrides):
+    job = {
+        'request_id': 'request',
+        'user_id': '1',
+        'channel_id': '2',
+        'interaction_id': '3',
+        'original_message_id': '4',
+        'request_type': 'standard',
+        'prompt': 'a lighthouse on a cliff',
+        'resolution': '1024x1024',
+        'loras': [],
+        'upscale_factor': 1,
+        'seed': '42',
+        'workflow_filename': 'pulid_request.json',
+        'workflow': workflow
+    }
+    job.update(overrides)
+    return job
+
+@pytest.mark.parametrize('filename', ['PulidFluxDev.json', 'Pulid24GB.json', 'Pulid8GB.json'])
+def test_pulid_job_is_prepared(filename):
+    workflow = load_dataset(filename)
+    original = json.dumps(workflow, sort_keys=True)
+
+    prepared, metadata = prepare_job(standard_job(workflow), lambda update: None)
+
+    assert metadata['seed'] == 42
+    # Only the prompt slot exists in a PuLID graph; the rest of it is left as it was
+    assert prepared['69']['inputs']['prompt'] == 'a lighthouse on a cliff'
+    assert set(prepared) == set(workflow)
+    for node_id in workflow:
+        if node_id != '69':
+            assert prepared[node_id] == workflow[node_id]
+    assert json.dumps(workflow, sort_keys=True) == original
+
+def test_flux_job_patches_every_slot():
+    workflow = load_dataset('FluxDev24GB.json')
+    prepared = update_workflow(workflow, 'a red fox', '832x1216', [], 2, 7)
+
+    assert prepared['69']['inputs']['prompt'] == 'a red fox'
+    assert prepared['258']['inputs']['ratio_selected'] == '832x1216'
+    assert prepared['279']['inputs']['rescale_factor'] == 2
+    assert prepared['198:2']['inputs']['noise_seed'] == 7
+    # comfygen keeps the template's guidance
+    assert prepared['198:4'] is workflow['198:4']
+    assert workflow['69']['inputs']['prompt'] != 'a red fox'
+
+def test_request_workflow_still_requires_flux_nodes():
+    with pytest.raises(ValueError, match="Missing required nodes"):
+        update_request_workflow(load_dataset('PulidFluxDev.json'), 'a red fox', '1024x1024', [], 1, 7)
+
+STANDARD_ARGS = ['request', '1', '2', '3', '4', 'standard', 'a red fox', '1024x1024', '[]', '1', 'FluxDev24GB.json', '7']
+
+def test_argument_job_reads_is_pulid():
+    assert parse_job_args(STANDARD_ARGS)['is_pulid'] is False
+    assert parse_job_args(STANDARD_ARGS + ['true'])['is_pulid'] is True
+    assert parse_job_args(STANDARD_ARGS + ['false'])['is_pulid'] is False
+    with pytest.raises(ValueError):
+        parse_job_args(STANDARD_ARGS + ['maybe'])
+
+def test_cleanup_keeps_the_workflow_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    workflow_path = tmp_path / 'Main' / 'Datasets' / 'FluxDev24GB.json'
+    workflow_path.parent.mkdir(parents=True)
+    workflow_path.write_text('{}')
+    image_path = tmp_path / 'upload.png'
+    image_path.write_bytes(b'png')
+
+    cleanup_job_files(parse_job_args(STANDARD_ARGS))
+    cleanup_job_files({'request_type': 'reduxprompt', 'workflow_filename': 'FluxDev24GB.json',
+                       'image_path': str(image_path)})
+
+    assert workflow_path.exists()
+    assert not image_path.exists()
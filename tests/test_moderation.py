@@ -0,0 +1,45 @@
+import random
+import re
+
+from Main.moderation import AhoCorasick, BannedWordMatcher, normalize_text
+
+WORDS = ['child', 'kid', 'gore', 'blood bath', 'c++', 'Teen', 'kid', 'ab', 'abc', 'bca']
+
+def regex_first_word(words, prompt):
+    """The check check_banned made before the matcher: a \\b regex per word in list order"""
+    for word in words:
+        if re.search(r'\b' + re.escape(word.lower()) + r'\b', prompt.lower()):
+            return word
+    return None
+
+def substring_words(words, text):
+    """The check contains_banned_word made before the matcher"""
+    normalized_text = normalize_text(text)
+    return [word for word in words if normalize_text(word) in normalized_text]
+
+def random_prompts(count, seed=3):
+    rng = random.Random(seed)
+    pieces = WORDS + ['a', 'b', 'c', ' ', ',', '.', '!', '_', 'x', 'teen', 'KID', 'blood', 'bath', 'C.h.i.l.d']
+    for _ in range(count):
+        yield ''.join(rng.choice(pieces) + rng.choice(['', ' ', '-', '.']) for _ in range(rng.randrange(1, 12)))
+
+def test_first_word_matches_the_regex_check():
+    matcher = BannedWordMatcher(WORDS)
+    for prompt in random_prompts(3000):
+        assert matcher.first_word(prompt) == regex_first_word(WORDS, prompt), prompt
+
+def test_obfuscated_words_match_the_substring_check():
+    matcher = BannedWordMatcher(WORDS)
+    for prompt in random_prompts(3000, seed=5):
+        assert matcher.find_obfuscated(prompt) == substring_words(WORDS, prompt), prompt
+
+def test_whole_words_only():
+    matcher = BannedWordMatcher(['kid'])
+    assert matcher.first_word('a KID on a swing') == 'kid'
+    assert matcher.first_word('kidney beans') is None
+    assert matcher.find_obfuscated('k.i.d.n.e.y') == ['kid']
+
+def test_automaton_reports_overlapping_patterns():
+    automaton = AhoCorasick(['he', 'she', 'his', 'hers'])
+    found = sorted((start, automaton.patterns[pattern_id]) for start, pattern_id in automaton.search('ushers'))
+    assert found == [(1, 'she'), (2, 'he'), (2, 'hers')]
@@ -0,0 +1,28 @@
+from types import SimpleNamespace
+
+from Main.custom_commands.models import RequestItem
+from Main.custom_commands.permission_utils import BOT_MANAGER_ROLE, is_admin_or_bot_manager
+
+def member(administrator=False, role_ids=()):
+    return SimpleNamespace(
+        guild_permissions=SimpleNamespace(administrator=administrator),
+        roles=[SimpleNamespace(id=role_id) for role_id in role_ids]
+    )
+
+def test_administrators_and_bot_managers():
+    assert is_admin_or_bot_manager(member(administrator=True))
+    assert is_admin_or_bot_manager(member(role_ids=[5, BOT_MANAGER_ROLE]))
+    assert not is_admin_or_bot_manager(member(role_ids=[5]))
+
+def test_users_outside_a_guild_are_not_admins():
+    # A discord.User in direct messages has neither permissions nor roles
+    assert not is_admin_or_bot_manager(SimpleNamespace(id=1))
+
+def test_request_items_keep_the_admin_flag():
+    def request_item(**kwargs):
+        return RequestItem(id='1', user_id='2', channel_id='3', interaction_id='1', original_message_id='4',
+                           resolution='1024x1024', workflow_filename='flux3_request.json', prompt='a red fox',
+                           loras=[], upscale_factor=1, **kwargs)
+
+    assert request_item(is_admin=True).is_admin is True
+    assert request_item().is_admin is False
@@ -0,0 +1,50 @@
+from rate_limiter import RateLimiter
+
+def test_burst_then_refused():
+    limiter = RateLimiter(rate=1.0, burst=3)
+    assert [limiter.allow('1.2.3.4', now=0.0) for _ in range(4)] == [True, True, True, False]
+    # Other clients have their own buckets
+    assert limiter.allow('5.6.7.8', now=0.0)
+
+def test_bucket_refills_at_the_rate():
+    limiter = RateLimiter(rate=2.0, burst=2)
+    assert limiter.allow('ip', now=0.0) and limiter.allow('ip', now=0.0)
+    assert not limiter.allow('ip', now=0.1)
+    # Half a second earns one token
+    assert limiter.allow('ip', now=0.5)
+    assert not limiter.allow('ip', now=0.5)
+
+def test_refill_is_capped_at_the_burst():
+    limiter = RateLimiter(rate=10.0, burst=2)
+    limiter.allow('ip', now=0.0)
+    # Idle for a minute: still only `burst` requests at once
+    assert [limiter.allow('ip', now=60.0) for _ in range(3)] == [True, True, False]
+
+def test_refused_requests_dont_cost_tokens():
+    limiter = RateLimiter(rate=1.0, burst=1)
+    assert limiter.allow('ip', now=0.0)
+    assert not limiter.allow('ip', now=0.5)
+    assert limiter.allow('ip', now=1.0)
+
+def test_table_is_bounded_and_keeps_busy_keys():
+    limiter = RateLimiter(rate=1.0, burst=2, max_keys=3)
+    limiter.allow('busy', now=0.0)
+    limiter.allow('busy', now=0.0)
+    for index in range(10):
+        limiter.allow(f"scanner{index}", now=0.1)
+    assert len(limiter) <= 3
+    # Idle full buckets went first, so the empty one is still remembered
+    limiter = RateLimiter(rate=1.0, burst=2, max_keys=2)
+    limiter.allow('idle', now=0.0)
+    limiter.allow('busy', now=5.0)
+    limiter.allow('busy', now=5.0)
+    limiter.allow('new', now=5.0)
+    assert not limiter.allow('busy', now=5.0)
+    assert len(limiter) == 2
+
+def test_sharded_limits_hold_per_key():
+    limiter = RateLimiter(rate=1.0, burst=2, max_keys=100, shards=4)
+    for index in range(20):
+        key = f"10.0.0.{index}"
+        assert limiter.allow(key, now=0.0) and limiter.allow(key, now=0.0)
+        assert not limiter.allow(key, now=0.0)
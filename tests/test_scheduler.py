@@ -0,0 +1,145 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from Main.scheduler import PRIORITY_ADMIN, PRIORITY_NORMAL, FairScheduler, SurplusRoundRobin
+
+def drain(queue):
+    items = []
+    while queue:
+        items.append(queue.pop()[0])
+    return items
+
+def test_users_take_turns():
+    queue = SurplusRoundRobin()
+    for index in range(4):
+        queue.push(('alice',), f"a{index}", 1.0)
+    for index in range(2):
+        queue.push(('bob',), f"b{index}", 1.0)
+
+    assert drain(queue) == ['a0', 'b0', 'a1', 'b1', 'a2', 'a3']
+
+def test_heavy_requests_carry_their_cost_into_later_turns():
+    queue = SurplusRoundRobin()
+    for index in range(3):
+        queue.push(('alice',), f"heavy{index}", 2.0)
+    for index in range(6):
+        queue.push(('bob',), f"light{index}", 1.0)
+
+    order = drain(queue)
+    # Bob gets two light requests for each of Alice's heavy ones
+    assert order[:6] == ['heavy0', 'light0', 'light1', 'heavy1', 'light2', 'light3']
+
+def test_guilds_share_before_their_users():
+    queue = SurplusRoundRobin()
+    for index in range(3):
+        queue.push(('guild1', 'alice'), f"a{index}", 1.0)
+        queue.push(('guild1', 'bob'), f"b{index}", 1.0)
+    queue.push(('guild2', 'carol'), 'c0', 1.0)
+
+    assert drain(queue)[:4] == ['a0', 'c0', 'b0', 'a1']
+
+def test_peek_matches_pop():
+    rng = random.Random(7)
+    queue = SurplusRoundRobin()
+    for step in range(2000):
+        if queue and rng.random() < 0.5:
+            expected = queue.peek()
+            assert queue.pop()[0] == expected
+        else:
+            path = (f"guild{rng.randrange(3)}", f"user{rng.randrange(4)}")
+            queue.push(path, step, rng.choice([0.5, 1.0, 2.0, 3.0]))
+
+class Gate:
+    """Admission that admits one request each time open() is called"""
+
+    def __init__(self):
+        self.slots = asyncio.Semaphore(0)
+        self.asked = []
+
+    async def acquire(self, item):
+        self.asked.append(item.id)
+        await self.slots.acquire()
+        return 'slot'
+
+    def open(self):
+        self.slots.release()
+
+    def release(self, slot, latency=None, success=True):
+        pass
+
+def request(request_id, user, admin=False):
+    return SimpleNamespace(id=request_id, user=user, admin=admin)
+
+def classify(item):
+    return (PRIORITY_ADMIN if item.admin else PRIORITY_NORMAL), 'guild', item.user, 'standard'
+
+def run_scheduler(scenario, position_handler=None):
+    async def main():
+        dispatched = []
+
+        async def dispatch(item, slot):
+            dispatched.append(item.id)
+            done = asyncio.get_running_loop().create_future()
+            done.set_result(True)
+            return done
+
+        gate = Gate()
+        scheduler = FairScheduler(classify, dispatch, gate, position_handler=position_handler)
+        scheduler.start()
+        try:
+            await scenario(scheduler, gate)
+        finally:
+            await scheduler.stop()
+        return dispatched, gate
+
+    return asyncio.run(main())
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_admin_requests_go_first():
+    async def scenario(scheduler, gate):
+        await scheduler.put(request('normal', 'alice'))
+        await scheduler.put(request('admin', 'bob', admin=True))
+        for _ in range(2):
+            gate.open()
+            await settle()
+
+    dispatched, _ = run_scheduler(scenario)
+    assert dispatched == ['admin', 'normal']
+
+def test_admin_request_overtakes_one_waiting_for_admission():
+    async def scenario(scheduler, gate):
+        await scheduler.put(request('normal', 'alice'))
+        await settle()
+        # The normal request is waiting for a slot when the admin's arrives
+        await scheduler.put(request('admin', 'bob', admin=True))
+        await settle()
+        assert scheduler.qsize() == 2
+        for _ in range(2):
+            gate.open()
+            await settle()
+
+    dispatched, gate = run_scheduler(scenario)
+    assert dispatched == ['admin', 'normal']
+    assert gate.asked[:2] == ['normal', 'admin']
+
+def test_positions_are_reported_once_per_change():
+    reports = []
+
+    async def on_position(item, position, queue_size):
+        reports.append((item.id, position, queue_size))
+
+    async def scenario(scheduler, gate):
+        for index in range(3):
+            await scheduler.put(request(f"r{index}", f"user{index}"))
+        await settle()
+        gate.open()
+        await settle()
+
+    dispatched, _ = run_scheduler(scenario, on_position)
+    assert dispatched == ['r0']
+    # The three puts share one report; after the dispatch the others move up
+    assert reports == [('r0', 1, 3), ('r1', 2, 3), ('r2', 3, 3), ('r1', 1, 2), ('r2', 2, 2)]
@@ -0,0 +1,58 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+from Main.custom_commands import web_handlers
+from Main.custom_commands.models import RequestItem
+from Main.lora_catalog import LoraCatalog
+
+class FakeMessage:
+    id = 4
+
+    async def edit(self, **kwargs):
+        self.edited = kwargs
+
+class FakeResolver:
+    async def channel(self, channel_id):
+        return SimpleNamespace(get_partial_message=lambda message_id: FakeMessage())
+
+    async def author(self, channel, user_id):
+        return 'user', 0
+
+class FakeProgress:
+    async def finish(self, message_id):
+        pass
+
+def test_image_from_comfygen_records_the_request_workflow(monkeypatch):
+    recorded = []
+
+    async def run_db(func, *args):
+        recorded.append(args)
+
+    monkeypatch.setattr(web_handlers, 'run_db', run_db)
+    workflow = {'69': {'class_type': 'CR Prompt Text', 'inputs': {'prompt': 'a red fox'}}}
+    request_item = RequestItem(
+        id='3', user_id='1', channel_id='2', interaction_id='3', original_message_id='4',
+        resolution='1024x1024', workflow_filename='flux3_request.json', prompt='a red fox',
+        loras=[], upscale_factor=1, seed=7, workflow=workflow
+    )
+    bot = SimpleNamespace(
+        pending_requests={'request': request_item},
+        resolver=FakeResolver(),
+        progress=FakeProgress(),
+        previews=None,
+        lora_catalog=LoraCatalog([]),
+        add_view=lambda view, message_id=None: None
+    )
+    # What /send_image and the callback socket hand over: no workflow
+    request_data = {
+        'request_id': 'request', 'user_id': '1', 'channel_id': '2', 'interaction_id': '3',
+        'original_message_id': '4', 'prompt': 'a red fox', 'resolution': '1024x1024',
+        'upscaled_resolution': '1024x1024', 'loras': [], 'upscale_factor': 1, 'seed': 7,
+        'image_file': io.BytesIO(b'png')
+    }
+
+    asyncio.run(web_handlers.deliver_generated_image(bot, request_data))
+
+    assert recorded and recorded[0][2] is workflow
+    assert 'request' not in bot.pending_requests
@@ -0,0 +1,94 @@
+import copy
+import json
+import os
+import random
+
+from Main.custom_commands.workflow_templates import WorkflowTemplate
+from Main.workflow_store import apply_delta, diff_workflow, model_signature, normalize_workflow, workflow_shape
+
+def flux_template():
+    with open(os.path.join('Main', 'Datasets', 'FluxDev24GB.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+LORA_INFO = {f"lora{index}.safetensors": {'file': f"lora{index}.safetensors", 'weight': 0.8} for index in range(4)}
+
+def rendered_workflows(count, seed=1):
+    rng = random.Random(seed)
+    template = WorkflowTemplate(flux_template())
+    for _ in range(count):
+        loras = rng.sample(sorted(LORA_INFO), rng.randrange(0, 4))
+        yield template.render(f"prompt {rng.random()}", rng.choice(['1024x1024', '832x1216']), loras,
+                              rng.choice([1, 2, 4]), rng.getrandbits(32), LORA_INFO)
+
+def test_rendered_workflows_round_trip():
+    _, base = normalize_workflow(flux_template())
+    frozen = copy.deepcopy(base)
+    for workflow in rendered_workflows(50):
+        _, workflow = normalize_workflow(workflow)
+        assert workflow_shape(workflow) == workflow_shape(base)
+        delta = diff_workflow(base, workflow)
+        # The delta is stored as JSON
+        assert apply_delta(base, json.loads(json.dumps(delta))) == workflow
+        assert len(json.dumps(delta)) < len(json.dumps(workflow)) / 2
+    assert base == frozen
+
+def test_removed_inputs_and_replaced_nodes_round_trip():
+    template = {
+        '1': {'class_type': 'Power Lora Loader', 'inputs': {'lora_1': {'on': True}, 'lora_2': {'on': True}}},
+        '2': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': 'flux1-dev.safetensors'}},
+        '3': {'class_type': 'KSampler', 'inputs': {'seed': 1}, '_meta': {'title': 'Sampler'}}
+    }
+    workflow = {
+        '1': {'class_type': 'Power Lora Loader', 'inputs': {'lora_1': {'on': False}}},
+        '2': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': 'flux1-dev.safetensors'}},
+        '3': {'class_type': 'KSampler', 'inputs': {'seed': 1}, '_meta': {'title': 'Renamed'}}
+    }
+    delta = diff_workflow(template, workflow)
+
+    assert delta['1'] == {'inputs': {'lora_1': {'on': False}}, 'removed': ['lora_2']}
+    assert '2' not in delta
+    assert delta['3'] == {'node': workflow['3']}
+    assert apply_delta(template, delta) == workflow
+
+def test_normalize_hashes_content_not_key_order():
+    first = {'b': {'inputs': {'y': 1, 'x': 2}}, 'a': {'inputs': {}}}
+    second = {'a': {'inputs': {}}, 'b': {'inputs': {'x': 2, 'y': 1}}}
+    assert normalize_workflow(first)[0] == normalize_workflow(second)[0]
+    assert normalize_workflow(first)[0] != normalize_workflow({'a': {'inputs': {'z': 0}}})[0]
+
+def test_model_signature_skips_loras():
+    workflow = {
+        '1': {'class_type': 'UNETLoader', 'inputs': {'unet_name': 'flux1-dev.safetensors', 'weight_dtype': 'fp8'}},
+        '2': {'class_type': 'Power Lora Loader (rgthree)', 'inputs': {'lora_1': 'detail.safetensors'}},
+        '3': {'class_type': 'KSampler', 'inputs': {'sampler_name': 'euler'}}
+    }
+    assert model_signature(workflow) == 'flux1-dev.safetensors|fp8'
+
+def test_history_keeps_one_template_per_shape(history_db):
+    workflows = list(rendered_workflows(20, seed=2))
+    for index, workflow in enumerate(workflows):
+        history_db.add_to_history('1', f"prompt {index}", workflow, f"generated_image_{index}.png",
+                                  '1024x1024', [], 1)
+
+    with history_db._db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM workflow_templates").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM workflows").fetchone()[0] == 20
+    for index, workflow in enumerate(workflows):
+        assert history_db.get_workflow(f"generated_image_{index}.png") == normalize_workflow(workflow)[1]
+
+def test_compaction_moves_inline_workflows_into_the_store(history_db):
+    workflows = list(rendered_workflows(10, seed=3))
+    with history_db._db() as conn:
+        # Rows as they were written before the workflow store
+        for index, workflow in enumerate(workflows):
+            conn.execute("INSERT INTO image_history (user_id, prompt, workflow, image_filename) VALUES (?, ?, ?, ?)",
+                         ('1', f"prompt {index}", json.dumps(workflow), f"legacy_{index}.png"))
+        conn.commit()
+
+    stats = history_db.compact_workflow_history(batch_size=3)
+
+    assert stats['rows'] == 10
+    with history_db._db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM image_history WHERE workflow IS NOT NULL").fetchone()[0] == 0
+    for index, workflow in enumerate(workflows):
+        assert history_db.get_workflow(f"legacy_{index}.png") == normalize_workflow(workflow)[1]
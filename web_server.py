@@ -1,85 +1,131 @@
 from aiohttp import web
-from Main.custom_commands.web_handlers import handle_generated_image
+from Main.custom_commands.web_handlers import (
+    handle_generated_image, process_generated_image, update_preview, update_progress_message
+)
+import json
 import logging
-from Main.custom_commands.message_constants import STATUS_MESSAGES
-from config import server_address
-import discord
+from config import (
+    server_address, BOT_IPC_SOCKET, TRUSTED_NETWORKS, BLOCKED_NETWORKS, BLOCK_LOG_COMPACT_AFTER
+)
+from Main import ipc
 from security_middleware import SecurityMiddleware
 from app_config import SecurityConfig
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
+async def apply_progress(bot, request_id, progress_data) -> bool:
+    """Show a progress update of a pending request; False if the request is unknown"""
+    request_item = bot.pending_requests.get(request_id)
+    if request_item is None:
+        return False
+    # Edited in the background by the bot's ProgressDispatcher
+    await update_progress_message(bot, request_item, progress_data)
+    if progress_data.get('status') == 'error':
+        # Only remove on error
+        bot.pending_requests.pop(request_id, None)
+        if bot.previews:
+            await bot.previews.finish(request_id)
+    return True
+
 async def update_progress(request):
     try:
         data = await request.json()
+        bot = request.app['bot']
+
+        # comfygen.py posts {'updates': [...]}, the updates of several requests at once
+        if 'updates' in data:
+            for update in data['updates']:
+                if not await apply_progress(bot, update.get('request_id'), update.get('progress_data', {})):
+                    logger.debug(f"Progress for unknown request_id: {update.get('request_id')}")
+            return web.Response(text="Progress updated")
+
         request_id = data.get('request_id')
-        progress_data = data.get('progress_data', {})
-        
         if not request_id:
             return web.Response(text="Missing request_id", status=400)
-            
-        if request_id not in request.app['bot'].pending_requests:
+
+        if not await apply_progress(bot, request_id, data.get('progress_data', {})):
             return web.Response(text="Unknown request_id", status=404)
+        return web.Response(text="Progress updated")
             
-        request_item = request.app['bot'].pending_requests[request_id]
-        
+    except Exception as e:
+        logger.error(f"Error in update_progress: {str(e)}")
+        return web.Response(text="Internal server error", status=500)
+
+# Fields of an image handed over on the callback socket, as /send_image reads them
+IMAGE_FIELDS = (
+    'request_id', 'user_id', 'channel_id', 'interaction_id', 'original_message_id', 'prompt',
+    'resolution', 'upscaled_resolution', 'loras', 'upscale_factor', 'seed', 'image_path'
+)
+
+def ipc_handlers(bot):
+    """Callback socket counterparts of /update_progress, /update_preview and /send_image"""
+    async def progress(payload):
+        for update in json.loads(payload)['updates']:
+            if not await apply_progress(bot, update.get('request_id'), update.get('progress_data', {})):
+                logger.debug(f"Progress for unknown request_id: {update.get('request_id')}")
+        return 200, "Progress updated"
+
+    async def preview(payload):
+        request_id, image = ipc.decode_preview(payload)
+        if request_id not in bot.pending_requests:
+            return 404, "Unknown request_id"
+        if not bot.previews:
+            return 404, "Previews are disabled"
+        bot.previews.publish(request_id, bot.pending_requests[request_id].channel_id, image)
+        return 200, "Preview received"
+
+    async def image(payload):
+        data = json.loads(payload)
+        request_data = {field: data.get(field) for field in IMAGE_FIELDS}
+        request_data['loras'] = request_data['loras'] or []
         try:
-            channel = await request.app['bot'].fetch_channel(int(request_item.channel_id))
-            message = await channel.fetch_message(int(request_item.original_message_id))
-            
-            status = progress_data.get('status', '')
-            progress_message = progress_data.get('message', 'Processing...')
-            progress = progress_data.get('progress', 0)
+            request_data['upscale_factor'] = int(request_data['upscale_factor'])
+        except (ValueError, TypeError):
+            request_data['upscale_factor'] = 1
+        if request_data['seed'] is not None:
+            request_data['seed'] = str(request_data['seed'])
+        return await process_generated_image(bot, request_data)
 
-            status_info = STATUS_MESSAGES.get(status, {
-                'message': progress_message,
-                'emoji': '⚙️'
-            })
+    return {ipc.PROGRESS: progress, ipc.PREVIEW: preview, ipc.IMAGE: image}
 
-            if status == 'generating':
-                formatted_message = f"{status_info['emoji']} {status_info['message']} {progress}%"
-            elif status == 'error':
-                formatted_message = f"{status_info['emoji']} {status_info['message']} {progress_message}"
-                # Only remove on error
-                if request_id in request.app['bot'].pending_requests:
-                    del request.app['bot'].pending_requests[request_id]
-            else:
-                formatted_message = f"{status_info['emoji']} {status_info['message']}"
-            await message.edit(content=formatted_message)
-            logger.debug(f"Updated progress message: {formatted_message}")
-            return web.Response(text="Progress updated")
-            
-        except discord.errors.NotFound:
-            logger.warning(f"Message {request_item.original_message_id} not found")
-            return web.Response(text="Message not found", status=404)
-        except discord.errors.Forbidden:
-            logger.warning("Bot lacks permission to edit message")
-            return web.Response(text="Permission denied", status=403)
-        except Exception as e:
-            logger.error(f"Error updating progress message: {str(e)}")
-            return web.Response(text=f"Error: {str(e)}", status=500)
-            
+async def start_ipc_server(bot):
+    """
+    Serve callbacks from comfygen.py processes on this host over BOT_IPC_SOCKET, a
+    UNIX domain socket, next to the HTTP endpoints remote workers use. The bot passes
+    the socket to the processes it starts once it is listening.
+    """
+    if not BOT_IPC_SOCKET or not ipc.ipc_supported():
+        return None
+    try:
+        bot.ipc_server = await ipc.start_ipc_server(BOT_IPC_SOCKET, ipc_handlers(bot))
+        bot.ipc_socket = BOT_IPC_SOCKET
+        logger.info(f"Callback socket listening on {BOT_IPC_SOCKET}")
     except Exception as e:
-        logger.error(f"Error in update_progress: {str(e)}")
-        return web.Response(text="Internal server error", status=500)
+        logger.warning(f"Could not listen on {BOT_IPC_SOCKET}, callbacks will use HTTP: {str(e)}")
+    return bot.ipc_server
 
 async def start_web_server(bot):
     app = web.Application()
     
     # Configure security
     security_config = SecurityConfig()
-    security_config.allowed_paths = {'/update_progress', '/send_image', '/image_generated'}  # Add other allowed paths as needed
+    security_config.allowed_paths = {'/update_progress', '/update_preview', '/send_image', '/image_generated'}  # Add other allowed paths as needed
     security_config.allowed_methods = {'POST'}
     security_config.max_requests_per_minute = 10
+    security_config.trusted_networks |= set(TRUSTED_NETWORKS)
+    security_config.blocked_networks = set(BLOCKED_NETWORKS)
+    security_config.block_log_compact_after = BLOCK_LOG_COMPACT_AFTER
     
     # Add security middleware
     security = SecurityMiddleware(security_config)
     app.middlewares.append(security.middleware)
+    bot.security = security
     
     # Setup routes
     app.router.add_post('/send_image', handle_generated_image)
     app.router.add_post('/update_progress', update_progress)
+    app.router.add_post('/update_preview', update_preview)
     app.router.add_post('/image_generated', handle_generated_image)
     
     app['bot'] = bot
@@ -89,4 +135,5 @@ async def start_web_server(bot):
     site = web.TCPSite(runner, host="0.0.0.0", port=8080)
     await site.start()
     logger.info(f"Web server started on 0.0.0.0:8080 (ComfyUI server: {server_address})")
+    await start_ipc_server(bot)
     return app
\ No newline at end of file